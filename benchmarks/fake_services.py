@@ -0,0 +1,175 @@
+"""Local stand-ins for the Telegram Bot API and the Cloudinary upload/admin API.
+
+Both servers answer with the minimal JSON the app reads, after an optional
+artificial latency, and can inject errors at a configurable rate.
+"""
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qs
+
+
+class FaultProfile:
+    def __init__(self, latency_ms=0.0, jitter_ms=0.0, error_rate=0.0):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+
+    def delay(self):
+        latency = self.latency_ms + random.uniform(0, self.jitter_ms)
+        if latency > 0:
+            time.sleep(latency / 1000.0)
+
+    def should_fail(self):
+        return self.error_rate > 0 and random.random() < self.error_rate
+
+
+class _FakeHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def _read_body(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        return self.rfile.read(length) if length else b''
+
+    def _send_json(self, status, payload, headers=None):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class FakeTelegramHandler(_FakeHandler):
+    def do_POST(self):
+        self._read_body()
+        self._handle()
+
+    def do_GET(self):
+        self._handle()
+
+    def _handle(self):
+        server = self.server
+        server.count('requests')
+        server.faults.delay()
+        match = re.match(r'^/bot[^/]+/(\w+)', urlsplit(self.path).path)
+        method = match.group(1) if match else ''
+        if server.faults.should_fail():
+            server.count('errors')
+            # Alternate between flood control and server errors
+            if random.random() < 0.5:
+                self._send_json(429, {
+                    'ok': False, 'error_code': 429,
+                    'description': 'Too Many Requests: retry after 1',
+                    'parameters': {'retry_after': 1},
+                })
+            else:
+                self._send_json(502, {'ok': False, 'error_code': 502, 'description': 'Bad Gateway'})
+            return
+        if method == 'getUpdates':
+            result = []
+        elif method in ('setWebhook', 'deleteWebhook'):
+            result = True
+        elif method == 'getMe':
+            result = {'id': 1, 'is_bot': True, 'first_name': 'Bench', 'username': 'bench_bot'}
+        else:
+            server.count('messages')
+            result = {
+                'message_id': server.count('message_ids'),
+                'date': int(time.time()),
+                'chat': {'id': 1, 'type': 'private'},
+                'text': '',
+            }
+        self._send_json(200, {'ok': True, 'result': result})
+
+
+class FakeCloudinaryHandler(_FakeHandler):
+    def do_GET(self):
+        server = self.server
+        server.count('requests')
+        server.faults.delay()
+        if server.faults.should_fail():
+            server.count('errors')
+            self._send_json(500, {'error': {'message': 'Injected failure'}})
+            return
+        query = parse_qs(urlsplit(self.path).query)
+        max_results = int(query.get('max_results', ['10'])[0])
+        start = int(query.get('next_cursor', ['0'])[0])
+        end = min(start + max_results, len(server.resources))
+        payload = {'resources': server.resources[start:end]}
+        if end < len(server.resources):
+            payload['next_cursor'] = str(end)
+        self._send_json(200, payload)
+
+    def do_POST(self):
+        server = self.server
+        server.count('requests')
+        self._read_body()
+        server.faults.delay()
+        if server.faults.should_fail():
+            server.count('errors')
+            self._send_json(500, {'error': {'message': 'Injected failure'}})
+            return
+        upload_id = server.count('uploads')
+        public_id = f"portfolio/bench_{upload_id}"
+        self._send_json(200, {
+            'public_id': public_id,
+            'secure_url': f"https://res.cloudinary.test/image/upload/{public_id}.jpg",
+            'width': 800,
+            'height': 600,
+        })
+
+
+class FakeServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, handler, faults, port=0):
+        super().__init__(('127.0.0.1', port), handler)
+        self.faults = faults
+        self.counters = {}
+        self._counter_lock = threading.Lock()
+        self._thread = None
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+    def count(self, name):
+        with self._counter_lock:
+            self.counters[name] = self.counters.get(name, 0) + 1
+            return self.counters[name]
+
+    def start(self):
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+def fake_telegram(faults=None, port=0):
+    return FakeServer(FakeTelegramHandler, faults or FaultProfile(), port)
+
+
+def fake_cloudinary(faults=None, catalog_size=250, port=0):
+    server = FakeServer(FakeCloudinaryHandler, faults or FaultProfile(), port)
+    server.resources = [
+        {
+            'public_id': f"portfolio/image_{i:05d}",
+            'width': 1600,
+            'height': 1200,
+            'context': {'custom': {'title': f"Image {i}"}},
+        }
+        for i in range(catalog_size)
+    ]
+    return server
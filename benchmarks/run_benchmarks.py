@@ -0,0 +1,288 @@
+"""Offline load test for /api/images, /api/upload and /submit-order.
+
+Starts fake Telegram and Cloudinary servers, runs the app in a subprocess
+pointed at them, drives each scenario at a fixed concurrency and reports
+latency percentiles, throughput and the app's peak RSS. Results are
+compared with benchmarks/baseline.json; a regression beyond the tolerance
+exits non-zero so the script can gate CI.
+
+    python benchmarks/run_benchmarks.py                    # compare with baseline
+    python benchmarks/run_benchmarks.py --update-baseline  # record new baseline
+    python benchmarks/run_benchmarks.py --latency-ms 80 --error-rate 0.05
+"""
+import argparse
+import json
+import os
+import resource
+import shutil
+import signal
+import socket
+import struct
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from fake_services import FaultProfile, fake_cloudinary, fake_telegram
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(BENCH_DIR)
+BASELINE_PATH = os.path.join(BENCH_DIR, 'baseline.json')
+
+SCENARIOS = ('images', 'upload', 'order')
+# How long the order scenario waits for the outbox to deliver every message
+DELIVERY_TIMEOUT = 60.0
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def fake_jpeg(size):
+    """Random bytes behind a minimal JPEG header, enough to pass upload checks"""
+    frame = struct.pack('>BHHB', 8, 64, 64, 3) + b'\x01\x11\x00\x02\x11\x01\x03\x11\x01'
+    scan = b'\x03\x01\x00\x02\x11\x03\x11\x00\x3f\x00'
+    header = (
+        b'\xff\xd8'
+        + b'\xff\xc0' + struct.pack('>H', len(frame) + 2) + frame
+        + b'\xff\xda' + struct.pack('>H', len(scan) + 2) + scan
+    )
+    return header + os.urandom(max(0, size - len(header) - 2)) + b'\xff\xd9'
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, int(round(pct / 100.0 * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+
+def serve(port):
+    """Entry point of the app subprocess"""
+    from werkzeug.serving import make_server
+    from main import create_app
+
+    make_server('127.0.0.1', port, create_app(role='web'), threaded=True).serve_forever()
+
+
+def start_app(port, telegram_url, cloudinary_url, work_dir):
+    """Run the app in ``work_dir``, so its databases and job files stay out of the repo"""
+    env = dict(os.environ)
+    env.update({
+        'token': '123456:bench',
+        'CHAT_ID': '1',
+        'BOT_ROLE': 'web',
+        'SERVICE_LOCK_FILE': os.path.join(work_dir, 'services.lock'),
+        'TELEGRAM_API_URL': telegram_url,
+        'CLOUDINARY_UPLOAD_PREFIX': cloudinary_url,
+        'CLOUDINARY_CLOUD_NAME': 'bench',
+        'CLOUDINARY_API_KEY': 'bench',
+        'CLOUDINARY_API_SECRET': 'bench',
+        # Every order notification goes to one chat; lift the per-chat spacing
+        # so the order scenario measures the outbox, not Telegram's limit
+        'TELEGRAM_CHAT_INTERVAL': '0',
+        'TELEGRAM_GLOBAL_RATE': '10000',
+        'LOG_LEVEL': env.get('LOG_LEVEL', 'WARNING'),
+    })
+    process = subprocess.Popen(
+        [sys.executable, os.path.abspath(__file__), '--serve', str(port)],
+        cwd=work_dir, env=env,
+        # Own process group, so stopping it also stops its worker processes
+        start_new_session=True
+    )
+    base_url = f"http://127.0.0.1:{port}"
+    deadline = time.time() + 60
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"App exited during startup with code {process.returncode}")
+        try:
+            if requests.get(f"{base_url}/health", timeout=1).ok:
+                return process, base_url
+        except requests.RequestException:
+            pass
+        time.sleep(0.2)
+    process.kill()
+    raise RuntimeError("App did not become healthy within 60s")
+
+
+def stop_app(process):
+    """Stop the app and its child processes; returns the app's peak RSS in MB"""
+    _signal_group(process, signal.SIGTERM)
+    try:
+        process.wait(timeout=10)
+    except subprocess.TimeoutExpired:
+        pass
+    # Pool workers outlive a terminated parent and keep its stdout open
+    _signal_group(process, signal.SIGKILL)
+    process.wait()
+    peak = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+def _signal_group(process, sig):
+    try:
+        os.killpg(process.pid, sig)
+    except ProcessLookupError:
+        pass
+
+
+def wait_for_messages(telegram, expected, timeout=DELIVERY_TIMEOUT):
+    """Wait until the fake Telegram server has received ``expected`` messages; returns the count"""
+    deadline = time.monotonic() + timeout
+    while telegram.counters.get('messages', 0) < expected and time.monotonic() < deadline:
+        time.sleep(0.05)
+    return telegram.counters.get('messages', 0)
+
+
+def make_request(scenario, session, base_url, i, upload_body):
+    if scenario == 'images':
+        return session.get(f"{base_url}/api/images", params={'page': i % 5 + 1, 'per_page': 12})
+    if scenario == 'upload':
+        # A distinct body per request, so uploads aren't answered as duplicates
+        files = {'file': (f"bench_{i}.jpg", upload_body + struct.pack('>I', i), 'image/jpeg')}
+        return session.post(f"{base_url}/api/upload", files=files, data={'title': f"Bench {i}"})
+    return session.post(f"{base_url}/submit-order", data={
+        'name': 'Bench', 'email': 'bench@example.com',
+        'project_type': 'logo', 'description': f"Order {i}",
+    })
+
+
+def run_scenario(scenario, base_url, requests_count, concurrency, upload_body):
+    sessions = [requests.Session() for _ in range(concurrency)]
+    latencies = []
+    errors = 0
+
+    def worker(i):
+        started = time.perf_counter()
+        try:
+            ok = make_request(scenario, sessions[i % concurrency], base_url, i, upload_body).ok
+        except requests.RequestException:
+            ok = False
+        return time.perf_counter() - started, ok
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        for latency, ok in executor.map(worker, range(requests_count)):
+            latencies.append(latency)
+            errors += 0 if ok else 1
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        'requests': requests_count,
+        'errors': errors,
+        'throughput_rps': round(requests_count / elapsed, 2),
+        'p50_ms': round(percentile(latencies, 50) * 1000, 2),
+        'p95_ms': round(percentile(latencies, 95) * 1000, 2),
+        'p99_ms': round(percentile(latencies, 99) * 1000, 2),
+    }
+
+
+def compare(results, baseline, tolerance):
+    """Regression messages for results worse than baseline by more than ``tolerance``"""
+    failures = []
+    for name, result in results.items():
+        expected = baseline.get(name)
+        if not expected:
+            continue
+        for key in ('p50_ms', 'p95_ms', 'p99_ms', 'peak_rss_mb', 'delivery_s'):
+            if key in expected and result.get(key, 0) > expected[key] * (1 + tolerance):
+                failures.append(f"{name}.{key}: {result[key]} > baseline {expected[key]}")
+        if 'throughput_rps' in expected and result['throughput_rps'] < expected['throughput_rps'] * (1 - tolerance):
+            failures.append(f"{name}.throughput_rps: {result['throughput_rps']} < baseline {expected['throughput_rps']}")
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--serve', type=int, help=argparse.SUPPRESS)
+    parser.add_argument('--scenarios', default=','.join(SCENARIOS))
+    parser.add_argument('--requests', type=int, default=500, help='requests per scenario')
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--latency-ms', type=float, default=20.0, help='fake API latency')
+    parser.add_argument('--jitter-ms', type=float, default=10.0)
+    parser.add_argument('--error-rate', type=float, default=0.0, help='fraction of fake API calls that fail')
+    parser.add_argument('--catalog-size', type=int, default=250, help='images in the fake Cloudinary folder')
+    parser.add_argument('--upload-kb', type=int, default=256)
+    parser.add_argument('--tolerance', type=float, default=0.2, help='allowed regression, e.g. 0.2 = 20%%')
+    parser.add_argument('--baseline', default=BASELINE_PATH)
+    parser.add_argument('--update-baseline', action='store_true')
+    parser.add_argument('--output', help='also write results as JSON to this path')
+    args = parser.parse_args()
+
+    if args.serve:
+        sys.path.insert(0, ROOT_DIR)
+        serve(args.serve)
+        return 0
+
+    faults = FaultProfile(args.latency_ms, args.jitter_ms, args.error_rate)
+    telegram = fake_telegram(faults).start()
+    cloudinary = fake_cloudinary(faults, catalog_size=args.catalog_size).start()
+    work_dir = tempfile.mkdtemp(prefix='bench-app-')
+    process, base_url = start_app(_free_port(), telegram.url, cloudinary.url, work_dir)
+
+    upload_body = fake_jpeg(args.upload_kb * 1024)
+    results = {}
+    try:
+        for scenario in args.scenarios.split(','):
+            scenario = scenario.strip()
+            if scenario not in SCENARIOS:
+                parser.error(f"unknown scenario: {scenario}")
+            sent_before = telegram.counters.get('messages', 0)
+            started = time.perf_counter()
+            result = run_scenario(scenario, base_url, args.requests, args.concurrency, upload_body)
+            if scenario == 'order':
+                # Orders only enqueue a notification; count one as done once Telegram has it
+                expected = sent_before + args.requests - result['errors']
+                delivered = wait_for_messages(telegram, expected) - sent_before
+                result['delivered'] = delivered
+                result['delivery_s'] = round(time.perf_counter() - started, 2)
+                result['errors'] += max(0, args.requests - result['errors'] - delivered)
+            results[scenario] = result
+            print(f"{scenario:8} {json.dumps(results[scenario])}")
+    finally:
+        peak_rss = stop_app(process)
+        telegram.stop()
+        cloudinary.stop()
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    results['process'] = {'peak_rss_mb': round(peak_rss, 1)}
+    results['settings'] = {
+        key: getattr(args, key) for key in
+        ('requests', 'concurrency', 'latency_ms', 'jitter_ms', 'error_rate', 'catalog_size', 'upload_kb')
+    }
+    print(f"peak RSS {results['process']['peak_rss_mb']} MB, "
+          f"fake telegram calls {telegram.counters.get('requests', 0)}, "
+          f"fake cloudinary calls {cloudinary.counters.get('requests', 0)}")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+    if args.update_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"Baseline written to {args.baseline}")
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print("No baseline recorded yet; run with --update-baseline")
+        return 0
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    if baseline.get('settings') != results['settings']:
+        print(f"WARNING: baseline was recorded with different settings: {baseline.get('settings')}")
+    failures = compare(results, baseline, args.tolerance)
+    for failure in failures:
+        print(f"REGRESSION {failure}")
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
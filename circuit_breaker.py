@@ -0,0 +1,111 @@
+import threading
+import time
+from contextlib import contextmanager
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+
+class CircuitOpenError(Exception):
+    def __init__(self, name, retry_in):
+        super().__init__(f"{name} circuit is open; retry in {retry_in:.1f}s")
+        self.retry_in = retry_in
+
+
+class CircuitBreaker:
+    """Stops calling a failing dependency and fails fast until it recovers.
+
+    After ``failure_threshold`` consecutive failures the circuit opens and
+    every call raises CircuitOpenError at once. ``reset_timeout`` seconds
+    later it goes half-open and lets ``half_open_probes`` calls through at
+    a time: a success closes it again, a failure re-opens it. Exceptions
+    listed in ``ignore`` (e.g. "not found") don't count as failures.
+    """
+
+    def __init__(self, name, failure_threshold=5, reset_timeout=30.0, half_open_probes=1, ignore=()):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.half_open_probes = half_open_probes
+        self.ignore = tuple(ignore)
+        self.state = CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probes = 0
+        self._lock = threading.Lock()
+        self.times_opened = 0
+        self.rejected = 0
+        self.last_error = None
+
+    @property
+    def available(self):
+        """False when a call now would be rejected: open, or half-open with every probe out"""
+        with self._lock:
+            if self.state == OPEN:
+                return self._retry_in() <= 0
+            if self.state == HALF_OPEN:
+                return self._probes < self.half_open_probes
+            return True
+
+    def before_call(self):
+        with self._lock:
+            if self.state == OPEN:
+                retry_in = self._retry_in()
+                if retry_in > 0:
+                    self.rejected += 1
+                    raise CircuitOpenError(self.name, retry_in)
+                self.state = HALF_OPEN
+                self._probes = 0
+            if self.state == HALF_OPEN:
+                if self._probes >= self.half_open_probes:
+                    self.rejected += 1
+                    raise CircuitOpenError(self.name, 0)
+                self._probes += 1
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self.state = CLOSED
+
+    def record_failure(self, error):
+        with self._lock:
+            self._failures += 1
+            self.last_error = str(error)
+            if self.state == HALF_OPEN or self._failures >= self.failure_threshold:
+                if self.state != OPEN:
+                    self.times_opened += 1
+                self.state = OPEN
+                self._opened_at = time.monotonic()
+
+    @contextmanager
+    def guard(self):
+        """Run the block as one call through the breaker"""
+        self.before_call()
+        try:
+            yield
+        except self.ignore:
+            self.record_success()
+            raise
+        except Exception as e:
+            self.record_failure(e)
+            raise
+        else:
+            self.record_success()
+
+    def status(self):
+        with self._lock:
+            status = {
+                'name': self.name,
+                'state': self.state,
+                'consecutive_failures': self._failures,
+                'times_opened': self.times_opened,
+                'rejected': self.rejected,
+                'last_error': self.last_error,
+            }
+            if self.state == OPEN:
+                status['retry_in'] = round(max(0.0, self._retry_in()), 1)
+            return status
+
+    def _retry_in(self):
+        return self._opened_at + self.reset_timeout - time.monotonic()
@@ -1,83 +1,244 @@
 import os
+import time
+import hashlib
+import logging
 import cloudinary
 import cloudinary.uploader
 import cloudinary.api
-from cloudinary.utils import cloudinary_url
+import cloudinary.exceptions
+from metrics import instrument_backend, backend_errors
+from circuit_breaker import CircuitBreaker
+
+try:
+    from cloudinary.api_client import call_api as cloudinary_call_api
+except ImportError:  # older SDKs route Admin API calls through cloudinary.api
+    cloudinary_call_api = None
+
+logger = logging.getLogger(__name__)
+
+# Admin API caps max_results at 500 per resources() call
+MAX_RESULTS_PER_CALL = 500
+
+# Chunked uploads send at least 5MB per request (except the last chunk)
+MIN_CHUNK_SIZE = 5 * 1024 * 1024
+DEFAULT_CHUNK_SIZE = 6 * 1024 * 1024
+
+# Seconds each operation may take in total. Paged listings share one
+# budget. A chunked upload sends no chunk once its budget is spent, but the
+# chunk already in flight may still take up to the same number of seconds.
+DEFAULT_DEADLINES = {
+    'list': 10.0,
+    'upload': 60.0,
+    'delete': 10.0,
+}
+
+# Client errors mean Cloudinary is up, so they don't trip the breaker
+CLIENT_ERRORS = (
+    cloudinary.exceptions.NotFound,
+    cloudinary.exceptions.BadRequest,
+    cloudinary.exceptions.NotAllowed,
+    cloudinary.exceptions.AlreadyExists,
+)
+
+
+# Hex digits of the content hash used as public ID (80 bits)
+PUBLIC_ID_HASH_LENGTH = 20
+
+
+class DeadlineExceeded(Exception):
+    pass
+
+
+def stream_sha256(stream, chunk_size=1024 * 1024):
+    """Hash a seekable stream from its current position, then rewind to it"""
+    start = stream.tell()
+    sha = hashlib.sha256()
+    for chunk in iter(lambda: stream.read(chunk_size), b''):
+        sha.update(chunk)
+    stream.seek(start)
+    return sha.hexdigest()
+
+
+class _DeadlineReader:
+    """File wrapper that refuses to hand out another chunk after ``deadline``"""
+
+    def __init__(self, f, deadline):
+        self._f = f
+        self._deadline = deadline
+
+    def read(self, size=-1):
+        chunk = self._f.read(size)
+        # Reaching the end late is fine: everything has been sent
+        if chunk and time.monotonic() >= self._deadline:
+            raise DeadlineExceeded("Cloudinary upload ran out of time")
+        return chunk
+
+    def __getattr__(self, name):
+        return getattr(self._f, name)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        # The SDK closes what it uploads, but the caller owns the stream
+        # and may rewind it to try another backend
+        pass
+
 
 class CloudinaryManager:
-    def __init__(self):
+    def __init__(self, pool_manager=None, deadlines=None, breaker=None):
         # Configure Cloudinary
+        options = {}
+        if os.environ.get('CLOUDINARY_UPLOAD_PREFIX'):
+            # Alternate API host, e.g. the local fake used by the benchmarks
+            options['upload_prefix'] = os.environ['CLOUDINARY_UPLOAD_PREFIX']
         cloudinary.config(
             cloud_name=os.environ.get('CLOUDINARY_CLOUD_NAME'),
             api_key=os.environ.get('CLOUDINARY_API_KEY'),
-            api_secret=os.environ.get('CLOUDINARY_API_SECRET')
+            api_secret=os.environ.get('CLOUDINARY_API_SECRET'),
+            **options
         )
-        print("✅ Cloudinary configured successfully")
+        if pool_manager is not None:
+            self._use_pool_manager(pool_manager)
+        self.deadlines = dict(DEFAULT_DEADLINES, **(deadlines or {}))
+        # Fails calls fast while Cloudinary is down instead of waiting out timeouts
+        self.breaker = breaker or CircuitBreaker('cloudinary', ignore=CLIENT_ERRORS)
+        # Called after any change to the portfolio folder (upload/delete)
+        self.on_change = None
+        # Called with the public_id of each deleted image
+        self.on_delete = None
+        logger.info("Cloudinary configured")
     
-    def upload_image(self, file_content, filename, title):
-        """Upload image to Cloudinary"""
+    @instrument_backend('cloudinary')
+    def upload_stream(self, stream, filename, title, chunk_size=DEFAULT_CHUNK_SIZE, digest=None):
+        """Upload a seekable file object in chunks without reading it into memory.
+        
+        ``digest`` is the content's SHA-256; it is computed (one extra read)
+        when the caller doesn't have it.
+        """
         try:
-            # Upload with transformation and metadata
-            result = cloudinary.uploader.upload(
-                file_content,
-                public_id=f"portfolio/{filename.split('.')[0]}",
-                folder="portfolio",
-                resource_type="image",
-                context=f"title={title}",
-                transformation=[
-                    {"quality": "auto", "fetch_format": "auto"}
-                ]
-            )
-            
-            return {
-                'id': result['public_id'],
-                'url': result['secure_url'],
-                'title': title,
-                'width': result.get('width'),
-                'height': result.get('height')
-            }
+            digest = digest or stream_sha256(stream)
+            deadline = time.monotonic() + self.deadlines['upload']
+            with self.breaker.guard():
+                result = cloudinary.uploader.upload_large(
+                    _DeadlineReader(stream, deadline),
+                    chunk_size=max(chunk_size, MIN_CHUNK_SIZE),
+                    filename=filename,
+                    timeout=self.deadlines['upload'],
+                    **self._upload_options(digest, title)
+                )
+            self._notify_change()
+            return self._upload_result(result, title)
         except Exception as e:
-            print(f"Cloudinary upload error: {e}")
+            logger.error("Cloudinary upload error: %s", e)
+            backend_errors.inc(backend='cloudinary', operation='upload_stream')
             return None
     
+    def _upload_options(self, digest, title):
+        # Named by content: different files never overwrite each other, and
+        # the same bytes always map to the same asset
+        return {
+            'public_id': f"portfolio/{digest[:PUBLIC_ID_HASH_LENGTH]}",
+            'folder': "portfolio",
+            'resource_type': "image",
+            'context': f"title={title}",
+            'transformation': [
+                {"quality": "auto", "fetch_format": "auto"}
+            ]
+        }
+    
+    def _upload_result(self, result, title):
+        return {
+            'id': result['public_id'],
+            'url': result['secure_url'],
+            'title': title,
+            'width': result.get('width'),
+            'height': result.get('height')
+        }
+    
+    def iter_images(self, page_size=100):
+        """Yield images from the portfolio folder, following next_cursor"""
+        return map(self._to_image, self.iter_resources(page_size))
+    
+    def iter_resources(self, page_size=100):
+        """Yield the Admin API resources of the portfolio folder as listed,
+        with their stored size (``bytes``) and MD5 (``etag``)"""
+        deadline = time.monotonic() + self.deadlines['list']
+        cursor = None
+        while True:
+            resources, cursor = self._fetch_page(page_size, cursor, deadline)
+            yield from resources
+            if not cursor:
+                return
+    
+    @instrument_backend('cloudinary')
     def get_all_images(self):
         """Get all images from Cloudinary portfolio folder"""
         try:
-            # Get all images from portfolio folder
-            result = cloudinary.api.resources(
-                type="upload",
-                prefix="portfolio/",
-                max_results=100,
-                context=True
-            )
-            
-            images = []
-            for resource in result.get('resources', []):
-                # Get optimized URL with HTTPS
-                url = f"https://res.cloudinary.com/{os.environ.get('CLOUDINARY_CLOUD_NAME')}/image/upload/c_fill,h_600,q_auto,w_800/{resource['public_id']}.jpg"
-                
-                # Extract title from context or filename
-                title = resource.get('context', {}).get('custom', {}).get('title', 
-                       resource['public_id'].split('/')[-1].replace('_', ' ').title())
-                
-                images.append({
-                    'id': resource['public_id'],
-                    'src': url,
-                    'title': title,
-                    'width': resource.get('width'),
-                    'height': resource.get('height')
-                })
-            
-            return images
+            return list(self.iter_images())
         except Exception as e:
-            print(f"Cloudinary fetch error: {e}")
+            logger.error("Cloudinary fetch error: %s", e)
+            backend_errors.inc(backend='cloudinary', operation='get_all_images')
             return []
     
+    @instrument_backend('cloudinary', 'list_page')
+    def _fetch_page(self, max_results, cursor, deadline):
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise DeadlineExceeded("Cloudinary listing ran out of time")
+        options = {
+            'type': "upload",
+            'prefix': "portfolio/",
+            'max_results': min(max(max_results, 1), MAX_RESULTS_PER_CALL),
+            'context': True
+        }
+        if cursor:
+            options['next_cursor'] = cursor
+        with self.breaker.guard():
+            result = cloudinary.api.resources(timeout=remaining, **options)
+        return result.get('resources', []), result.get('next_cursor')
+    
+    def _to_image(self, resource):
+        # Get optimized URL with HTTPS
+        url = f"https://res.cloudinary.com/{os.environ.get('CLOUDINARY_CLOUD_NAME')}/image/upload/c_fill,h_600,q_auto,w_800/{resource['public_id']}.jpg"
+        
+        # Extract title from context or filename
+        title = resource.get('context', {}).get('custom', {}).get('title', 
+               resource['public_id'].split('/')[-1].replace('_', ' ').title())
+        
+        return {
+            'id': resource['public_id'],
+            'src': url,
+            'title': title,
+            'width': resource.get('width'),
+            'height': resource.get('height'),
+            'uploaded_at': resource.get('created_at')
+        }
+    
+    @instrument_backend('cloudinary')
     def delete_image(self, public_id):
         """Delete image from Cloudinary"""
         try:
-            result = cloudinary.uploader.destroy(public_id)
-            return result.get('result') == 'ok'
+            with self.breaker.guard():
+                result = cloudinary.uploader.destroy(public_id, timeout=self.deadlines['delete'])
+            deleted = result.get('result') == 'ok'
+            if deleted:
+                if self.on_delete:
+                    self.on_delete(public_id)
+                self._notify_change()
+            return deleted
         except Exception as e:
-            print(f"Cloudinary delete error: {e}")
-            return False
\ No newline at end of file
+            logger.error("Cloudinary delete error: %s", e)
+            backend_errors.inc(backend='cloudinary', operation='delete_image')
+            return False
+    
+    def _use_pool_manager(self, pool_manager):
+        # The SDK keeps a module-level urllib3 connector for each API; swap in
+        # the shared pool so uploads and Admin API calls reuse connections
+        for module in (cloudinary.uploader, cloudinary_call_api):
+            if module is not None and hasattr(module, '_http'):
+                module._http = pool_manager
+    
+    def _notify_change(self):
+        if self.on_change:
+            self.on_change()
@@ -0,0 +1,169 @@
+import json
+import logging
+import os
+import threading
+
+from googleapiclient.errors import HttpError
+
+logger = logging.getLogger(__name__)
+
+FILE_FIELDS = "id, name, mimeType, parents, trashed, createdTime, sha256Checksum"
+PAGE_SIZE = 1000
+
+
+class DriveMirror:
+    """Local copy of the image files in one Drive folder.
+
+    The first sync pages through ``files.list`` for the folder; later syncs
+    only read the ``changes.list`` feed from the stored start page token.
+    The file map and token are saved to ``path`` after every sync, so a
+    restart resumes from the last token instead of listing again.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.folder_id = None
+        self.start_page_token = None
+        self._files = {}
+        self._ordered = []
+        self._lock = threading.Lock()
+        self._sync_lock = threading.Lock()
+        self._load()
+
+    def __len__(self):
+        return len(self._ordered)
+
+    def images(self):
+        """Mirrored images in name order"""
+        return self._ordered
+
+    def sync(self, drive_service, folder_id):
+        """Bring the mirror up to date; returns False if another sync is running"""
+        if not self._sync_lock.acquire(blocking=False):
+            return False
+        try:
+            if folder_id != self.folder_id or self.start_page_token is None:
+                self._bootstrap(drive_service, folder_id)
+            else:
+                try:
+                    self._apply_changes(drive_service)
+                except HttpError as e:
+                    if e.resp.status not in (404, 410):
+                        raise
+                    # Start page token expired or unknown: list from scratch
+                    logger.warning("Drive changes token rejected (%s), re-listing folder", e.resp.status)
+                    self._bootstrap(drive_service, folder_id)
+            self._save()
+            return True
+        finally:
+            self._sync_lock.release()
+
+    def _bootstrap(self, drive_service, folder_id):
+        # Take the token first so changes made during the listing aren't missed
+        token = drive_service.changes().getStartPageToken().execute()['startPageToken']
+        files = {}
+        page_token = None
+        while True:
+            response = drive_service.files().list(
+                q=f"'{folder_id}' in parents and mimeType contains 'image/' and trashed = false",
+                fields=f"nextPageToken, files({FILE_FIELDS})",
+                pageSize=PAGE_SIZE,
+                pageToken=page_token
+            ).execute()
+            for file in response.get('files', []):
+                files[file['id']] = self._entry(file)
+            page_token = response.get('nextPageToken')
+            if not page_token:
+                break
+        logger.info("Mirrored %d Drive images from folder %s", len(files), folder_id)
+        with self._lock:
+            self.folder_id = folder_id
+            self.start_page_token = token
+            self._files = files
+            self._rebuild_order()
+
+    def _apply_changes(self, drive_service):
+        page_token = self.start_page_token
+        changed = 0
+        while True:
+            response = drive_service.changes().list(
+                pageToken=page_token,
+                spaces='drive',
+                fields=f"nextPageToken, newStartPageToken, changes(fileId, removed, file({FILE_FIELDS}))",
+                pageSize=PAGE_SIZE
+            ).execute()
+            with self._lock:
+                for change in response.get('changes', []):
+                    changed += self._apply_change(change)
+                if changed:
+                    self._rebuild_order()
+            if 'newStartPageToken' in response:
+                self.start_page_token = response['newStartPageToken']
+                break
+            page_token = response['nextPageToken']
+        if changed:
+            logger.info("Applied %d Drive changes", changed)
+
+    def _apply_change(self, change):
+        file_id = change['fileId']
+        file = change.get('file')
+        keep = (
+            not change.get('removed')
+            and file is not None
+            and not file.get('trashed')
+            and self.folder_id in file.get('parents', [])
+            and file.get('mimeType', '').startswith('image/')
+        )
+        if keep:
+            entry = self._entry(file)
+            if self._files.get(file_id) == entry:
+                return 0
+            self._files[file_id] = entry
+            return 1
+        return 1 if self._files.pop(file_id, None) is not None else 0
+
+    def _entry(self, file):
+        return {'name': file['name'], 'created': file.get('createdTime'), 'sha256': file.get('sha256Checksum')}
+
+    def _rebuild_order(self):
+        # Swap in a new list so readers never see a half-built order
+        self._ordered = [
+            {
+                'id': file_id,
+                'title': os.path.splitext(entry['name'])[0],
+                'src': f"https://drive.google.com/uc?id={file_id}",
+                'uploaded_at': entry['created'],
+                'sha256': entry.get('sha256')
+            }
+            for file_id, entry in sorted(self._files.items(), key=lambda item: item[1]['name'].lower())
+        ]
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path) as f:
+                state = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning("Ignoring unreadable Drive mirror %s: %s", self.path, e)
+            return
+        self.folder_id = state.get('folder_id')
+        self.start_page_token = state.get('start_page_token')
+        self._files = {
+            # Mirrors saved before upload times were tracked hold bare names
+            file_id: entry if isinstance(entry, dict) else {'name': entry, 'created': None}
+            for file_id, entry in state.get('files', {}).items()
+        }
+        self._rebuild_order()
+
+    def _save(self):
+        with self._lock:
+            state = {
+                'folder_id': self.folder_id,
+                'start_page_token': self.start_page_token,
+                'files': dict(self._files),
+            }
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(state, f)
+        os.replace(tmp_path, self.path)
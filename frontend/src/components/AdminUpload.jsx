@@ -1,5 +1,33 @@
 import { useState, useEffect } from 'react'
 
+const API_BASE = 'https://graphicdesign.onrender.com'
+const POLL_INTERVAL_MS = 1000
+// Give up waiting on a job after this many polls (5 minutes)
+const POLL_MAX_ATTEMPTS = 300
+
+const sleep = (ms) => new Promise((resolve) => setTimeout(resolve, ms))
+
+// The upload is stored by the server and sent on in the background: poll
+// its job until it is done or failed, or POLL_MAX_ATTEMPTS is reached
+async function waitForUploadJob(jobId, onProgress) {
+  for (let attempt = 0; attempt < POLL_MAX_ATTEMPTS; attempt++) {
+    const res = await fetch(`${API_BASE}/api/upload/${jobId}`)
+    const job = await res.json()
+    if (!res.ok) {
+      throw new Error(job.error || `Upload status failed with status: ${res.status}`)
+    }
+    if (job.status === 'done') {
+      return job
+    }
+    if (job.status === 'failed') {
+      throw new Error(job.error || 'Upload failed')
+    }
+    onProgress(job.progress)
+    await sleep(POLL_INTERVAL_MS)
+  }
+  throw new Error('Upload is taking too long - check the gallery later or try again')
+}
+
 export default function AdminUpload() {
   const [file, setFile] = useState(null)
   const [title, setTitle] = useState('')
@@ -7,6 +35,7 @@ export default function AdminUpload() {
   const [category, setCategory] = useState('')
   const [preview, setPreview] = useState('')
   const [uploading, setUploading] = useState(false)
+  const [progress, setProgress] = useState(null)
   const [success, setSuccess] = useState(false)
   const [error, setError] = useState('')
 
@@ -69,6 +98,7 @@ export default function AdminUpload() {
     if (!file || !title) return
 
     setUploading(true)
+    setProgress(null)
     setError('')
     setSuccess(false)
 
@@ -77,7 +107,7 @@ export default function AdminUpload() {
     formData.append('title', title)
 
     try {
-      const res = await fetch('https://graphicdesign.onrender.com/api/upload', {
+      const res = await fetch(`${API_BASE}/api/upload`, {
         method: 'POST',
         body: formData
       })
@@ -85,9 +115,11 @@ export default function AdminUpload() {
       const data = await res.json()
       
       if (!res.ok) {
-        throw new Error(data.message || `Upload failed with status: ${res.status}`)
+        throw new Error(data.error || data.message || `Upload failed with status: ${res.status}`)
       }
       
+      await waitForUploadJob(data.job_id, setProgress)
+      
       setSuccess(true)
       setFile(null)
       setTitle('')
@@ -102,6 +134,7 @@ export default function AdminUpload() {
       setError(err.message || 'An unexpected error occurred during upload')
     } finally {
       setUploading(false)
+      setProgress(null)
     }
   }
 
@@ -222,7 +255,7 @@ export default function AdminUpload() {
                   <circle className="opacity-25" cx="12" cy="12" r="10" stroke="currentColor" strokeWidth="4"></circle>
                   <path className="opacity-75" fill="currentColor" d="M4 12a8 8 0 018-8V0C5.373 0 0 5.373 0 12h4zm2 5.291A7.962 7.962 0 014 12H0c0 3.042 1.135 5.824 3 7.938l3-2.647z"></path>
                 </svg>
-                Uploading...
+                {progress ? `Uploading... ${Math.round(progress * 100)}%` : 'Uploading...'}
               </span>
             ) : (
               'Upload Project'
@@ -4,16 +4,18 @@ export default function Lightbox({ images, index, onClose, onPrev, onNext }) {
   const item = images[index]
   const next = images.length ? images[(index + 1) % images.length] : null
   const prev = images.length ? images[(index - 1 + images.length) % images.length] : null
+  // Local images come with a grid thumbnail in `src` and a larger rendition for viewing
+  const fullSrc = (image) => image.display || image.original || image.src
 
   // Prefetch adjacent images
   useEffect(() => {
     if (next) {
       const img = new Image()
-      img.src = next.src
+      img.src = fullSrc(next)
     }
     if (prev) {
       const img = new Image()
-      img.src = prev.src
+      img.src = fullSrc(prev)
     }
   }, [next, prev])
 
@@ -34,7 +36,7 @@ export default function Lightbox({ images, index, onClose, onPrev, onNext }) {
       <div className="lightbox-content">
         <button className="lightbox-close" onClick={onClose}>✕</button>
         <div className="lightbox-loading" />
-        <img className="lightbox-image" src={item.src} alt={item.title} />
+        <img className="lightbox-image" src={fullSrc(item)} alt={item.title} />
         <div className="lightbox-caption">{item.title}</div>
         <div className="lightbox-nav">
           <button className="lightbox-prev" onClick={(e) => { e.stopPropagation(); onPrev() }}>‹</button>
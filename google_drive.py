@@ -1,24 +1,110 @@
 import os
 import json
-from google.oauth2.credentials import Credentials
+import atexit
+import logging
+import threading
+import time
 from google_auth_oauthlib.flow import InstalledAppFlow
 from google.auth.transport.requests import Request
 from googleapiclient.discovery import build
-from googleapiclient.http import MediaFileUpload
+from google_auth_httplib2 import AuthorizedHttp
+import httplib2
 import pickle
+from metrics import instrument_backend, backend_errors
+from drive_mirror import DriveMirror
+
+logger = logging.getLogger(__name__)
 
 SCOPES = [
     'https://www.googleapis.com/auth/drive.file',
     'https://www.googleapis.com/auth/documents'
 ]
 
+# Metadata doc entries are appended in batches: wait this long for more
+# entries after the first, write at most DOC_BATCH_MAX per batchUpdate, and
+# give a batch up after DOC_MAX_ATTEMPTS failed writes
+DOC_BATCH_DELAY = 2.0
+DOC_BATCH_MAX = 50
+DOC_MAX_ATTEMPTS = 5
+
 class GoogleDriveManager:
-    def __init__(self):
-        self.drive_service = None
-        self.docs_service = None
+    """Drive/Docs storage backend.
+    
+    Nothing touches the network in the constructor: credentials and API
+    clients are created on first use, and the folder/document lookup runs
+    in ``initialize`` (call ``start`` to do it in the background). The IDs
+    found are saved to ``state_path`` so later starts skip the lookup.
+    """
+    
+    def __init__(self, timeout=None, mirror_path='drive_mirror.json', state_path='drive_state.json'):
+        # Socket timeout for Drive/Docs API calls (None = httplib2 default)
+        self.timeout = timeout
+        # Local copy of the folder listing, kept current from the changes feed
+        self.mirror = DriveMirror(mirror_path)
+        self.state_path = state_path
         self.folder_id = None
         self.doc_id = None
-        self.authenticate()
+        self._creds = None
+        # API clients of the calling thread (see _service)
+        self._services = threading.local()
+        self._service_lock = threading.Lock()
+        self._init_lock = threading.Lock()
+        self._initialized = False
+        self._doc_pending = []
+        self._doc_cond = threading.Condition()
+        self._doc_writer = None
+        self._load_state()
+    
+    def start(self):
+        """Run ``initialize`` in a background thread"""
+        def run():
+            try:
+                self.initialize()
+            except Exception:
+                logger.exception("Google Drive initialization failed")
+        
+        thread = threading.Thread(target=run, name='drive-init', daemon=True)
+        thread.start()
+        return thread
+    
+    def initialize(self):
+        """Find or create the folder and metadata doc unless their IDs are known"""
+        if self._initialized:
+            return
+        with self._init_lock:
+            if self._initialized:
+                return
+            if not self.folder_id:
+                self.ensure_portfolio_folder()
+            if not self.doc_id:
+                self.ensure_portfolio_document()
+            self._save_state()
+            # A failed doc lookup leaves doc_id unset and is retried next call
+            self._initialized = bool(self.folder_id and self.doc_id)
+    
+    @property
+    def drive_service(self):
+        return self._service('drive', 'v3')
+    
+    @property
+    def docs_service(self):
+        return self._service('docs', 'v1')
+    
+    def _service(self, name, version):
+        # httplib2.Http isn't thread-safe, so every thread builds its own
+        # clients, each on its own connection; only the credentials are shared
+        service = getattr(self._services, name, None)
+        if service is None:
+            with self._service_lock:
+                creds = self._credentials()
+            service = build(name, version, http=self._authorized_http(creds))
+            setattr(self._services, name, service)
+        return service
+    
+    def _credentials(self):
+        if self._creds is None:
+            self._creds = self.authenticate()
+        return self._creds
     
     def authenticate(self):
         creds = None
@@ -41,12 +127,30 @@ class GoogleDriveManager:
             with open('token.pickle', 'wb') as token:
                 pickle.dump(creds, token)
         
-        # Build services directly with credentials
-        self.drive_service = build('drive', 'v3', credentials=creds)
-        self.docs_service = build('docs', 'v1', credentials=creds)
-        self.ensure_portfolio_folder()
-        self.ensure_portfolio_document()
+        return creds
     
+    def _load_state(self):
+        if not os.path.exists(self.state_path):
+            return
+        try:
+            with open(self.state_path) as f:
+                state = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning("Ignoring unreadable Drive state %s: %s", self.state_path, e)
+            return
+        self.folder_id = state.get('folder_id')
+        self.doc_id = state.get('doc_id')
+    
+    def _save_state(self):
+        tmp_path = f"{self.state_path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump({'folder_id': self.folder_id, 'doc_id': self.doc_id}, f)
+        os.replace(tmp_path, self.state_path)
+    
+    def _authorized_http(self, creds):
+        return AuthorizedHttp(creds, http=httplib2.Http(timeout=self.timeout))
+    
+    @instrument_backend('drive')
     def ensure_portfolio_folder(self):
         # Check if portfolio folder exists
         results = self.drive_service.files().list(
@@ -67,9 +171,10 @@ class GoogleDriveManager:
             folder = self.drive_service.files().create(body=folder_metadata, fields='id').execute()
             self.folder_id = folder.get('id')
     
+    @instrument_backend('drive')
     def ensure_portfolio_document(self):
         try:
-            print("Checking for Portfolio Metadata document...")
+            logger.debug("Checking for Portfolio Metadata document")
             # Check if portfolio metadata document exists
             results = self.drive_service.files().list(
                 q="name='Portfolio Metadata' and mimeType='application/vnd.google-apps.document'",
@@ -80,9 +185,9 @@ class GoogleDriveManager:
             
             if docs:
                 self.doc_id = docs[0]['id']
-                print(f"Found existing document: {self.doc_id}")
+                logger.info("Found existing document: %s", self.doc_id)
             else:
-                print("Creating new Portfolio Metadata document...")
+                logger.info("Creating new Portfolio Metadata document")
                 # Create portfolio metadata document
                 doc_metadata = {
                     'name': 'Portfolio Metadata',
@@ -90,7 +195,7 @@ class GoogleDriveManager:
                 }
                 doc = self.drive_service.files().create(body=doc_metadata, fields='id').execute()
                 self.doc_id = doc.get('id')
-                print(f"Created document: {self.doc_id}")
+                logger.info("Created document: %s", self.doc_id)
                 
                 # Initialize document with header
                 requests = [{
@@ -103,15 +208,16 @@ class GoogleDriveManager:
                     documentId=self.doc_id,
                     body={'requests': requests}
                 ).execute()
-                print("Document initialized with header")
-        except Exception as e:
-            print(f"Error ensuring document: {e}")
-            import traceback
-            traceback.print_exc()
+                logger.debug("Document initialized with header")
+        except Exception:
+            logger.exception("Error ensuring document")
+            backend_errors.inc(backend='drive', operation='ensure_portfolio_document')
     
+    @instrument_backend('drive')
     def upload_image_from_memory(self, file_content, filename, title):
         try:
-            print(f"Starting memory upload for: {title}")
+            self.initialize()
+            logger.info("Starting memory upload for: %s", title)
             
             # Detect file type from filename
             import mimetypes
@@ -135,11 +241,10 @@ class GoogleDriveManager:
             media = MediaIoBaseUpload(file_buffer, mimetype=mime_type, resumable=True, chunksize=1024*512)
             
             # Retry upload with exponential backoff
-            import time
             max_retries = 3
             for attempt in range(max_retries):
                 try:
-                    print(f"Upload attempt {attempt + 1}/{max_retries}")
+                    logger.debug("Upload attempt %d/%d", attempt + 1, max_retries)
                     file = self.drive_service.files().create(
                         body=file_metadata,
                         media_body=media,
@@ -147,13 +252,13 @@ class GoogleDriveManager:
                     ).execute()
                     break
                 except Exception as retry_error:
-                    print(f"Attempt {attempt + 1} failed: {retry_error}")
+                    logger.warning("Upload attempt %d failed: %s", attempt + 1, retry_error)
                     if attempt == max_retries - 1:
                         raise
                     time.sleep(2 ** attempt)  # Exponential backoff
                     file_buffer.seek(0)  # Reset buffer position
             
-            print(f"File uploaded with ID: {file.get('id')}")
+            logger.info("File uploaded with ID: %s", file.get('id'))
             
             # Make file publicly viewable
             self.drive_service.permissions().create(
@@ -161,10 +266,10 @@ class GoogleDriveManager:
                 body={'role': 'reader', 'type': 'anyone'}
             ).execute()
             
-            print("File made public")
+            logger.debug("File made public")
             
             # Add metadata to document
-            print(f"Adding to document: {self.doc_id}")
+            logger.debug("Adding to document: %s", self.doc_id)
             self.add_to_document(file.get('id'), title)
             
             # Get direct image URL
@@ -175,71 +280,93 @@ class GoogleDriveManager:
                 'url': image_url,
                 'title': title
             }
-        except Exception as e:
-            print(f"Upload error: {e}")
-            import traceback
-            traceback.print_exc()
+        except Exception:
+            logger.exception("Drive upload error")
+            backend_errors.inc(backend='drive', operation='upload_image_from_memory')
             return None
     
     def add_to_document(self, file_id, title):
+        """Queue a metadata entry; a background writer appends it to the doc"""
+        entry_text = f"Title: {title}\nFile ID: {file_id}\nURL: https://drive.google.com/uc?id={file_id}\n\n"
+        with self._doc_cond:
+            self._doc_pending.append(entry_text)
+            if self._doc_writer is None:
+                self._doc_writer = threading.Thread(
+                    target=self._document_writer, name='drive-doc-writer', daemon=True
+                )
+                self._doc_writer.start()
+                # Don't lose queued entries on a clean shutdown
+                atexit.register(self.flush_document_entries)
+            self._doc_cond.notify()
+    
+    def pending_document_entries(self):
+        with self._doc_cond:
+            return len(self._doc_pending)
+    
+    @instrument_backend('drive')
+    def flush_document_entries(self):
+        """Append up to DOC_BATCH_MAX queued entries in one batchUpdate.
+        
+        Inserting at the end of the body segment needs no index, so the
+        document is never read back. Failed entries go back to the queue.
+        """
+        with self._doc_cond:
+            batch = self._doc_pending[:DOC_BATCH_MAX]
+            del self._doc_pending[:DOC_BATCH_MAX]
+        if not batch:
+            return 0
+        
+        requests = [{
+            'insertText': {
+                'endOfSegmentLocation': {},
+                'text': ''.join(batch)
+            }
+        }]
+        
         try:
-            print(f"Getting document: {self.doc_id}")
-            # Get current document content
-            doc = self.docs_service.documents().get(documentId=self.doc_id).execute()
-            content = doc.get('body', {}).get('content', [])
-            
-            print(f"Document content length: {len(content)}")
-            
-            # Find the end of the document
-            end_index = 1
-            for element in content:
-                if 'endIndex' in element:
-                    end_index = element['endIndex']
-            
-            print(f"End index: {end_index}")
-            
-            # Add new entry
-            entry_text = f"Title: {title}\nFile ID: {file_id}\nURL: https://drive.google.com/uc?id={file_id}\n\n"
-            
-            requests = [{
-                'insertText': {
-                    'location': {'index': end_index - 1},
-                    'text': entry_text
-                }
-            }]
-            
-            print(f"Updating document with text: {entry_text[:50]}...")
-            
-            result = self.docs_service.documents().batchUpdate(
+            self.docs_service.documents().batchUpdate(
                 documentId=self.doc_id,
                 body={'requests': requests}
             ).execute()
-            
-            print(f"Document updated successfully: {result}")
-            
-        except Exception as e:
-            print(f"Document update error: {e}")
-            import traceback
-            traceback.print_exc()
+        except Exception:
+            with self._doc_cond:
+                self._doc_pending[:0] = batch
+            raise
+        
+        logger.debug("Appended %d entries to document %s", len(batch), self.doc_id)
+        return len(batch)
+    
+    def _document_writer(self):
+        failures = 0
+        while True:
+            with self._doc_cond:
+                while not self._doc_pending:
+                    self._doc_cond.wait()
+            # Let a burst of uploads share one request
+            time.sleep(DOC_BATCH_DELAY)
+            try:
+                self.flush_document_entries()
+                failures = 0
+            except Exception:
+                failures += 1
+                logger.exception("Document update error (attempt %d)", failures)
+                if failures >= DOC_MAX_ATTEMPTS:
+                    with self._doc_cond:
+                        dropped = self._doc_pending[:DOC_BATCH_MAX]
+                        del self._doc_pending[:DOC_BATCH_MAX]
+                    logger.error("Dropping %d document entries after %d failures", len(dropped), failures)
+                    failures = 0
+                else:
+                    time.sleep(2 ** failures)
     
+    @instrument_backend('drive')
     def get_all_images(self):
+        """Folder images from the local mirror, after pulling any new changes"""
         try:
-            results = self.drive_service.files().list(
-                q=f"'{self.folder_id}' in parents and mimeType contains 'image/'",
-                fields="files(id, name, webViewLink)"
-            ).execute()
-            
-            files = results.get('files', [])
-            images = []
-            
-            for file in files:
-                images.append({
-                    'id': file['id'],
-                    'title': file['name'].replace('.jpg', '').replace('.png', '').replace('.jpeg', ''),
-                    'src': f"https://drive.google.com/uc?id={file['id']}"
-                })
-            
-            return images
+            self.initialize()
+            self.mirror.sync(self.drive_service, self.folder_id)
         except Exception as e:
-            print(f"Fetch error: {e}")
-            return []
\ No newline at end of file
+            # Serve the last mirrored listing rather than nothing
+            logger.error("Drive sync error: %s", e)
+            backend_errors.inc(backend='drive', operation='get_all_images')
+        return self.mirror.images()
@@ -0,0 +1,18 @@
+import os
+
+bind = f"0.0.0.0:{os.environ.get('PORT', 5000)}"
+
+# Threaded workers by default; set GUNICORN_WORKER_CLASS=gevent if gevent is
+# installed. Workers share the SQLite catalog, upload jobs and migration
+# manifest on disk, and one of them (the service lock holder) runs the
+# Telegram sender and periodic catalog sync. /metrics is per worker.
+workers = int(os.environ.get("WEB_CONCURRENCY", 2))
+worker_class = os.environ.get("GUNICORN_WORKER_CLASS", "gthread")
+threads = int(os.environ.get("GUNICORN_THREADS", 8))
+timeout = int(os.environ.get("GUNICORN_TIMEOUT", 120))
+
+# Each worker imports the app itself: background threads (bot leader election,
+# Telegram outbox, caches) don't survive a fork from a preloaded master
+preload_app = False
+
+accesslog = "-"
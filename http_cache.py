@@ -0,0 +1,105 @@
+import gzip
+import hashlib
+import threading
+from collections import OrderedDict
+
+from flask import Response, json, request
+
+from metrics import http_cache_requests
+
+try:
+    import brotli
+except ImportError:  # brotli is optional; without it responses are gzipped
+    brotli = None
+
+# Bodies smaller than this aren't worth compressing
+MIN_COMPRESS_SIZE = 512
+
+
+class JsonResponseCache:
+    """Conditional, compressed JSON responses with the encoded bodies cached.
+
+    Every response carries a weak ETag derived from the request key and the
+    catalog version, so a matching ``If-None-Match`` gets a 304 without the
+    body being built at all. Otherwise the body is serialised and compressed
+    for the negotiated ``Accept-Encoding`` once, and kept in an LRU of at
+    most ``max_entries`` bodies until the catalog version changes.
+    """
+
+    def __init__(self, max_entries=256, max_age=30, stale_while_revalidate=300,
+                 gzip_level=6, brotli_quality=5):
+        self.max_entries = max_entries
+        self.cache_control = f"public, max-age={max_age}, stale-while-revalidate={stale_while_revalidate}"
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+        self._bodies = OrderedDict()
+        self._version = None
+        self._lock = threading.Lock()
+
+    def json_response(self, key, version, build):
+        """Respond for ``key`` at catalog ``version``; ``build()`` returns the payload"""
+        etag = hashlib.sha1(repr((key, version)).encode()).hexdigest()[:20]
+        if request.if_none_match.contains_weak(etag):
+            http_cache_requests.inc(cache='http', result='not_modified')
+            response = Response(status=304)
+        else:
+            encoding = self._negotiate()
+            body, encoding = self._body(key, version, encoding, build)
+            response = Response(body, mimetype='application/json')
+            if encoding != 'identity':
+                response.headers['Content-Encoding'] = encoding
+        response.set_etag(etag, weak=True)
+        response.headers['Cache-Control'] = self.cache_control
+        response.vary.add('Accept-Encoding')
+        return response
+
+    def _negotiate(self):
+        accepted = request.accept_encodings
+        if brotli is not None and accepted['br']:
+            return 'br'
+        if accepted['gzip']:
+            return 'gzip'
+        return 'identity'
+
+    def _body(self, key, version, encoding, build):
+        with self._lock:
+            if version != self._version:
+                # Bodies for an older catalog can never be served again
+                self._bodies.clear()
+                self._version = version
+            body = self._lookup((key, encoding))
+            raw = None
+            if body is None and encoding != 'identity':
+                raw = self._lookup((key, 'identity'))
+        if body is not None:
+            http_cache_requests.inc(cache='http', result='hit')
+            return body, encoding
+        http_cache_requests.inc(cache='http', result='miss')
+
+        if raw is None:
+            raw = json.dumps(build()).encode()
+            self._store(version, (key, 'identity'), raw)
+        if len(raw) < MIN_COMPRESS_SIZE:
+            encoding = 'identity'
+        if encoding == 'identity':
+            return raw, encoding
+        if encoding == 'br':
+            body = brotli.compress(raw, quality=self.brotli_quality)
+        else:
+            body = gzip.compress(raw, compresslevel=self.gzip_level)
+        self._store(version, (key, encoding), body)
+        return body, encoding
+
+    def _lookup(self, cache_key):
+        body = self._bodies.get(cache_key)
+        if body is not None:
+            self._bodies.move_to_end(cache_key)
+        return body
+
+    def _store(self, version, cache_key, body):
+        with self._lock:
+            if version != self._version:
+                return
+            self._bodies[cache_key] = body
+            while len(self._bodies) > self.max_entries:
+                self._bodies.popitem(last=False)
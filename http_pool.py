@@ -0,0 +1,137 @@
+import threading
+from urllib.parse import urlsplit
+
+import requests
+import urllib3
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+
+class PooledSession(requests.Session):
+    """requests.Session with a default timeout and per-host request counters"""
+
+    def __init__(self, timeout):
+        super().__init__()
+        self.timeout = timeout
+        self.requests_by_host = {}
+        self.errors_by_host = {}
+        self._stats_lock = threading.Lock()
+
+    def request(self, method, url, **kwargs):
+        kwargs.setdefault('timeout', self.timeout)
+        host = urlsplit(url).netloc
+        try:
+            return super().request(method, url, **kwargs)
+        except requests.RequestException:
+            self._count(self.errors_by_host, host)
+            raise
+        finally:
+            self._count(self.requests_by_host, host)
+
+    def _count(self, counter, host):
+        with self._stats_lock:
+            counter[host] = counter.get(host, 0) + 1
+
+
+def _retry_policy(retries, backoff):
+    # Only retry failures where the request never reached the server, so
+    # non-idempotent calls such as sendMessage can't be sent twice
+    return Retry(total=retries, connect=retries, read=0, status=0,
+                 other=0, backoff_factor=backoff, raise_on_status=False)
+
+
+def _pool_stats(pools):
+    stats = {}
+    for key in pools.keys():
+        pool = pools.get(key)
+        if pool is None:
+            continue
+        stats[f"{pool.scheme}://{pool.host}:{pool.port}"] = {
+            'connections_opened': pool.num_connections,
+            'requests': pool.num_requests,
+            'idle': pool.pool.qsize() if pool.pool else 0,
+            'maxsize': pool.pool.maxsize if pool.pool else 0,
+        }
+    return stats
+
+
+class HttpPools:
+    """Shared keep-alive connection pools for all outbound API traffic.
+
+    ``pool_sizes`` maps a hostname to its max number of kept-alive
+    connections; other hosts get ``default_pool_size``.
+    """
+
+    def __init__(self, connect_timeout=5.0, read_timeout=30.0, retries=2,
+                 backoff=0.3, default_pool_size=10, pool_sizes=None):
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.default_pool_size = default_pool_size
+        self.pool_sizes = pool_sizes or {}
+        self._sessions = {}
+        self._adapters = {}
+        self._pool_managers = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls, environ):
+        """Build from HTTP_* settings; HTTP_POOL_SIZES is "host=size,host=size" """
+        pool_sizes = {}
+        for item in environ.get('HTTP_POOL_SIZES', '').split(','):
+            host, _, size = item.partition('=')
+            if host.strip() and size.strip():
+                pool_sizes[host.strip()] = int(size)
+        return cls(
+            connect_timeout=float(environ.get('HTTP_CONNECT_TIMEOUT', 5)),
+            read_timeout=float(environ.get('HTTP_READ_TIMEOUT', 30)),
+            retries=int(environ.get('HTTP_RETRIES', 2)),
+            default_pool_size=int(environ.get('HTTP_POOL_SIZE', 10)),
+            pool_sizes=pool_sizes,
+        )
+
+    def pool_size(self, host):
+        return self.pool_sizes.get(host, self.default_pool_size)
+
+    def session(self, name, host):
+        """Shared requests session for one API host"""
+        with self._lock:
+            if name not in self._sessions:
+                session = PooledSession((self.connect_timeout, self.read_timeout))
+                adapter = HTTPAdapter(
+                    pool_connections=1,
+                    pool_maxsize=self.pool_size(host),
+                    max_retries=_retry_policy(self.retries, self.backoff)
+                )
+                session.mount('https://', adapter)
+                session.mount('http://', adapter)
+                self._sessions[name] = session
+                self._adapters[name] = adapter
+            return self._sessions[name]
+
+    def pool_manager(self, name, host, **kwargs):
+        """Shared urllib3 PoolManager, for SDKs that talk urllib3 directly"""
+        with self._lock:
+            if name not in self._pool_managers:
+                self._pool_managers[name] = urllib3.PoolManager(
+                    num_pools=4,
+                    maxsize=self.pool_size(host),
+                    retries=_retry_policy(self.retries, self.backoff),
+                    timeout=urllib3.Timeout(connect=self.connect_timeout, read=self.read_timeout),
+                    **kwargs
+                )
+            return self._pool_managers[name]
+
+    def stats(self):
+        with self._lock:
+            stats = {}
+            for name, session in self._sessions.items():
+                stats[name] = {
+                    'requests': dict(session.requests_by_host),
+                    'errors': dict(session.errors_by_host),
+                    'pools': _pool_stats(self._adapters[name].poolmanager.pools),
+                }
+            for name, manager in self._pool_managers.items():
+                stats[name] = {'pools': _pool_stats(manager.pools)}
+            return stats
@@ -0,0 +1,219 @@
+import hashlib
+import json
+import logging
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+# Gallery order: sources are listed in this order, each in its own order
+SOURCE_RANKS = {
+    'cloudinary': 0,
+    'drive': 1,
+    'local': 2,
+}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS images (
+    source TEXT NOT NULL,
+    id TEXT NOT NULL,
+    source_rank INTEGER NOT NULL,
+    position INTEGER NOT NULL,
+    title TEXT,
+    src TEXT NOT NULL,
+    original TEXT,
+    width INTEGER,
+    height INTEGER,
+    uploaded_at TEXT,
+    data TEXT NOT NULL,
+    PRIMARY KEY (source, id)
+);
+CREATE INDEX IF NOT EXISTS images_order ON images (source_rank, position);
+CREATE TABLE IF NOT EXISTS sources (
+    source TEXT PRIMARY KEY,
+    digest TEXT NOT NULL,
+    count INTEGER NOT NULL,
+    synced_at REAL NOT NULL
+);
+"""
+
+
+class ImageCatalog:
+    """SQLite table of every gallery image, queried one page at a time.
+
+    Each source's listing is replaced wholesale by ``replace_source``, which
+    skips the write when the listing's digest is unchanged. Pages come from
+    the ``(source_rank, position)`` index, by offset for numbered pages or
+    by keyset for cursors. Versions and totals are read from the small
+    ``sources`` table, so every process sharing the database sees a sync
+    as soon as another process commits it.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        self._write_lock = threading.Lock()
+        self._conn().executescript(SCHEMA)
+
+    def _conn(self):
+        # sqlite3 connections can't be shared between threads
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def count(self, sources):
+        return sum(count for _, count in self._source_rows(sources).values())
+
+    def version(self, sources):
+        """Changes whenever the listing of any of ``sources`` changes"""
+        rows = self._source_rows(sources)
+        return tuple(rows.get(source, (None, 0))[0] for source in sources)
+
+    def _source_rows(self, sources):
+        """source -> (digest, count), one primary-key lookup per source"""
+        if not sources:
+            return {}
+        rows = self._conn().execute(
+            f"SELECT source, digest, count FROM sources WHERE source IN ({','.join('?' * len(sources))})",
+            list(sources)
+        )
+        return {source: (digest, count) for source, digest, count in rows}
+
+    def replace_source(self, source, images):
+        """Store ``images`` as the complete listing of ``source``; False if unchanged"""
+        digest = hashlib.sha1(json.dumps(images, sort_keys=True, default=str).encode()).hexdigest()
+        if digest == self._source_rows([source]).get(source, (None, 0))[0]:
+            return False
+        rank = SOURCE_RANKS[source]
+        rows = [
+            (
+                source, str(image.get('id') or image.get('original') or image['src']), rank, position,
+                image.get('title'), image['src'], image.get('original'),
+                image.get('width'), image.get('height'), image.get('uploaded_at'),
+                json.dumps(image),
+            )
+            for position, image in enumerate(images)
+        ]
+        with self._write_lock:
+            conn = self._conn()
+            with conn:
+                conn.execute("DELETE FROM images WHERE source = ?", (source,))
+                conn.executemany(
+                    "INSERT OR REPLACE INTO images (source, id, source_rank, position, title, src,"
+                    " original, width, height, uploaded_at, data) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    rows
+                )
+                conn.execute(
+                    "INSERT OR REPLACE INTO sources (source, digest, count, synced_at) VALUES (?, ?, ?, ?)",
+                    (source, digest, len(rows), time.time())
+                )
+        return True
+
+    def page(self, sources, offset, limit):
+        """Images ``offset`` to ``offset + limit`` of ``sources`` in gallery order"""
+        if offset < 0 or limit < 1:
+            raise ValueError(f"Invalid page: offset={offset} limit={limit}")
+        ranks = self._ranks(sources)
+        rows = self._conn().execute(
+            f"SELECT data FROM images WHERE source_rank IN ({','.join('?' * len(ranks))})"
+            " ORDER BY source_rank, position LIMIT ? OFFSET ?",
+            ranks + [limit, offset]
+        ).fetchall()
+        return [json.loads(data) for data, in rows]
+
+    def page_after(self, sources, cursor, limit):
+        """Keyset page: up to ``limit`` images after ``cursor``, plus the next cursor"""
+        if limit < 1:
+            raise ValueError(f"Invalid page size: {limit}")
+        ranks = self._ranks(sources)
+        after = (-1, -1)
+        if cursor:
+            rank, position = cursor.split('.', 1)
+            after = (int(rank), int(position))
+        rows = self._conn().execute(
+            f"SELECT source_rank, position, data FROM images WHERE source_rank IN ({','.join('?' * len(ranks))})"
+            " AND (source_rank, position) > (?, ?) ORDER BY source_rank, position LIMIT ?",
+            ranks + list(after) + [limit + 1]
+        ).fetchall()
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = f"{rows[-1][0]}.{rows[-1][1]}"
+        return [json.loads(data) for _, _, data in rows], next_cursor
+
+    def _ranks(self, sources):
+        return [SOURCE_RANKS[source] for source in sources] or [-1]
+
+
+class CatalogSync:
+    """Refreshes the catalog from listing jobs in the background.
+
+    A job returns ``{source: images}`` for the sources it listed; sources it
+    leaves out keep their previous listing. Each job gets a daemon thread
+    that runs it right away after ``trigger``, and also every ``interval``
+    seconds once ``run_periodically`` was called - in one process only,
+    when several share the catalog. A job that raises leaves the catalog
+    untouched.
+    """
+
+    def __init__(self, catalog):
+        self.catalog = catalog
+        self._jobs = {}
+        self._suppressed = threading.local()
+        self.periodic = False
+
+    def add_job(self, name, loader, interval):
+        self._jobs[name] = (loader, interval, threading.Event())
+
+    def start(self):
+        for name in self._jobs:
+            threading.Thread(target=self._loop, args=(name,), name=f'catalog-sync-{name}', daemon=True).start()
+
+    def run_periodically(self):
+        """Sync every job now and then every ``interval`` seconds"""
+        self.periodic = True
+        for _, _, wakeup in self._jobs.values():
+            wakeup.set()
+
+    def trigger(self, name=None):
+        """Run job ``name`` (or every job) as soon as possible"""
+        if getattr(self._suppressed, 'active', False):
+            return
+        for job, (_, _, wakeup) in self._jobs.items():
+            if name is None or job == name:
+                wakeup.set()
+
+    @contextmanager
+    def suppressed(self):
+        """Ignore triggers from this thread, e.g. per-file ones during a batch upload"""
+        previous = getattr(self._suppressed, 'active', False)
+        self._suppressed.active = True
+        try:
+            yield
+        finally:
+            self._suppressed.active = previous
+
+    def sync(self, name):
+        loader = self._jobs[name][0]
+        try:
+            listings = loader()
+        except Exception as e:
+            logger.warning("Catalog sync job %s failed: %s", name, e)
+            return False
+        for source, images in listings.items():
+            if self.catalog.replace_source(source, images):
+                logger.info("Catalog %s updated: %d images", source, len(images))
+        return True
+
+    def _loop(self, name):
+        _, interval, wakeup = self._jobs[name]
+        while True:
+            wakeup.wait(interval if self.periodic else None)
+            wakeup.clear()
+            self.sync(name)
@@ -0,0 +1,169 @@
+import hashlib
+import logging
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # Pillow is optional; without it originals are served as-is
+    Image = None
+
+logger = logging.getLogger(__name__)
+
+# Fixed widths for each rendition; images narrower than this are not upscaled
+VARIANT_WIDTHS = {
+    'thumb': 480,
+    'display': 1280,
+}
+# Changed whenever rendering changes, so renditions made the old way aren't
+# reused ("a": WebP keeps transparency)
+RENDITION_REVISION = 'a'
+# Transparent areas of the JPEG renditions are filled with this colour
+JPEG_BACKGROUND = (255, 255, 255)
+FORMATS = {
+    'webp': {'format': 'WEBP', 'quality': 80, 'method': 4},
+    'jpg': {'format': 'JPEG', 'quality': 82, 'optimize': True, 'progressive': True},
+}
+
+
+def file_digest(path, chunk_size=1024 * 1024):
+    sha = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            sha.update(chunk)
+    return sha.hexdigest()[:16]
+
+
+def derivative_names(digest):
+    """Map variant -> format -> filename for a source with this content hash"""
+    return {
+        variant: {ext: f"{digest}-{width}{RENDITION_REVISION}.{ext}" for ext in FORMATS}
+        for variant, width in VARIANT_WIDTHS.items()
+    }
+
+
+def generate_derivatives(source_path, output_dir):
+    """Write every missing rendition of ``source_path`` into ``output_dir``.
+
+    Runs inside a worker process. Returns (source_path, digest, names).
+    """
+    digest = file_digest(source_path)
+    names = derivative_names(digest)
+    missing = [
+        (variant, ext, name)
+        for variant, by_ext in names.items()
+        for ext, name in by_ext.items()
+        if not os.path.exists(os.path.join(output_dir, name))
+    ]
+    if missing:
+        with Image.open(source_path) as img:
+            img = ImageOps.exif_transpose(img)
+            img = _normalise_mode(img)
+            for variant, ext, name in missing:
+                width = VARIANT_WIDTHS[variant]
+                resized = img
+                if img.width > width:
+                    height = round(img.height * width / img.width)
+                    resized = img.resize((width, height), Image.LANCZOS)
+                if ext == 'jpg':
+                    resized = _flatten(resized)
+                # Write to a temp name (per process, several may build the same
+                # rendition) so readers never see a partial file
+                tmp_path = os.path.join(output_dir, f".{name}.{os.getpid()}.tmp")
+                resized.save(tmp_path, **FORMATS[ext])
+                os.replace(tmp_path, os.path.join(output_dir, name))
+    return source_path, digest, names
+
+
+def _normalise_mode(img):
+    """RGB, or RGBA when the image has transparency (WebP keeps it)"""
+    if img.mode in ('RGB', 'RGBA'):
+        return img
+    if img.mode in ('LA', 'PA') or (img.mode == 'P' and 'transparency' in img.info):
+        return img.convert('RGBA')
+    return img.convert('RGB')
+
+
+def _flatten(img):
+    """JPEG has no alpha channel: composite transparent images onto white"""
+    if img.mode != 'RGBA':
+        return img
+    background = Image.new('RGB', img.size, JPEG_BACKGROUND)
+    background.paste(img, mask=img.getchannel('A'))
+    return background
+
+
+class DerivativeStore:
+    """Generates and tracks resized WebP/JPEG renditions of local images.
+
+    Work runs in a process pool so resizing never holds the GIL of the web
+    process. Filenames are content-hashed, so renditions are reused across
+    restarts and can be served with long cache lifetimes.
+    """
+
+    def __init__(self, images_dir, output_dir, url_prefix, max_workers=2):
+        self.images_dir = images_dir
+        self.output_dir = output_dir
+        self.url_prefix = url_prefix.rstrip('/')
+        self.max_workers = max_workers
+        self.enabled = Image is not None
+        self._variants = {}
+        self._digests = {}
+        self._pending = set()
+        self._executor = None
+        self._lock = threading.Lock()
+        if not self.enabled:
+            logger.warning("Pillow not installed - serving original images only")
+
+    def pending(self):
+        """Number of files queued or being resized"""
+        return len(self._pending)
+
+    def discard(self, name):
+        """Forget renditions of a file that was removed or overwritten"""
+        self._variants.pop(name, None)
+        self._digests.pop(name, None)
+
+    def submit(self, name, callback=None):
+        """Queue rendition generation for one file in images_dir.
+        
+        ``callback(name, variants, digest)`` is called once the renditions
+        exist; ``digest`` is the start of the file's SHA-256.
+        """
+        if not self.enabled:
+            return
+        if name in self._variants:
+            if callback:
+                callback(name, self._variants[name], self._digests.get(name))
+            return
+        with self._lock:
+            if name in self._pending:
+                return
+            self._pending.add(name)
+            if self._executor is None:
+                os.makedirs(self.output_dir, exist_ok=True)
+                self._executor = ProcessPoolExecutor(max_workers=self.max_workers)
+            future = self._executor.submit(
+                generate_derivatives,
+                os.path.join(self.images_dir, name),
+                self.output_dir
+            )
+        future.add_done_callback(lambda f: self._on_done(name, f, callback))
+
+    def _on_done(self, name, future, callback):
+        with self._lock:
+            self._pending.discard(name)
+        try:
+            _, digest, names = future.result()
+        except Exception as e:
+            logger.error("Failed to build derivatives for %s: %s", name, e)
+            return
+        variants = {
+            variant: {ext: f"{self.url_prefix}/{filename}" for ext, filename in by_ext.items()}
+            for variant, by_ext in names.items()
+        }
+        self._variants[name] = variants
+        self._digests[name] = digest
+        if callback:
+            callback(name, variants, digest)
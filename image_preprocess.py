@@ -0,0 +1,361 @@
+import logging
+import os
+import struct
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # Pillow is optional; without it uploads are only checked and stripped
+    Image = None
+
+logger = logging.getLogger(__name__)
+
+# Bytes needed to recognise every supported format (WebP needs the chunk header)
+SNIFF_SIZE = 32
+
+# JPEG markers that carry metadata rather than image data: EXIF/XMP (APP1),
+# IPTC/Photoshop (APP13) and comments. APP0 (JFIF), APP2 (ICC colour profile)
+# and APP14 (Adobe colour transform) are needed to decode the image correctly.
+JPEG_METADATA_MARKERS = {0xE1, 0xED, 0xFE}
+# Start-of-frame markers, which hold the dimensions (C4, C8 and CC are not frames)
+JPEG_SOF_MARKERS = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+# PNG ancillary chunks with text, EXIF or timestamps; colour chunks are kept
+PNG_METADATA_CHUNKS = {b'tEXt', b'zTXt', b'iTXt', b'eXIf', b'tIME'}
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+# WebP chunks with EXIF/XMP, and the VP8X flags that announce them
+WEBP_METADATA_CHUNKS = {b'EXIF', b'XMP '}
+WEBP_EXIF_FLAG = 0x08
+WEBP_XMP_FLAG = 0x04
+# GIF application extensions that affect display (animation looping); other
+# applications (XMP, editors' data) and comment extensions are metadata
+GIF_KEPT_APPLICATIONS = {b'NETSCAPE2.0'}
+
+SAVE_OPTIONS = {
+    'jpeg': lambda quality: {'format': 'JPEG', 'quality': quality, 'optimize': True, 'progressive': True},
+    'png': lambda quality: {'format': 'PNG', 'optimize': True},
+    'webp': lambda quality: {'format': 'WEBP', 'quality': quality, 'method': 4},
+}
+
+
+class InvalidImage(ValueError):
+    pass
+
+
+def sniff_format(head):
+    """Image format from the first SNIFF_SIZE bytes of a file, or None"""
+    if head.startswith(b'\xff\xd8\xff'):
+        return 'jpeg'
+    if head.startswith(PNG_SIGNATURE):
+        return 'png'
+    if head[:6] in (b'GIF87a', b'GIF89a'):
+        return 'gif'
+    if head[:4] == b'RIFF' and head[8:12] == b'WEBP':
+        return 'webp'
+    return None
+
+
+def probe_image(f):
+    """(format, width, height) read from the file's headers only, or None.
+
+    The file position is restored, so this can check a request stream
+    before it is stored.
+    """
+    start = f.tell()
+    try:
+        head = f.read(SNIFF_SIZE)
+        fmt = sniff_format(head)
+        if fmt == 'png' and head[12:16] == b'IHDR':
+            width, height = struct.unpack('>II', head[16:24])
+        elif fmt == 'gif':
+            width, height = struct.unpack('<HH', head[6:10])
+        elif fmt == 'webp':
+            width, height = _webp_dimensions(head)
+        elif fmt == 'jpeg':
+            f.seek(start + 2)
+            width, height = _jpeg_dimensions(f)
+        else:
+            return None
+    except (struct.error, ValueError):
+        return None
+    finally:
+        f.seek(start)
+    if not width or not height:
+        return None
+    return fmt, width, height
+
+
+def _webp_dimensions(head):
+    chunk = head[12:16]
+    if chunk == b'VP8 ':
+        # Lossy bitstream: 14-bit sizes after the frame tag and start code
+        width, height = struct.unpack('<HH', head[26:30])
+        return width & 0x3FFF, height & 0x3FFF
+    if chunk == b'VP8L':
+        # Lossless bitstream: 14-bit sizes minus one, packed after the 0x2f signature
+        bits = struct.unpack('<I', head[21:25])[0]
+        return (bits & 0x3FFF) + 1, ((bits >> 14) & 0x3FFF) + 1
+    if chunk == b'VP8X':
+        # Extended format: 24-bit canvas sizes minus one
+        return int.from_bytes(head[24:27], 'little') + 1, int.from_bytes(head[27:30], 'little') + 1
+    raise ValueError("Unknown WebP chunk")
+
+
+def _jpeg_dimensions(f):
+    """Walk the segment headers (skipping their bodies) up to the frame header"""
+    while True:
+        marker = _jpeg_marker(f)
+        if marker in (0xD9, 0xDA):
+            # End of image or start of scan before any frame header
+            raise ValueError("No JPEG frame header")
+        length = struct.unpack('>H', f.read(2))[0]
+        if marker in JPEG_SOF_MARKERS:
+            height, width = struct.unpack('>xHH', f.read(5))
+            return width, height
+        f.seek(length - 2, os.SEEK_CUR)
+
+
+def _jpeg_marker(f):
+    byte = f.read(1)
+    if byte != b'\xff':
+        raise ValueError("Bad JPEG segment")
+    while byte == b'\xff':
+        # Markers may be padded with extra 0xff bytes
+        byte = f.read(1)
+    if not byte:
+        raise ValueError("Truncated JPEG")
+    return byte[0]
+
+
+def jpeg_segments(data):
+    """Yield (marker, start, end) for each segment before the image data"""
+    pos = 2
+    while pos + 4 <= len(data):
+        if data[pos] != 0xFF:
+            raise ValueError("Bad JPEG segment")
+        marker = data[pos + 1]
+        if marker == 0xFF:
+            pos += 1
+            continue
+        length = struct.unpack('>H', data[pos + 2:pos + 4])[0]
+        yield marker, pos, pos + 2 + length
+        if marker == 0xDA:
+            return
+        pos += 2 + length
+
+
+def jpeg_orientation(data):
+    """EXIF orientation (1-8) of a JPEG, or None if it has none"""
+    for marker, start, end in jpeg_segments(data):
+        if marker != 0xE1 or data[start + 4:start + 10] != b'Exif\x00\x00':
+            continue
+        tiff = data[start + 10:end]
+        order = '<' if tiff[:2] == b'II' else '>'
+        try:
+            ifd = struct.unpack(order + 'I', tiff[4:8])[0]
+            count = struct.unpack(order + 'H', tiff[ifd:ifd + 2])[0]
+            for i in range(count):
+                entry = ifd + 2 + i * 12
+                tag, _, _, value = struct.unpack(order + 'HHIH', tiff[entry:entry + 10])
+                if tag == 0x0112:
+                    return value
+        except struct.error:
+            return None
+    return None
+
+
+def strip_jpeg_metadata(data):
+    """JPEG bytes without EXIF/XMP/IPTC/comment segments; the image data is untouched"""
+    parts = [data[:2]]
+    pos = 2
+    for marker, start, end in jpeg_segments(data):
+        if marker not in JPEG_METADATA_MARKERS:
+            parts.append(data[start:end])
+        pos = end
+    parts.append(data[pos:])
+    return b''.join(parts)
+
+
+def strip_png_metadata(data):
+    """PNG bytes without text, EXIF and time chunks"""
+    parts = [data[:8]]
+    pos = 8
+    while pos + 8 <= len(data):
+        length, chunk = struct.unpack('>I4s', data[pos:pos + 8])
+        end = pos + 12 + length
+        if chunk not in PNG_METADATA_CHUNKS:
+            parts.append(data[pos:end])
+        pos = end
+        if chunk == b'IEND':
+            break
+    return b''.join(parts)
+
+
+def strip_webp_metadata(data):
+    """WebP bytes without EXIF and XMP chunks; VP8X flags and the RIFF size are updated"""
+    parts = []
+    pos = 12
+    while pos + 8 <= len(data):
+        chunk, length = struct.unpack('<4sI', data[pos:pos + 8])
+        # Chunk payloads are padded to an even length
+        end = pos + 8 + length + (length & 1)
+        if chunk == b'VP8X' and length >= 1:
+            flags = data[pos + 8] & ~(WEBP_EXIF_FLAG | WEBP_XMP_FLAG)
+            parts.append(data[pos:pos + 8] + bytes([flags]) + data[pos + 9:end])
+        elif chunk not in WEBP_METADATA_CHUNKS:
+            parts.append(data[pos:end])
+        pos = end
+    body = b''.join(parts)
+    return b'RIFF' + struct.pack('<I', len(body) + 4) + b'WEBP' + body
+
+
+def strip_gif_metadata(data):
+    """GIF bytes without comment extensions or application extensions other than looping"""
+    pos = 13
+    flags = data[10]
+    if flags & 0x80:
+        # Global colour table
+        pos += 3 << ((flags & 0x07) + 1)
+    parts = [data[:pos]]
+    while pos < len(data):
+        block = data[pos]
+        if block == 0x3B:
+            parts.append(data[pos:pos + 1])
+            break
+        if block == 0x21:
+            label = data[pos + 1]
+            end = _gif_sub_blocks_end(data, pos + 2)
+            application = data[pos + 3:pos + 14] if label == 0xFF and data[pos + 2] == 11 else None
+            if label != 0xFE and (label != 0xFF or application in GIF_KEPT_APPLICATIONS):
+                parts.append(data[pos:end])
+        elif block == 0x2C:
+            flags = data[pos + 9]
+            end = pos + 10
+            if flags & 0x80:
+                # Local colour table
+                end += 3 << ((flags & 0x07) + 1)
+            # LZW minimum code size, then the image data sub-blocks
+            end = _gif_sub_blocks_end(data, end + 1)
+            parts.append(data[pos:end])
+        else:
+            raise ValueError("Bad GIF block")
+        pos = end
+    return b''.join(parts)
+
+
+def _gif_sub_blocks_end(data, pos):
+    """Position after the sub-blocks starting at ``pos`` and their terminator"""
+    while True:
+        if pos >= len(data):
+            raise ValueError("Truncated GIF")
+        size = data[pos]
+        pos += 1 + size
+        if size == 0:
+            return pos
+
+
+def preprocess_image(path, max_dimension, quality):
+    """Strip metadata from ``path`` in place and downscale it to ``max_dimension``.
+
+    Runs inside a worker process. Images that need resizing, or rotating
+    to honour their EXIF orientation, are re-encoded in the same format
+    (needs Pillow); otherwise metadata is cut out without re-encoding.
+    GIFs and animated WebPs are never re-encoded, only stripped. Returns
+    what was done.
+    """
+    with open(path, 'rb') as f:
+        info = probe_image(f)
+        if info is None:
+            raise InvalidImage("Not a JPEG, PNG, GIF or WebP image")
+        fmt, width, height = info
+        data = f.read()
+    result = {
+        'format': fmt,
+        'width': width,
+        'height': height,
+        'original_size': len(data),
+        'size': len(data),
+        'action': 'none',
+    }
+    oversized = max(width, height) > max_dimension
+    rotated = fmt == 'jpeg' and jpeg_orientation(data) not in (None, 1)
+
+    if fmt != 'gif' and (oversized or rotated):
+        if Image is None:
+            logger.warning("Pillow not installed - can't downscale %dx%d %s", width, height, fmt)
+        else:
+            reencoded = _reencode(path, fmt, max_dimension, quality)
+            if reencoded:
+                result.update(reencoded, action='reencoded')
+                return result
+
+    try:
+        if fmt == 'jpeg':
+            # A rotated JPEG that couldn't be re-encoded keeps its orientation tag
+            stripped = data if rotated else strip_jpeg_metadata(data)
+        elif fmt == 'png':
+            stripped = strip_png_metadata(data)
+        elif fmt == 'webp':
+            stripped = strip_webp_metadata(data)
+        else:
+            stripped = strip_gif_metadata(data)
+    except (ValueError, IndexError, struct.error) as e:
+        raise InvalidImage(f"Corrupt {fmt} image: {e}")
+    if len(stripped) < len(data):
+        _write(path, stripped)
+        result.update(size=len(stripped), action='stripped')
+    return result
+
+
+def _reencode(path, fmt, max_dimension, quality):
+    with Image.open(path) as img:
+        if getattr(img, 'is_animated', False):
+            return None
+        icc_profile = img.info.get('icc_profile')
+        img = ImageOps.exif_transpose(img)
+        img.thumbnail((max_dimension, max_dimension), Image.LANCZOS)
+        if fmt == 'jpeg' and img.mode not in ('RGB', 'L', 'CMYK'):
+            img = img.convert('RGB')
+        # Saved without exif=..., so no metadata is carried over
+        tmp_path = f"{path}.tmp"
+        img.save(tmp_path, icc_profile=icc_profile, **SAVE_OPTIONS[fmt](quality))
+        os.replace(tmp_path, path)
+        return {'width': img.width, 'height': img.height, 'size': os.path.getsize(path)}
+
+
+def _write(path, data):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+class ImagePreprocessor:
+    """Cleans up stored uploads before they are sent to a backend.
+
+    ``process`` runs ``preprocess_image`` in a process pool (created on
+    first use) and waits for it, so decoding and resizing never hold the
+    GIL of the web process.
+    """
+
+    def __init__(self, max_dimension=4096, quality=88, max_workers=2):
+        self.max_dimension = max_dimension
+        self.quality = quality
+        self.max_workers = max_workers
+        self._executor = None
+        self._lock = threading.Lock()
+        if Image is None:
+            logger.warning("Pillow not installed - uploads are stripped of metadata but not downscaled")
+
+    def process(self, path):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(max_workers=self.max_workers)
+        result = self._executor.submit(preprocess_image, path, self.max_dimension, self.quality).result()
+        if result['action'] != 'none':
+            logger.info(
+                "Preprocessed upload: %s %dx%d, %d -> %d bytes (%s)",
+                result['format'], result['width'], result['height'],
+                result['original_size'], result['size'], result['action']
+            )
+        return result
@@ -0,0 +1,75 @@
+import logging
+import os
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:  # Windows dev machines: every process counts as leader
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+
+class LeaderLock:
+    """Non-blocking exclusive lock on a file; the holder is the leader.
+
+    The OS drops the lock when the holding process dies, so another
+    worker takes over on its next attempt. Put the file on storage shared
+    by every instance that should take part in the election.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._fd = None
+
+    @property
+    def held(self):
+        return self._fd is not None
+
+    def acquire(self):
+        if self._fd is not None:
+            return True
+        if fcntl is None:
+            self._fd = -1
+            return True
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            os.close(fd)
+            return False
+        os.ftruncate(fd, 0)
+        os.write(fd, str(os.getpid()).encode())
+        self._fd = fd
+        return True
+
+    def release(self):
+        if self._fd is None:
+            return
+        if self._fd >= 0:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+            os.close(self._fd)
+        self._fd = None
+
+    def run_when_leader(self, target, retry_interval=15.0):
+        """Start a daemon thread that runs ``target`` whenever this process leads.
+
+        Followers retry every ``retry_interval`` seconds. If ``target``
+        returns, leadership is given up so another process can try.
+        """
+        def loop():
+            while True:
+                if self.acquire():
+                    logger.info("Process %d holds %s", os.getpid(), self.path)
+                    try:
+                        target()
+                    except Exception:
+                        logger.exception("Leader task error")
+                    finally:
+                        self.release()
+                time.sleep(retry_interval)
+
+        thread = threading.Thread(target=loop, name='leader-election', daemon=True)
+        thread.start()
+        return thread
@@ -0,0 +1,148 @@
+import os
+import threading
+import time
+from datetime import datetime, timezone
+from urllib.parse import quote
+
+SUPPORTED_EXTS = {'.jpg', '.jpeg', '.png', '.gif', '.webp'}
+
+
+def title_from_filename(name):
+    base = os.path.splitext(name)[0]
+    return base.replace('_', ' ').replace('-', ' ').title()
+
+
+class LocalImageIndex:
+    """Persistent, incrementally updated index of a local images directory.
+
+    The directory is scanned once up front. Afterwards it is checked at most
+    every ``check_interval`` seconds: the directory is only listed again when
+    its mtime changes (a file was added or removed), and indexed files whose
+    ``(mtime_ns, size)`` changed, e.g. overwritten in place, are re-indexed. Entries keep their precomputed
+    title, URL and size in sorted order.
+
+    When a ``derivatives`` store is given, each new file is queued for
+    resizing and its entry switches to the small rendition once it exists.
+    """
+
+    def __init__(self, images_dir, url_prefix, check_interval=2.0, derivatives=None):
+        self.images_dir = images_dir
+        self.url_prefix = url_prefix.rstrip('/')
+        self.check_interval = check_interval
+        self.derivatives = derivatives
+        self._entries = {}
+        # name -> (mtime_ns, size) when the file was indexed
+        self._signatures = {}
+        self._ordered = []
+        self._dir_mtime = None
+        self._checked_at = 0.0
+        # Re-entrant: derivatives already built call set_variants from _index_file
+        self._lock = threading.RLock()
+        self.refresh(force=True)
+
+    def images(self):
+        """Return every indexed image in sort order"""
+        self._maybe_refresh()
+        return self._ordered
+
+    def add(self, name):
+        """Index a file that was just written, without waiting for a rescan"""
+        with self._lock:
+            if self._index_file(name):
+                self._rebuild_order()
+
+    def refresh(self, force=False):
+        """Apply directory changes since the last scan"""
+        with self._lock:
+            self._checked_at = time.monotonic()
+            try:
+                dir_mtime = os.stat(self.images_dir).st_mtime_ns
+            except OSError:
+                if self._entries:
+                    self._entries.clear()
+                    self._signatures.clear()
+                    self._rebuild_order()
+                self._dir_mtime = None
+                return
+
+            changed = False
+            if force or dir_mtime != self._dir_mtime:
+                self._dir_mtime = dir_mtime
+                names = set(os.listdir(self.images_dir))
+                for name in list(self._entries):
+                    if name not in names:
+                        self._remove(name)
+                        changed = True
+                for name in names - self._entries.keys():
+                    changed = self._index_file(name) or changed
+            # Overwriting a file in place doesn't touch the directory mtime
+            for name, signature in list(self._signatures.items()):
+                current = self._signature(name)
+                if current is None:
+                    self._remove(name)
+                    changed = True
+                elif current != signature:
+                    changed = self._index_file(name) or changed
+            if changed or force:
+                self._rebuild_order()
+
+    def _maybe_refresh(self):
+        if time.monotonic() - self._checked_at >= self.check_interval:
+            self.refresh()
+
+    def _signature(self, name):
+        try:
+            stat = os.stat(os.path.join(self.images_dir, name))
+        except OSError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    def _remove(self, name):
+        self._entries.pop(name, None)
+        self._signatures.pop(name, None)
+        if self.derivatives:
+            self.derivatives.discard(name)
+
+    def _index_file(self, name):
+        if os.path.splitext(name)[1].lower() not in SUPPORTED_EXTS:
+            return False
+        signature = self._signature(name)
+        if signature is None:
+            return False
+        mtime_ns, size = signature
+        if self.derivatives and name in self._entries:
+            # Renditions of the previous content no longer apply
+            self.derivatives.discard(name)
+        self._signatures[name] = signature
+        url = f"{self.url_prefix}/{quote(name)}"
+        self._entries[name] = {
+            'src': url,
+            'original': url,
+            'title': title_from_filename(name),
+            'size': size,
+            'uploaded_at': datetime.fromtimestamp(mtime_ns / 1e9, timezone.utc).isoformat(),
+        }
+        if self.derivatives:
+            self.derivatives.submit(name, self.set_variants)
+        return True
+
+    def set_variants(self, name, variants, digest=None):
+        """Serve the thumbnail in the grid and the display size in the lightbox"""
+        # Called from the derivative pool's callback thread
+        with self._lock:
+            entry = self._entries.get(name)
+            if entry is None:
+                return
+            # Replace rather than mutate, so a listing being read stays consistent
+            self._entries[name] = dict(
+                entry,
+                src=variants['thumb']['webp'],
+                display=variants['display']['webp'],
+                variants=variants,
+                sha256=digest,
+            )
+            self._rebuild_order()
+
+    def _rebuild_order(self):
+        # Swap in a new list so readers never see a half-built order
+        self._ordered = [self._entries[name] for name in sorted(self._entries, key=str.lower)]
@@ -0,0 +1,147 @@
+import atexit
+import contextvars
+import copy
+import json
+import logging
+import logging.handlers
+import queue
+import random
+import sys
+import time
+import uuid
+
+REQUEST_ID_HEADER = 'X-Request-ID'
+
+# Per-request state, visible to every log call made while handling the request
+request_id_var = contextvars.ContextVar('request_id', default='-')
+sampled_var = contextvars.ContextVar('log_sampled', default=True)
+
+# Attributes every LogRecord has; anything else was passed via ``extra=``
+_RECORD_ATTRS = set(vars(logging.makeLogRecord({}))) | {'message', 'asctime', 'request_id'}
+
+_listener = None
+
+# Renders tracebacks on the calling thread before records are queued
+_traceback_formatter = logging.Formatter()
+
+
+class RequestContextFilter(logging.Filter):
+    """Tags records with the request id and drops unsampled INFO/DEBUG records"""
+
+    def filter(self, record):
+        record.request_id = request_id_var.get()
+        return record.levelno >= logging.WARNING or sampled_var.get()
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            'ts': round(record.created, 3),
+            'level': record.levelname,
+            'logger': record.name,
+            'request_id': getattr(record, 'request_id', '-'),
+            'msg': record.getMessage(),
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_ATTRS:
+                entry[key] = value
+        if record.exc_info:
+            entry['exc'] = record.exc_text or self.formatException(record.exc_info)
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+class RecordQueueHandler(logging.handlers.QueueHandler):
+    """Enqueues a copy of each record and leaves formatting to the listener.
+
+    The stdlib ``prepare`` formats the message on the calling thread and
+    folds the traceback into ``msg``. Only the traceback is rendered here,
+    into ``exc_text``, since the frames it points to keep changing once the
+    caller moves on.
+    """
+
+    def prepare(self, record):
+        record = copy.copy(record)
+        if record.exc_info and not record.exc_text:
+            record.exc_text = _traceback_formatter.formatException(record.exc_info)
+        return record
+
+
+def configure_logging(level='INFO', json_format=True):
+    """Send all logging through a queue drained by a background thread.
+
+    Request threads only enqueue a copy of each record (with any traceback
+    rendered); formatting and the blocking write to stdout happen on the
+    listener thread.
+    """
+    global _listener
+    if _listener is not None:
+        return
+
+    stream_handler = logging.StreamHandler(sys.stdout)
+    if json_format:
+        stream_handler.setFormatter(JsonFormatter())
+    else:
+        stream_handler.setFormatter(logging.Formatter(
+            '%(asctime)s %(levelname)s %(name)s [%(request_id)s] %(message)s'
+        ))
+
+    log_queue = queue.SimpleQueue()
+    queue_handler = RecordQueueHandler(log_queue)
+    queue_handler.addFilter(RequestContextFilter())
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    root.setLevel(level)
+
+    _listener = logging.handlers.QueueListener(log_queue, stream_handler, respect_handler_level=True)
+    _listener.start()
+    atexit.register(_listener.stop)
+
+
+def parse_sample_rates(value):
+    """Parse "path=rate,path=rate" into a dict, e.g. "/api/images=0.1" """
+    rates = {}
+    for item in (value or '').split(','):
+        path, _, rate = item.partition('=')
+        if path.strip() and rate.strip():
+            rates[path.strip()] = float(rate)
+    return rates
+
+
+def init_request_logging(app, sample_rates=None):
+    """Assign request ids, apply per-route sampling and log one line per request"""
+    sample_rates = sample_rates or {}
+    access_log = logging.getLogger('access')
+
+    from flask import g, request
+
+    @app.before_request
+    def _start_request_log():
+        request_id = request.headers.get(REQUEST_ID_HEADER) or uuid.uuid4().hex[:16]
+        rate = sample_rates.get(request.path, 1.0)
+        g._log_tokens = (
+            request_id_var.set(request_id),
+            sampled_var.set(rate >= 1.0 or random.random() < rate),
+        )
+        g._log_started = time.perf_counter()
+
+    @app.after_request
+    def _finish_request_log(response):
+        response.headers[REQUEST_ID_HEADER] = request_id_var.get()
+        started = g.pop('_log_started', None)
+        if started is not None:
+            level = logging.WARNING if response.status_code >= 500 else logging.INFO
+            access_log.log(level, '%s %s %s', request.method, request.path, response.status_code, extra={
+                'status': response.status_code,
+                'duration_ms': round((time.perf_counter() - started) * 1000, 1),
+            })
+        return response
+
+    @app.teardown_request
+    def _reset_request_log(exc):
+        tokens = g.pop('_log_tokens', None)
+        if tokens:
+            request_id_var.reset(tokens[0])
+            sampled_var.reset(tokens[1])
@@ -1,22 +1,67 @@
 import os
-from flask import Flask, request, render_template
+from flask import Flask, Request, request, abort
 import logging
-import requests
-from telebot.types import Message, ReplyKeyboardMarkup, KeyboardButton
+from telebot.types import Message
 import telebot
+from telebot import apihelper
 import threading
+import cloudinary
 from flask import jsonify, url_for
 from flask_cors import CORS
 from google_drive import GoogleDriveManager
-from cloudinary_manager import CloudinaryManager
-from werkzeug.utils import secure_filename
+from cloudinary_manager import CloudinaryManager, CLIENT_ERRORS
+from circuit_breaker import CircuitBreaker
+from image_catalog import ImageCatalog, CatalogSync
+from storage_backends import StorageRouter, CloudinaryBackend, DriveBackend, LocalBackend
+from local_images import LocalImageIndex
+from image_derivatives import DerivativeStore
+from migrate_to_cloudinary import MigrationJob
+from telegram_outbox import TelegramOutbox, OutboxSpool, PRIORITY_HIGH
+from telegram_webhook import WebhookDispatcher, SECRET_HEADER
+from http_pool import HttpPools
+from menu_engine import MenuEngine
+from leader_election import LeaderLock
+from log_config import configure_logging, init_request_logging, parse_sample_rates
+from metrics import registry, queue_depth, circuit_open, init_route_metrics
+from http_cache import JsonResponseCache
+from upload_jobs import UploadJobQueue
+from image_preprocess import ImagePreprocessor, probe_image
 import tempfile
-import json
+import hashlib
+
+
+# Get environment variables
+from dotenv import load_dotenv
+load_dotenv()
+
+# LOG_PAYLOADS=1 (with LOG_LEVEL=DEBUG) adds request/response dumps;
+# LOG_SAMPLE_RATES thins out INFO logs per route
+LOG_PAYLOADS = os.environ.get("LOG_PAYLOADS", "").lower() in ("1", "true", "yes")
+logger = logging.getLogger(__name__)
+
+# Upload buffering: files are spooled to memory up to UPLOAD_SPOOL_SIZE and
+# to a temp file beyond that, then streamed out in UPLOAD_CHUNK_SIZE pieces
+UPLOAD_SPOOL_SIZE = int(os.environ.get("UPLOAD_SPOOL_SIZE", 512 * 1024))
+UPLOAD_CHUNK_SIZE = int(os.environ.get("UPLOAD_CHUNK_SIZE", 6 * 1024 * 1024))
+# Files accepted by one /api/upload/batch request
+UPLOAD_BATCH_MAX_FILES = int(os.environ.get("UPLOAD_BATCH_MAX_FILES", 50))
+# Largest page /api/images serves
+API_MAX_PER_PAGE = int(os.environ.get("API_MAX_PER_PAGE", 100))
+
+
+class SpooledUploadRequest(Request):
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        return tempfile.SpooledTemporaryFile(max_size=UPLOAD_SPOOL_SIZE, mode='rb+')
 
 
 # Initialize Flask app
 app = Flask(__name__)
-app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max file size
+app.request_class = SpooledUploadRequest
+app.config['MAX_CONTENT_LENGTH'] = int(os.environ.get("MAX_UPLOAD_MB", 16)) * 1024 * 1024
+
+init_request_logging(app, parse_sample_rates(os.environ.get("LOG_SAMPLE_RATES", "/api/images=0.1")))
+
+init_route_metrics(app)
 
 # Enable CORS for Vercel frontend and localhost
 CORS(app, origins=[
@@ -25,122 +70,257 @@ CORS(app, origins=[
     'http://localhost:3000'
 ])
 
-# Get environment variables
-from dotenv import load_dotenv
-load_dotenv()
-
 token = os.environ.get("token") or "dummy_token"
 CHAT_ID = os.environ.get("CHAT_ID") or "dummy_chat_id"
 
-# Initialize Telegram bot
-bot = telebot.TeleBot(token)
-
-# Initialize Cloudinary
+# Bot update delivery: "polling" (default) or "webhook"
+BOT_MODE = os.environ.get("BOT_MODE", "polling").lower()
+WEBHOOK_URL = os.environ.get("WEBHOOK_URL")
+# Telegram echoes this back in every webhook call; defaults to a hash of the token
+WEBHOOK_SECRET = os.environ.get("WEBHOOK_SECRET") or hashlib.sha256(token.encode()).hexdigest()
+
+# Shared keep-alive connection pools for Telegram, Cloudinary and Drive
+http_pools = HttpPools.from_env(os.environ)
+apihelper.session = http_pools.session('telegram', 'api.telegram.org')
+apihelper.CONNECT_TIMEOUT = http_pools.connect_timeout
+apihelper.READ_TIMEOUT = http_pools.read_timeout
+if os.environ.get("TELEGRAM_API_URL"):
+    # Alternate Bot API server (self-hosted, or the benchmark fake)
+    apihelper.API_URL = os.environ["TELEGRAM_API_URL"].rstrip("/") + "/bot{0}/{1}"
+
+# Which part of the app this process runs: "auto", "web" or "bot" (see create_app).
+# Only the process holding the lock file runs the bot, so polling never conflicts.
+BOT_ROLE = os.environ.get("BOT_ROLE", "auto").lower()
+bot_leader = LeaderLock(
+    os.environ.get("BOT_LOCK_FILE") or os.path.join(tempfile.gettempdir(), "telegrambot-leader.lock")
+)
+BOT_LEADER_RETRY = float(os.environ.get("BOT_LEADER_RETRY", 15))
+
+# Initialize Telegram bot (webhook updates already run on their own pool)
+bot = telebot.TeleBot(token, threaded=(BOT_MODE != "webhook"))
+
+webhook_dispatcher = WebhookDispatcher(
+    bot,
+    WEBHOOK_SECRET,
+    workers=int(os.environ.get("WEBHOOK_WORKERS", 4)),
+    max_pending=int(os.environ.get("WEBHOOK_MAX_PENDING", 100))
+)
+
+# Serialised, compressed /api/images bodies; ETags follow the catalog version
+response_cache = JsonResponseCache(
+    max_entries=int(os.environ.get("HTTP_CACHE_ENTRIES", 256)),
+    max_age=int(os.environ.get("HTTP_CACHE_MAX_AGE", 30)),
+    stale_while_revalidate=int(os.environ.get("HTTP_CACHE_STALE", 300))
+)
+
+CATALOG_SYNC_INTERVAL = float(os.environ.get("CATALOG_SYNC_INTERVAL", 60))
+
+# Process-wide singletons (the Telegram sender, periodic catalog sync) run
+# only in the process holding this lock; every process competes for it
+service_leader = LeaderLock(
+    os.environ.get("SERVICE_LOCK_FILE") or os.path.join(tempfile.gettempdir(), "portfolio-services.lock")
+)
+
+# Services below touch disk or start threads, so they are created by
+# create_app (once per process) rather than on import
+outbox = None
+catalog = None
+catalog_sync = None
 cloudinary_manager = None
-try:
-    cloudinary_manager = CloudinaryManager()
-except Exception as e:
-    print(f"❌ Failed to initialize Cloudinary: {e}")
-    cloudinary_manager = None
-
-# Initialize Google Drive (fallback)
+migration_job = None
 drive_manager = None
-if not cloudinary_manager and os.path.exists('credentials.json'):
-    try:
-        print("Initializing Google Drive as fallback...")
-        drive_manager = GoogleDriveManager()
-        print("✅ Google Drive manager initialized successfully")
-    except Exception as e:
-        print(f"❌ Failed to initialize Google Drive manager: {e}")
-        drive_manager = None
-
-# Configure logging
-logging.basicConfig(level=logging.INFO)
-
-
-# Custom keyboard for better user experience
-def create_main_keyboard():
-    keyboard = ReplyKeyboardMarkup(resize_keyboard=True)
-    keyboard.add(KeyboardButton("📞 Share My Contact", request_contact=True))
-    keyboard.add(KeyboardButton("💼 Portfolio"), KeyboardButton("🎨 Services"))
-    keyboard.add(KeyboardButton("💰 Pricing"), KeyboardButton("📱 Social Media"))
-    keyboard.add(KeyboardButton("🆘 Help"))
-    return keyboard
-
-
-def create_contact_keyboard():
-    keyboard = ReplyKeyboardMarkup(resize_keyboard=True)
-    keyboard.add(KeyboardButton("📞 Share My Contact", request_contact=True))
-    keyboard.add(KeyboardButton("↩️ Back to Main Menu"))
-    return keyboard
-
+derivative_store = None
+local_index = None
+storage = None
+image_preprocessor = None
+upload_jobs = None
+
+
+def init_services():
+    """Create the storage, catalog, upload and messaging services of this process"""
+    global outbox, catalog, catalog_sync, cloudinary_manager, migration_job, drive_manager
+    global derivative_store, local_index, storage, image_preprocessor, upload_jobs
+
+    # All outgoing messages go through a rate-limited sender in the leader
+    # process; the others hand theirs over through the spool file
+    outbox = TelegramOutbox(
+        bot,
+        workers=int(os.environ.get("TELEGRAM_SEND_WORKERS", 4)),
+        global_rate=float(os.environ.get("TELEGRAM_GLOBAL_RATE", 30)),
+        chat_interval=float(os.environ.get("TELEGRAM_CHAT_INTERVAL", 1.0)),
+        spool=OutboxSpool(os.environ.get("TELEGRAM_SPOOL_PATH", "telegram_outbox.db"))
+    )
 
-# Welcome message handler
-@bot.message_handler(commands=['start', 'hello'])
-def send_welcome(message: Message):
-    welcome_text = """
-🎨 *Welcome to My Creative World!* 🎨
+    # SQLite catalog of every gallery image, filled by background sync jobs
+    catalog = ImageCatalog(os.environ.get("CATALOG_DB_PATH", "catalog.db"))
+    catalog_sync = CatalogSync(catalog)
 
-Hello there! I'm *Firaol*, your friendly graphic designer and digital artist. ✨
+    # Initialize Cloudinary
+    try:
+        cloudinary_manager = CloudinaryManager(
+            pool_manager=http_pools.pool_manager(
+                'cloudinary', 'api.cloudinary.com', **cloudinary.CERT_KWARGS
+            ),
+            deadlines={
+                'list': float(os.environ.get("CLOUDINARY_LIST_DEADLINE", 10)),
+                'upload': float(os.environ.get("CLOUDINARY_UPLOAD_DEADLINE", 60)),
+            },
+            breaker=CircuitBreaker(
+                'cloudinary',
+                failure_threshold=int(os.environ.get("CLOUDINARY_BREAKER_FAILURES", 5)),
+                reset_timeout=float(os.environ.get("CLOUDINARY_BREAKER_RESET", 30)),
+                ignore=CLIENT_ERRORS
+            )
+        )
+        cloudinary_manager.on_change = lambda: catalog_sync.trigger('storage')
+    except Exception as e:
+        logger.error("Failed to initialize Cloudinary: %s", e)
+        cloudinary_manager = None
 
-I'm absolutely thrilled to have you here! Whether you're looking to:
-• Build an amazing brand identity
-• Create stunning posters and flyers
-• Design eye-catching digital art
-• Or bring any creative vision to life
+    # Background migration of static/images to Cloudinary (one process at a time)
+    if cloudinary_manager:
+        migration_job = MigrationJob(
+            cloudinary_manager,
+            images_dir=os.path.join(app.static_folder, 'images'),
+            manifest_path=os.environ.get("MIGRATION_MANIFEST_PATH", "migration_manifest.json"),
+            max_workers=int(os.environ.get("MIGRATION_WORKERS", 4))
+        )
 
-I'm here to help make it happen! 🌟
+    # Initialize Google Drive (fallback backend, queried when Cloudinary is slow or failing)
+    if os.path.exists('credentials.json'):
+        try:
+            logger.info("Initializing Google Drive as fallback")
+            drive_manager = GoogleDriveManager(
+                timeout=http_pools.read_timeout,
+                mirror_path=os.environ.get("DRIVE_MIRROR_PATH", "drive_mirror.json"),
+                state_path=os.environ.get("DRIVE_STATE_PATH", "drive_state.json")
+            )
+            # Folder/doc lookup happens off the startup path
+            drive_manager.start()
+            logger.info("Google Drive manager initializing in background")
+        except Exception as e:
+            logger.error("Failed to initialize Google Drive manager: %s", e)
+            drive_manager = None
+
+    # Resized thumbnail/display renditions of static/images
+    images_dir = os.path.join(app.static_folder, 'images')
+    derivative_store = DerivativeStore(
+        images_dir,
+        os.path.join(images_dir, 'derived'),
+        f"{app.static_url_path}/images/derived",
+        max_workers=int(os.environ.get("DERIVATIVE_WORKERS", 2))
+    )
 
-*Here's what you can do:*
-📞 `/contact` - Share your contact info with me
-💼 `/portfolio` - See my latest work
-🎨 `/services` - Explore what I offer
-💰 `/pricing` - Check my affordable rates
-📱 `/social` - Connect with me on social media
-🆘 `/help` - Get assistance
+    # Index of static/images, kept current from the directory mtime
+    local_index = LocalImageIndex(
+        images_dir,
+        f"{app.static_url_path}/images",
+        derivatives=derivative_store
+    )
 
-*Quick Tip:* You can also use the menu buttons below to navigate easily!
+    # Storage backends in priority order. Cloudinary is primary; Drive and the
+    # local directory are hedges used when it is slow, failing or empty.
+    storage_backends = []
+    if cloudinary_manager:
+        storage_backends.append(CloudinaryBackend(cloudinary_manager, UPLOAD_CHUNK_SIZE))
+    if drive_manager:
+        storage_backends.append(DriveBackend(drive_manager))
+    storage_backends.append(LocalBackend(local_index))
+    storage = StorageRouter(storage_backends, budget=float(os.environ.get("STORAGE_LIST_BUDGET", 10)))
+
+    # Listings are paged through in full, but only in the background. Without a
+    # primary backend the local directory is the gallery, so check it often.
+    catalog_sync.add_job(
+        'storage',
+        sync_storage,
+        CATALOG_SYNC_INTERVAL if cloudinary_manager else local_index.check_interval
+    )
 
-*Ready to create something amazing together?* 🚀
-    """
+    # Uploads lose their metadata and are downscaled to UPLOAD_MAX_DIMENSION
+    # pixels (long edge) in worker processes before they are sent on
+    image_preprocessor = ImagePreprocessor(
+        max_dimension=int(os.environ.get("UPLOAD_MAX_DIMENSION", 4096)),
+        quality=int(os.environ.get("UPLOAD_QUALITY", 88)),
+        max_workers=int(os.environ.get("PREPROCESS_WORKERS", 2))
+    )
 
-    bot.send_message(
-        message.chat.id,
-        welcome_text,
-        parse_mode='Markdown',
-        reply_markup=create_main_keyboard()
+    # Uploads are stored on disk and sent to the backend by background workers;
+    # jobs survive restarts and are shared by every process using the directory
+    upload_jobs = UploadJobQueue(
+        os.environ.get("UPLOAD_JOBS_DIR", "upload_jobs"),
+        store_upload,
+        workers=int(os.environ.get("UPLOAD_WORKERS", 2)),
+        on_batch_done=lambda batch_id: catalog_sync.trigger('storage'),
+        preprocess=image_preprocessor.process,
+        asset_exists=storage.asset_exists
     )
+    if cloudinary_manager:
+        # Re-uploading a deleted image must store it again, not return its dead URL
+        cloudinary_manager.on_delete = lambda public_id: upload_jobs.forget_asset('cloudinary', public_id)
+
+    # Background queue depths reported at /metrics
+    queue_depth.set_function(outbox.depth, queue='telegram_outbox')
+    queue_depth.set_function(lambda: webhook_dispatcher.pending, queue='telegram_webhook')
+    queue_depth.set_function(derivative_store.pending, queue='image_derivatives')
+    queue_depth.set_function(upload_jobs.pending, queue='upload_jobs')
+    if drive_manager:
+        queue_depth.set_function(drive_manager.pending_document_entries, queue='drive_metadata')
+    if cloudinary_manager:
+        circuit_open.set_function(
+            lambda: int(not cloudinary_manager.breaker.available), dependency='cloudinary'
+        )
 
-    # Send a follow-up message with emojis
-    bot.send_message(
-        message.chat.id,
-        "💫 *Let's bring your ideas to life!* \n\nDon't hesitate to reach out - I'm excited to work with you! 😊",
-        parse_mode='Markdown'
+
+def run_services():
+    """Run the process-wide singletons; used by whichever process holds the service lock"""
+    logger.info("Process %d runs the Telegram sender and periodic catalog sync", os.getpid())
+    outbox.start()
+    catalog_sync.run_periodically()
+    # Keep the lock for the life of the process so no other process starts them too
+    threading.Event().wait()
+
+
+def sync_storage():
+    """Catalog listings from one concurrent, hedged query of every backend"""
+    result = storage.list_images()
+    logger.debug("Storage listing status: %s", result.status)
+    listings = dict(result.listings)
+    fallbacks = {backend.name for backend in storage.backends if backend.fallback}
+    # A primary that didn't answer keeps its last listing, which isn't mixed
+    # with hedges; hedges only stand in for a primary that has none
+    stale_primary = any(
+        name not in fallbacks and name not in listings and catalog.count([name])
+        for name in result.status
     )
+    for name, status in result.status.items():
+        # Hedges that weren't needed leave the gallery; failures keep their last listing
+        if status == 'skipped' or (stale_primary and name in fallbacks):
+            listings[name] = []
+    return listings
 
 
-# Contact command - share Telegram contact
-@bot.message_handler(commands=['contact'])
-def contact_command(message: Message):
-    contact_text = """
-📞 *Let's Connect!*
+def store_upload(stream, filename, title, batch_id=None, digest=None):
+    """Upload job handler: store in the highest-priority writable backend"""
+    if batch_id:
+        # The catalog is refreshed once the whole batch is stored
+        with catalog_sync.suppressed():
+            return storage.upload(stream, filename, title, digest=digest)
+    backend, result = storage.upload(stream, filename, title, digest=digest)
+    if result:
+        catalog_sync.trigger('storage')
+    return backend, result
 
-Sharing your contact info helps me:
-• Reach out to discuss your project
-• Send you updates and previews
-• Provide better customer service
 
-*Simply tap the "Share My Contact" button below* 👇
+def gallery_sources():
+    """Catalog sources shown in the gallery"""
+    return [backend.name for backend in storage.backends]
 
-Your privacy is important - I'll only use your contact for project-related communication. 🤝
-    """
 
-    bot.send_message(
-        message.chat.id,
-        contact_text,
-        parse_mode='Markdown',
-        reply_markup=create_contact_keyboard()
-    )
+# Bot menu: commands and button labels -> prebuilt replies (hot reloaded)
+menu = MenuEngine(
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'bot_content.json'),
+    reload_interval=float(os.environ.get("MENU_RELOAD_INTERVAL", 5))
+)
 
 
 # Handle shared contact information
@@ -160,11 +340,11 @@ I'll reach out to you shortly to discuss how we can work together. In the meanti
     """
 
     # Send confirmation to user
-    bot.send_message(
+    outbox.send_message(
         message.chat.id,
         user_info,
         parse_mode='Markdown',
-        reply_markup=create_main_keyboard()
+        reply_markup=menu.keyboard('main')
     )
 
     # Send notification to admin (you)
@@ -179,360 +359,248 @@ I'll reach out to you shortly to discuss how we can work together. In the meanti
 *Reach out and start a conversation!* 🚀
     """
 
-    bot.send_message(CHAT_ID, admin_notification, parse_mode='Markdown')
-
-
-# Portfolio command
-@bot.message_handler(commands=['portfolio'])
-def portfolio_command(message: Message):
-    portfolio_text = """
-🎨 *My Portfolio Highlights*
-
-Here's a glimpse of my creative work:
-
-✨ *Brand Identity & Logos*
-• Complete brand packages
-• Logo design & variations
-• Business card designs
-
-✨ *Posters & Flyers*
-• Event promotions
-• Concert posters
-• Marketing materials
-
-✨ *Digital Art*
-• Custom illustrations
-• Tech-themed artwork
-• Creative compositions
-
-✨ *Social Media Graphics*
-• Instagram posts & stories
-• Facebook covers
-• Twitter headers
-
-*Want to see more?* 
-Visit my online portfolio or check out my Instagram: @firaolanbessaofficial 📱
-    """
-
-    bot.send_message(message.chat.id, portfolio_text, parse_mode='Markdown')
-
-
-# Services command
-@bot.message_handler(commands=['services'])
-def services_command(message: Message):
-    services_text = """
-🛠️ *My Services*
-
-I offer a wide range of design services:
-
-🎯 *Branding & Identity*
-• Logo Design
-• Brand Guidelines
-• Business Cards
-• Letterheads
-
-🎯 *Print Design*
-• Posters & Flyers
-• Brochures
-• Magazine Layouts
-• Product Packaging
-
-🎯 *Digital Design*
-• Social Media Graphics
-• Web Banners
-• Email Templates
-• Presentation Designs
-
-🎯 *Illustration*
-• Custom Illustrations
-• Character Design
-• Digital Artwork
-• Concept Art
-
-*Don't see what you need?* 
-Just ask! I'm always open to new challenges. 💪
-    """
-
-    bot.send_message(message.chat.id, services_text, parse_mode='Markdown')
-
-
-# Pricing command
-@bot.message_handler(commands=['pricing'])
-def pricing_command(message: Message):
-    pricing_text = """
-💰 *Pricing Overview*
-
-I believe in transparent, fair pricing:
-
-🎨 *Logo Design*
-• Negotiable
-• Basic Logo: $50-$100
-• Complete Brand Package: $150-$300
-
-📄 *Poster/Flyer Design*
-• Negotiable
-• Single Design: $30-$60
-• Multiple Variations: $80-$150
-
-📱 *Social Media Package*
-• Negotiable
-• Monthly Package (10 posts): $200-$400
-• Single Posts: $25 each
-
-🖼️ *Custom Illustrations*
-• Negotiable
-• Simple Illustration: $50-$100
-• Complex Artwork: $100-$250
-
-*Note:* All prices are starting points. Final quotes depend on project complexity and requirements.
-
-💡 *Ready to get a custom quote?*
-Share your contact or send me a message with your project details!
-    """
-
-    bot.send_message(message.chat.id, pricing_text, parse_mode='Markdown')
-
-
-# Social media command
-@bot.message_handler(commands=['social'])
-def social_command(message: Message):
-    social_text = """
-📱 *Let's Connect on Social Media!*
-
-Follow me for daily inspiration and updates:
-
-📸 *Instagram:* @firaolanbessaofficial
-🎨 *Behance:* https://behance.net/firaoldebesa1
-💼 *Dribbble:* https://dribbble.com/firanova
-📱 *LinkedIn:* https://linkedin.com/in/firaolanbessaofficial
-
-*Why follow me?*
-• See my latest work
-• Get design tips and tricks
-• Be the first to know about special offers
-• Join my creative community
-
-I love connecting with fellow creatives and clients! 🤝
-    """
-
-    bot.send_message(message.chat.id, social_text, parse_mode='Markdown')
+    outbox.send_message(CHAT_ID, admin_notification, priority=PRIORITY_HIGH, parse_mode='Markdown')
 
 
-# Help command
-@bot.message_handler(commands=['help'])
-def help_command(message: Message):
-    help_text = """
-🆘 *How Can I Help You?*
-
-Here are all the commands you can use:
-
-/start - Welcome message and introduction
-/contact - Share your contact information
-/portfolio - View my design portfolio
-/services - See all services I offer
-/pricing - Check my pricing structure
-/social - Find me on social media
-/help - Show this help message
-
-*Quick Actions:*
-• Use the menu buttons for easy navigation
-• Share your contact to start a project discussion
-• Check my portfolio to see my style
-
-*Having issues?*
-If something isn't working or you have questions, just type your question and I'll help you out!
-
-*Ready to create something amazing?* 🚀
-    """
-
-    bot.send_message(message.chat.id, help_text, parse_mode='Markdown')
-
-
-# Handle text messages for button responses
+# Commands and button presses are answered from the menu content file
 @bot.message_handler(func=lambda message: True)
 def handle_all_messages(message: Message):
-    text = message.text.lower()
-
-    if text == '💼 portfolio':
-        portfolio_command(message)
-    elif text == '🎨 services':
-        services_command(message)
-    elif text == '💰 pricing':
-        pricing_command(message)
-    elif text == '📱 social media':
-        social_command(message)
-    elif text == '🆘 help':
-        help_command(message)
-    elif text == '↩️ back to main menu':
-        bot.send_message(
-            message.chat.id,
-            "🏠 *Back to Main Menu*",
-            parse_mode='Markdown',
-            reply_markup=create_main_keyboard()
-        )
-    else:
-        # Friendly response for unrecognized messages
-        bot.send_message(
-            message.chat.id,
-            "😊 I'm here to help! Use the commands or menu buttons to explore what I can do for you.\n\nTry /help to see all available options!",
-            parse_mode='Markdown',
-            reply_markup=create_main_keyboard()
-        )
+    for payload in menu.reply_for(message.text):
+        outbox.send_message(message.chat.id, **payload)
 
 
 # Flask routes for your website
 @app.route('/')
 def home():
     # Redirect to Vercel frontend
-    return f'<script>window.location.href="https://graphicdesign-pink.vercel.app"</script>'
+    return '<script>window.location.href="https://graphicdesign-pink.vercel.app"</script>'
 
 @app.route('/health')
 def health():
     return {'status': 'ok', 'message': 'Backend is running'}
 
-@app.route('/migrate-images')
+@app.route('/health/http')
+def health_http():
+    """Outbound connection pool statistics"""
+    return jsonify(http_pools.stats())
+
+@app.route('/health/circuits')
+def health_circuits():
+    """Circuit breaker state of remote dependencies"""
+    breakers = [cloudinary_manager.breaker] if cloudinary_manager else []
+    return jsonify({breaker.name: breaker.status() for breaker in breakers})
+
+@app.route('/metrics')
+def metrics():
+    """Prometheus metrics"""
+    return registry.render(), 200, {'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'}
+
+@app.route('/migrate-images', methods=['GET', 'POST'])
 def migrate_images():
-    """Migrate local images to Cloudinary"""
+    """Start migrating local images to Cloudinary in the background"""
     if not cloudinary_manager:
         return jsonify({'error': 'Cloudinary not configured'}), 500
     
-    try:
-        from migrate_to_cloudinary import migrate_local_images
-        migrate_local_images()
-        return jsonify({'success': True, 'message': 'Migration completed'})
-    except Exception as e:
-        return jsonify({'error': str(e)}), 500
+    started = migration_job.start()
+    return jsonify({
+        'success': True,
+        'started': started,
+        'message': 'Migration started' if started else 'Migration already running',
+        'status_url': url_for('migrate_images_status')
+    }), 202
+
+
+@app.route('/migrate-images/status')
+def migrate_images_status():
+    """Report progress of the current or last migration"""
+    if not cloudinary_manager:
+        return jsonify({'error': 'Cloudinary not configured'}), 500
+    return jsonify(migration_job.status())
 
 
 @app.route('/api/images')
 def api_images():
-    """Return paginated images from both local storage and Google Drive."""
-    page = int(request.args.get('page', 1))
-    per_page = int(request.args.get('per_page', 6))
-    
-    print(f"API Images called: page={page}, per_page={per_page}")
-    
-    all_images = []
-    
-    # Get Cloudinary images (primary source)
-    if cloudinary_manager:
-        try:
-            cloudinary_images = cloudinary_manager.get_all_images()
-            all_images.extend(cloudinary_images)
-            print(f"Loaded {len(cloudinary_images)} images from Cloudinary")
-        except Exception as e:
-            print(f"Error fetching Cloudinary images: {e}")
-    
-    # Fallback to local images if Cloudinary not available
-    if not cloudinary_manager or len(all_images) == 0:
-        print("Loading local images as fallback...")
-        images_dir = os.path.join(app.static_folder, 'images')
-        if os.path.isdir(images_dir):
-            supported_exts = {'.jpg', '.jpeg', '.png', '.gif', '.webp'}
-            for name in os.listdir(images_dir):
-                ext = os.path.splitext(name)[1].lower()
-                if ext in supported_exts:
-                    file_url = url_for('static', filename=f'images/{name}')
-                    base = os.path.splitext(name)[0]
-                    title = base.replace('_', ' ').replace('-', ' ').title()
-                    all_images.append({
-                        'src': file_url,
-                        'title': title,
-                    })
-            print(f"Loaded {len(all_images)} local images as fallback")
+    """Return a page of the image catalog, by page number or keyset cursor."""
+    try:
+        page = int(request.args.get('page', 1))
+        per_page = int(request.args.get('per_page', 6))
+    except ValueError:
+        return jsonify({'error': 'page and per_page must be integers'}), 400
+    if page < 1 or not 1 <= per_page <= API_MAX_PER_PAGE:
+        return jsonify({'error': f'page must be at least 1 and per_page between 1 and {API_MAX_PER_PAGE}'}), 400
+    sources = gallery_sources()
     
-    # Calculate pagination
-    total = len(all_images)
-    start = (page - 1) * per_page
-    end = start + per_page
-    paginated_images = all_images[start:end]
+    logger.debug("API images called: page=%s per_page=%s sources=%s", page, per_page, sources)
     
-    print(f"Returning {len(paginated_images)} images for page {page}")
+    # Cursor paging seeks straight to the next page on the catalog index
+    if 'cursor' in request.args:
+        cursor = request.args.get('cursor') or None
+        
+        def build_cursor_page():
+            try:
+                images, next_cursor = catalog.page_after(sources, cursor, per_page)
+            except ValueError:
+                abort(400, description='Invalid cursor')
+            return {
+                'images': images,
+                'pagination': {
+                    'per_page': per_page,
+                    'cursor': cursor,
+                    'next_cursor': next_cursor,
+                    'has_next': next_cursor is not None,
+                    'has_prev': cursor is not None
+                }
+            }
+        
+        return response_cache.json_response(
+            ('cursor', cursor, per_page, tuple(sources)), catalog.version(sources), build_cursor_page
+        )
     
-    response = {
-        'images': paginated_images,
-        'pagination': {
-            'page': page,
-            'per_page': per_page,
-            'total': total,
-            'pages': (total + per_page - 1) // per_page,
-            'has_next': end < total,
-            'has_prev': page > 1
+    def build_page():
+        # Calculate pagination
+        total = catalog.count(sources)
+        start = (page - 1) * per_page
+        end = start + per_page
+        paginated_images = catalog.page(sources, start, per_page)
+        
+        logger.debug("Returning %d images for page %s", len(paginated_images), page)
+        
+        response = {
+            'images': paginated_images,
+            'pagination': {
+                'page': page,
+                'per_page': per_page,
+                'total': total,
+                'pages': (total + per_page - 1) // per_page,
+                'has_next': end < total,
+                'has_prev': page > 1
+            }
         }
-    }
+        
+        if LOG_PAYLOADS:
+            logger.debug("API response: %s", response)
+        return response
     
-    print(f"API Response: {response}")
-    return jsonify(response)
+    # Only queried, serialised and compressed when the page isn't cached already
+    return response_cache.json_response(
+        ('page', page, per_page, tuple(sources)), catalog.version(sources), build_page
+    )
+
+
+def upload_error(file):
+    """Why an uploaded file is rejected, or None"""
+    if file.filename == '':
+        logger.info("Upload rejected: empty filename")
+        return 'No file selected'
+    if not file.filename.lower().endswith(('.png', '.jpg', '.jpeg', '.gif', '.webp')):
+        logger.info("Upload rejected: invalid file type %s", file.filename)
+        return 'Invalid file type'
+    # The extension is only a claim; the header has to match a supported format
+    if probe_image(file.stream) is None:
+        logger.info("Upload rejected: %s is not a readable image", file.filename)
+        return 'Invalid image file'
+    return None
 
 
 @app.route('/api/upload', methods=['POST'])
 def upload_image():
-    """Upload image to Google Drive."""
-    print("Upload endpoint hit!")
-    
-    print(f"Files: {request.files}")
-    print(f"Form: {request.form}")
+    """Queue an image upload; poll the returned status URL for the result."""
+    if LOG_PAYLOADS:
+        logger.debug("Upload files=%s form=%s", request.files, request.form)
     
     if 'file' not in request.files:
-        print("No file in request")
+        logger.info("Upload rejected: no file in request")
         return jsonify({'error': 'No file provided'}), 400
     
     file = request.files['file']
     title = request.form.get('title', 'Untitled')
     
-    print(f"File: {file.filename}, Title: {title}")
+    logger.info("Upload received: %s", file.filename, extra={'title': title})
     
-    if file.filename == '':
-        print("Empty filename")
-        return jsonify({'error': 'No file selected'}), 400
+    error = upload_error(file)
+    if error:
+        return jsonify({'error': error}), 400
     
-    if not file.filename.lower().endswith(('.png', '.jpg', '.jpeg', '.gif', '.webp')):
-        print("Invalid file type")
-        return jsonify({'error': 'Invalid file type'}), 400
+    # Only the local copy happens here; a worker does the backend transfer
+    try:
+        job = upload_jobs.submit(file.stream, file.filename, title, chunk_size=UPLOAD_CHUNK_SIZE)
+    except Exception as e:
+        logger.exception("Upload exception")
+        return jsonify({'error': str(e)}), 500
     
-    # Try Cloudinary first
-    if cloudinary_manager:
-        try:
-            print("Processing Cloudinary upload...")
-            
-            # Read file into memory
-            file_content = file.read()
-            print(f"File size: {len(file_content)} bytes")
-            
-            # Upload to Cloudinary
-            result = cloudinary_manager.upload_image(file_content, file.filename, title)
-            print(f"Cloudinary upload result: {result}")
-            
-            if result:
-                return jsonify({'success': True, 'data': result})
-            else:
-                return jsonify({'error': 'Cloudinary upload failed'}), 500
-                
-        except Exception as e:
-            print(f"Cloudinary upload exception: {e}")
-            import traceback
-            traceback.print_exc()
-            return jsonify({'error': str(e)}), 500
+    logger.info("Upload queued as job %s (%d bytes)", job['job_id'], job['size'])
+    status_url = url_for('upload_status', job_id=job['job_id'])
+    response = jsonify({'success': True, 'job_id': job['job_id'], 'status': job['status'], 'status_url': status_url})
+    response.headers['Location'] = status_url
+    return response, 202
+
+
+@app.route('/api/upload/batch', methods=['POST'])
+def upload_batch():
+    """Queue many images from one request; each file is validated and uploaded on its own.
+    
+    Files are sent as repeated ``files`` fields, with optional ``titles`` in
+    the same order (the filename is used otherwise).
+    """
+    files = request.files.getlist('files')
+    titles = request.form.getlist('titles')
+    if not files:
+        logger.info("Batch upload rejected: no files in request")
+        return jsonify({'error': 'No files provided'}), 400
+    if len(files) > UPLOAD_BATCH_MAX_FILES:
+        logger.info("Batch upload rejected: %d files", len(files))
+        return jsonify({'error': f'At most {UPLOAD_BATCH_MAX_FILES} files per batch'}), 400
+    
+    results = []
+    accepted = []
+    for i, file in enumerate(files):
+        error = upload_error(file)
+        if error:
+            results.append({'filename': file.filename, 'error': error})
+            continue
+        title = titles[i] if i < len(titles) and titles[i] else os.path.splitext(file.filename)[0]
+        results.append({'filename': file.filename, 'title': title})
+        accepted.append((file.stream, file.filename, title))
+    
+    if not accepted:
+        return jsonify({'error': 'No valid files', 'files': results}), 400
     
-    # Fallback to local storage
-    print("Cloudinary not available - falling back to local storage")
     try:
-        filename = secure_filename(file.filename)
-        filepath = os.path.join(app.static_folder, 'images', filename)
-        file.save(filepath)
-        
-        file_url = url_for('static', filename=f'images/{filename}')
-        return jsonify({
-            'success': True, 
-            'data': {
-                'url': file_url,
-                'title': title,
-                'source': 'local'
-            }
-        })
+        batch_id, jobs = upload_jobs.submit_batch(accepted, chunk_size=UPLOAD_CHUNK_SIZE)
     except Exception as e:
-        print(f"Local save failed: {e}")
-        return jsonify({'error': 'Upload failed'}), 500
+        logger.exception("Batch upload exception")
+        return jsonify({'error': str(e)}), 500
+    
+    jobs = iter(jobs)
+    for entry in results:
+        if 'error' not in entry:
+            job = next(jobs)
+            entry.update(job_id=job['job_id'], status=job['status'])
+    
+    logger.info("Batch %s queued: %d of %d files", batch_id, len(accepted), len(files))
+    status_url = url_for('upload_batch_status', batch_id=batch_id)
+    response = jsonify({'success': True, 'batch_id': batch_id, 'status_url': status_url, 'files': results})
+    response.headers['Location'] = status_url
+    return response, 202
+
+
+@app.route('/api/upload/batch/<batch_id>')
+def upload_batch_status(batch_id):
+    """Per-file status of a batch upload."""
+    batch = upload_jobs.get_batch(batch_id)
+    if batch is None:
+        return jsonify({'error': 'Unknown upload batch'}), 404
+    return jsonify(batch)
+
+
+@app.route('/api/upload/<job_id>')
+def upload_status(job_id):
+    """Status and progress of a queued upload; the stored image once done."""
+    job = upload_jobs.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Unknown upload job'}), 404
+    return jsonify(job)
+
 
 @app.route('/submit-order', methods=['POST'])
 def submit_order():
@@ -541,11 +609,13 @@ def submit_order():
     project_type = request.form.get('project_type')
     description = request.form.get('description')
 
-    print("New Order Received:")
-    print("Name:", name)
-    print("Email:", email)
-    print("Project Type:", project_type)
-    print("Description:", description)
+    logger.info("New order received", extra={
+        'order_name': name,
+        'order_email': email,
+        'project_type': project_type,
+    })
+    if LOG_PAYLOADS:
+        logger.debug("Order description: %s", description)
 
     message = f"""
 📩 *New Graphic Design Request*  
@@ -556,17 +626,35 @@ def submit_order():
 {description}
     """
 
-    # Send message to your Telegram
-    url = f"https://api.telegram.org/bot{token}/sendMessage"
-    payload = {
-        "chat_id": CHAT_ID,
-        "text": message,
-        "parse_mode": "Markdown"
-    }
-    requests.post(url, data=payload)
+    # Queue message to your Telegram
+    outbox.send_message(CHAT_ID, message, priority=PRIORITY_HIGH, parse_mode='Markdown')
 
     # Redirect back to Vercel frontend with success message
-    return f'<script>window.location.href="https://graphicdesign-pink.vercel.app?success=true"</script>'
+    return '<script>window.location.href="https://graphicdesign-pink.vercel.app?success=true"</script>'
+
+
+@app.route('/telegram/webhook', methods=['POST'])
+def telegram_webhook():
+    """Receive bot updates pushed by Telegram"""
+    if BOT_MODE != "webhook":
+        return jsonify({'error': 'Webhook mode disabled'}), 404
+    if not webhook_dispatcher.verify(request.headers.get(SECRET_HEADER)):
+        return jsonify({'error': 'Forbidden'}), 403
+    
+    # Telegram redelivers the update later if we refuse it now
+    if not webhook_dispatcher.submit(request.get_data(as_text=True)):
+        return jsonify({'error': 'Busy'}), 503
+    return '', 200
+
+
+def start_bot_webhook():
+    """Point Telegram at our webhook route"""
+    if not WEBHOOK_URL:
+        logger.error("BOT_MODE=webhook but WEBHOOK_URL is not set - bot offline")
+        return
+    url = WEBHOOK_URL.rstrip('/') + '/telegram/webhook'
+    bot.set_webhook(url=url, secret_token=WEBHOOK_SECRET)
+    logger.info("Telegram webhook set to %s", url)
 
 
 def start_bot_polling():
@@ -574,48 +662,91 @@ def start_bot_polling():
     max_retries = 3
     retry_count = 0
     
+    # getUpdates is refused while a webhook is registered
+    bot.remove_webhook()
+    
     while retry_count < max_retries:
         try:
-            print(f"🤖 Starting Telegram Bot (attempt {retry_count + 1})...")
+            logger.info("Starting Telegram bot polling (attempt %d)", retry_count + 1)
             bot.polling(none_stop=True, interval=0, timeout=20)
             break
         except Exception as e:
             retry_count += 1
-            print(f"❌ Bot error (attempt {retry_count}): {e}")
+            logger.error("Bot error (attempt %d): %s", retry_count, e)
             if "409" in str(e) or "Conflict" in str(e):
-                print("Bot conflict - another instance running")
+                logger.warning("Bot conflict - another instance running")
                 if retry_count < max_retries:
-                    print(f"Waiting 30 seconds...")
+                    logger.info("Waiting 30 seconds before retrying")
                     import time
                     time.sleep(30)
                 else:
-                    print("Max retries reached - bot offline, Flask continues")
+                    logger.error("Max retries reached - bot offline, Flask continues")
                     break
             else:
                 import time
                 time.sleep(5)
 
 
-if __name__ == "__main__":
-    # Start bot polling in a separate thread with error isolation
-    def start_bot_safe():
-        try:
+def run_bot():
+    """Run the bot until it stops; used by whichever process holds the leader lock"""
+    try:
+        if BOT_MODE == "webhook":
+            start_bot_webhook()
+            # Keep leadership so other workers don't re-register the webhook
+            threading.Event().wait()
+        else:
             start_bot_polling()
-        except Exception as e:
-            print(f"Bot thread error (Flask continues): {e}")
+    except Exception:
+        logger.exception("Bot thread error (Flask continues)")
+
+
+_started = False
+_start_lock = threading.Lock()
+
+
+def create_app(role=None):
+    """Create this process's services and return the Flask app.
+
+    Safe to call more than once; only the first call starts anything. Every
+    process competes for the service lock, and the bot runner starts only if
+    this process's role allows it.
     
-    bot_thread = threading.Thread(target=start_bot_safe)
-    bot_thread.daemon = True
-    bot_thread.start()
-
-    print("🚀 Bot started successfully!")
-    print("💫 New features activated:")
-    print("   - Warm welcome messages")
-    print("   - Contact sharing")
-    print("   - Interactive menus")
-    print("   - Portfolio commands")
-    print("   - Pricing information")
-
-    # Start Flask app
+    Roles: "auto" - web process that also competes for the bot leader lock,
+    "web" - serve HTTP only, "bot" - dedicated bot runner.
+    """
+    global _started
+    role = (role or BOT_ROLE).lower()
+    with _start_lock:
+        if _started:
+            return app
+        _started = True
+
+        # Structured, queued logging
+        configure_logging(
+            level=os.environ.get("LOG_LEVEL", "INFO").upper(),
+            json_format=os.environ.get("LOG_FORMAT", "json") == "json"
+        )
+        init_services()
+        # Per-process workers: uploads are claimed from the shared job directory,
+        # and catalog syncs still run here when this process changes storage
+        upload_jobs.start()
+        catalog_sync.start()
+        service_leader.run_when_leader(run_services, retry_interval=BOT_LEADER_RETRY)
+        if role in ("auto", "bot"):
+            bot_leader.run_when_leader(run_bot, retry_interval=BOT_LEADER_RETRY)
+    return app
+
+
+if __name__ == "__main__":
+    if BOT_ROLE == "bot":
+        # Dedicated runner: no web server, just wait for leadership and run the bot
+        create_app("bot")
+        threading.Event().wait()
+
+    create_app()
+
+    logger.info("Bot runner started (mode=%s, role=%s)", BOT_MODE, BOT_ROLE)
+
+    # Start Flask development server (use wsgi.py under gunicorn in production)
     port = int(os.environ.get("PORT", 5000))
-    app.run("0.0.0.0", port=port, debug=False)
\ No newline at end of file
+    app.run("0.0.0.0", port=port, debug=False)
@@ -0,0 +1,114 @@
+import json
+import logging
+import os
+import threading
+import time
+
+from telebot.types import ReplyKeyboardMarkup, KeyboardButton
+
+logger = logging.getLogger(__name__)
+
+
+class MenuEngine:
+    """Data-driven bot menu loaded from a JSON content file.
+
+    Commands and button labels map straight to prebuilt reply payloads:
+    message text is joined and keyboards are serialised to ``reply_markup``
+    JSON once at load time, so answering a message is a dict lookup. The
+    file is re-read when its mtime changes (checked at most every
+    ``reload_interval`` seconds); a broken edit keeps the previous menu.
+    """
+
+    def __init__(self, path, reload_interval=5.0):
+        self.path = path
+        self.reload_interval = reload_interval
+        self._mtime = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+        self._commands = {}
+        self._buttons = {}
+        self._keyboards = {}
+        self._fallback = ()
+        self.reload()
+
+    def reload(self):
+        """Load the content file; returns False and keeps the old menu on error"""
+        with self._lock:
+            self._checked_at = time.monotonic()
+            try:
+                mtime = os.stat(self.path).st_mtime_ns
+                with open(self.path, encoding='utf-8') as f:
+                    content = json.load(f)
+                commands, buttons, keyboards, fallback = self._compile(content)
+            except (OSError, ValueError, KeyError, TypeError) as e:
+                logger.error("Failed to load bot menu from %s: %s", self.path, e)
+                return False
+            self._mtime = mtime
+            self._commands = commands
+            self._buttons = buttons
+            self._keyboards = keyboards
+            self._fallback = fallback
+            return True
+
+    def reply_for(self, text):
+        """Payloads answering a command or button label, else the fallback reply"""
+        self._maybe_reload()
+        if text.startswith('/'):
+            # "/start@MyBot payload" -> "start"
+            parts = text[1:].split(maxsplit=1)
+            command = parts[0].split('@', 1)[0].lower() if parts else ''
+            return self._commands.get(command, self._fallback)
+        return self._buttons.get(text.strip().lower(), self._fallback)
+
+    def keyboard(self, name):
+        """Pre-serialised reply_markup JSON for a named keyboard"""
+        self._maybe_reload()
+        return self._keyboards[name]
+
+    def _maybe_reload(self):
+        if time.monotonic() - self._checked_at < self.reload_interval:
+            return
+        self._checked_at = time.monotonic()
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+        except OSError:
+            return
+        if mtime != self._mtime:
+            self.reload()
+
+    def _compile(self, content):
+        parse_mode = content.get('parse_mode')
+
+        keyboards = {}
+        for name, rows in content.get('keyboards', {}).items():
+            markup = ReplyKeyboardMarkup(resize_keyboard=True)
+            for row in rows:
+                markup.add(*[
+                    KeyboardButton(button['text'], request_contact=button.get('request_contact'))
+                    for button in row
+                ])
+            keyboards[name] = markup.to_json()
+
+        replies = {}
+        commands = {}
+        buttons = {}
+        for name, item in content['menu'].items():
+            payloads = []
+            for message in item['messages']:
+                text = message['text']
+                if isinstance(text, list):
+                    text = '\n'.join(text)
+                payload = {'text': text}
+                if parse_mode:
+                    payload['parse_mode'] = parse_mode
+                if message.get('keyboard'):
+                    payload['reply_markup'] = keyboards[message['keyboard']]
+                payloads.append(payload)
+            replies[name] = tuple(payloads)
+            for command in item.get('commands', []):
+                commands[command.lower()] = replies[name]
+            for label in item.get('buttons', []):
+                buttons[label.lower()] = replies[name]
+
+        fallback = replies[content['fallback']] if content.get('fallback') else ()
+        return commands, buttons, keyboards, fallback
@@ -1,60 +1,268 @@
 import os
+import json
+import logging
+import time
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from cloudinary_manager import CloudinaryManager
+from leader_election import LeaderLock
 from dotenv import load_dotenv
 
+logger = logging.getLogger(__name__)
+
+SUPPORTED_EXTS = {'.jpg', '.jpeg', '.png', '.gif', '.webp'}
+MANIFEST_PATH = "migration_manifest.json"
+
+
+def file_sha256(path, chunk_size=1024 * 1024):
+    return _file_digest(hashlib.sha256(), path, chunk_size)
+
+
+def _file_digest(hasher, path, chunk_size=1024 * 1024):
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+
+def legacy_public_id(filename):
+    """Public ID earlier versions gave an uploaded file: named after it, not its content"""
+    return f"portfolio/{filename.split('.')[0]}"
+
+
+def legacy_match(resource, filepath):
+    """How a stem-named asset was matched to a local file: "etag", "bytes" or "name".
+
+    Uploads went through an incoming quality/format transformation, so the
+    stored bytes often differ from the file; the name was derived from the
+    file alone, which makes it the fallback.
+    """
+    if resource.get('etag') == _file_digest(hashlib.md5(), filepath):
+        return 'etag'
+    if resource.get('bytes') == os.path.getsize(filepath):
+        return 'bytes'
+    return 'name'
+
+
+class MigrationManifest:
+    """Content hash -> uploaded asset, saved after every upload so reruns resume"""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self.entries = {}
+        self.reload()
+
+    def reload(self):
+        """Pick up entries recorded since, e.g. by a migration in another process"""
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path) as f:
+                entries = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning("Ignoring unreadable manifest %s: %s", self.path, e)
+            return
+        with self._lock:
+            self.entries = entries
+
+    def __contains__(self, digest):
+        return digest in self.entries
+
+    def record(self, digest, entry):
+        with self._lock:
+            self.entries[digest] = entry
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, 'w') as f:
+                json.dump(self.entries, f, indent=2)
+            os.replace(tmp_path, self.path)
+
+
+class MigrationJob:
+    """Uploads static images to Cloudinary on a bounded thread pool.
+
+    A lock file next to the manifest lets only one process migrate at a
+    time, and the status is saved beside it so every process can report it.
+    """
+
+    def __init__(self, cloudinary_manager, images_dir="static/images",
+                 manifest_path=MANIFEST_PATH, max_workers=4):
+        self.cloudinary_manager = cloudinary_manager
+        self.images_dir = images_dir
+        self.manifest = MigrationManifest(manifest_path)
+        self.status_path = f"{manifest_path}.status"
+        self.max_workers = max_workers
+        self._run_lock = LeaderLock(f"{manifest_path}.lock")
+        self._lock = threading.Lock()
+        self._thread = None
+        self._status = {'state': 'idle'}
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        """Run the migration in a background thread; False if one is already running here or elsewhere"""
+        with self._lock:
+            if self.running or not self._run_lock.acquire():
+                return False
+            self._thread = threading.Thread(target=self.run, daemon=True)
+            self._thread.start()
+            return True
+
+    def status(self):
+        with self._lock:
+            if not self.running and os.path.exists(self.status_path):
+                # The last run may have been in another process
+                try:
+                    with open(self.status_path) as f:
+                        return json.load(f)
+                except (OSError, ValueError):
+                    pass
+            return dict(self._status, errors=list(self._status.get('errors', [])))
+
+    def run(self):
+        if not self._run_lock.acquire():
+            logger.warning("A migration is already running in another process")
+            return self.status()
+        try:
+            return self._run()
+        finally:
+            self._run_lock.release()
+
+    def _run(self):
+        with self._lock:
+            self._status = {
+                'state': 'running',
+                'started_at': time.time(),
+                'finished_at': None,
+                'total': 0,
+                'uploaded': 0,
+                'skipped': 0,
+                'adopted': 0,
+                'failed': 0,
+                'errors': [],
+            }
+        try:
+            self._migrate()
+            self._update(state='done')
+        except Exception as e:
+            logger.exception("Migration failed")
+            self._update(state='failed', error=str(e))
+        finally:
+            self._update(finished_at=time.time())
+        return self.status()
+
+    def _migrate(self):
+        if not os.path.isdir(self.images_dir):
+            raise FileNotFoundError(f"Images directory not found: {self.images_dir}")
+
+        logger.info("Scanning %s for images", self.images_dir)
+        self.manifest.reload()
+        pending = []
+        for filename in sorted(os.listdir(self.images_dir)):
+            if os.path.splitext(filename)[1].lower() not in SUPPORTED_EXTS:
+                continue
+            filepath = os.path.join(self.images_dir, filename)
+            digest = file_sha256(filepath)
+            if digest in self.manifest:
+                self._increment('skipped')
+            else:
+                pending.append((filename, filepath, digest))
+        if pending:
+            pending = self._adopt_legacy_assets(pending)
+        self._update(total=len(pending) + self._status['skipped'] + self._status['adopted'])
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            futures = [executor.submit(self._upload, *item) for item in pending]
+            for future in as_completed(futures):
+                future.result()
+
+    def _adopt_legacy_assets(self, pending):
+        """Record files already uploaded under their file name instead of uploading them again.
+
+        Assets are now named after their content hash, so files migrated by
+        earlier versions (``portfolio/<stem>``) aren't found by name; without
+        this step the first run would upload every one of them a second time.
+        """
+        legacy = {resource['public_id']: resource for resource in self.cloudinary_manager.iter_resources()}
+        remaining = []
+        for filename, filepath, digest in pending:
+            resource = legacy.get(legacy_public_id(filename))
+            if resource is None:
+                remaining.append((filename, filepath, digest))
+                continue
+            matched = legacy_match(resource, filepath)
+            self.manifest.record(digest, {
+                'filename': filename,
+                'public_id': resource['public_id'],
+                'url': resource['secure_url'],
+                'matched': matched,
+            })
+            logger.info("Already uploaded as %s (matched by %s): %s", resource['public_id'], matched, filename)
+            self._increment('adopted')
+        return remaining
+
+    def _upload(self, filename, filepath, digest):
+        title = os.path.splitext(filename)[0].replace('_', ' ').replace('-', ' ').title()
+        logger.info("Uploading: %s -> %s", filename, title)
+        try:
+            with open(filepath, 'rb') as f:
+                result = self.cloudinary_manager.upload_stream(f, filename, title, digest=digest)
+        except Exception as e:
+            result = None
+            logger.error("Error uploading %s: %s", filename, e)
+
+        if result:
+            self.manifest.record(digest, {
+                'filename': filename,
+                'public_id': result['id'],
+                'url': result['url'],
+            })
+            logger.info("Uploaded: %s -> %s", title, result['url'])
+            self._increment('uploaded')
+        else:
+            logger.error("Failed to upload: %s", filename)
+            with self._lock:
+                self._status['errors'].append(filename)
+            self._increment('failed')
+
+    def _increment(self, key):
+        with self._lock:
+            self._status[key] += 1
+        self._update()
+
+    def _update(self, **fields):
+        # Written under the lock, so the file never goes back to an older snapshot
+        with self._lock:
+            self._status.update(fields)
+            tmp_path = f"{self.status_path}.tmp"
+            with open(tmp_path, 'w') as f:
+                json.dump(self._status, f)
+            os.replace(tmp_path, self.status_path)
+
+
 def migrate_local_images():
     """Migrate all local images to Cloudinary"""
     load_dotenv()
-    
+
     try:
         cloudinary_manager = CloudinaryManager()
         print("✅ Cloudinary initialized")
     except Exception as e:
         print(f"❌ Failed to initialize Cloudinary: {e}")
         return
-    
-    images_dir = "static/images"
-    if not os.path.isdir(images_dir):
-        print(f"❌ Images directory not found: {images_dir}")
-        return
-    
-    supported_exts = {'.jpg', '.jpeg', '.png', '.gif', '.webp'}
-    uploaded_count = 0
-    failed_count = 0
-    
-    print(f"📁 Scanning {images_dir} for images...")
-    
-    for filename in os.listdir(images_dir):
-        ext = os.path.splitext(filename)[1].lower()
-        if ext not in supported_exts:
-            continue
-            
-        filepath = os.path.join(images_dir, filename)
-        title = os.path.splitext(filename)[0].replace('_', ' ').replace('-', ' ').title()
-        
-        print(f"📤 Uploading: {filename} -> {title}")
-        
-        try:
-            with open(filepath, 'rb') as f:
-                file_content = f.read()
-            
-            result = cloudinary_manager.upload_image(file_content, filename, title)
-            
-            if result:
-                print(f"✅ Uploaded: {title} -> {result['url']}")
-                uploaded_count += 1
-            else:
-                print(f"❌ Failed to upload: {filename}")
-                failed_count += 1
-                
-        except Exception as e:
-            print(f"❌ Error uploading {filename}: {e}")
-            failed_count += 1
-    
-    print(f"\n📊 Migration Summary:")
-    print(f"✅ Successfully uploaded: {uploaded_count}")
-    print(f"❌ Failed uploads: {failed_count}")
-    print(f"🎉 Migration complete!")
+
+    status = MigrationJob(cloudinary_manager).run()
+
+    print("\n📊 Migration Summary:")
+    print(f"✅ Successfully uploaded: {status['uploaded']}")
+    print(f"⏭️ Already migrated: {status['skipped']}")
+    print(f"🔗 Found under their old name: {status['adopted']}")
+    print(f"❌ Failed uploads: {status['failed']}")
+    print(f"🎉 Migration {status['state']}!")
 
 if __name__ == "__main__":
-    migrate_local_images()
\ No newline at end of file
+    logging.basicConfig(level=logging.INFO)
+    migrate_local_images()
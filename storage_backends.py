@@ -0,0 +1,299 @@
+import logging
+import os
+import re
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from urllib.parse import quote, unquote
+
+from werkzeug.utils import secure_filename
+
+logger = logging.getLogger(__name__)
+
+# Hedge after this long when a backend has no latency history yet
+DEFAULT_HEDGE_DELAY = 2.0
+LATENCY_WINDOW = 100
+# Leading hex digits of a SHA-256 compared to spot the same content in
+# different backends (local renditions are named by 16)
+CONTENT_KEY_LENGTH = 16
+# Cloudinary public ids made from the content hash: portfolio/<20 hex digits>
+HASHED_PUBLIC_ID = re.compile(r'[0-9a-f]{20}')
+
+
+class StorageBackend:
+    """Common interface of the places gallery images live.
+
+    ``list_images`` returns the backend's full listing and raises on
+    failure (an empty list means the backend really is empty). ``upload``
+    returns the stored image's details or None; ``digest`` is the SHA-256
+    of the content when the caller already knows it. Fallback backends are only
+    queried when the primary ones are slow, failing or empty.
+    """
+
+    name = None
+    fallback = False
+    writable = True
+
+    def __init__(self):
+        self._latencies = deque(maxlen=LATENCY_WINDOW)
+        self._latency_lock = threading.Lock()
+
+    @property
+    def available(self):
+        """False when calls are known to fail right now (e.g. an open circuit)"""
+        return True
+
+    def list_images(self):
+        raise NotImplementedError
+
+    def upload(self, stream, filename, title, digest=None):
+        raise NotImplementedError
+
+    def exists(self, result):
+        """Whether an earlier upload ``result`` is still stored (True when it can't be told cheaply)"""
+        return True
+
+    def key(self, image):
+        """Identity used to spot the same asset in several backends.
+
+        The content hash when the backend knows it, so copies match across
+        backends; otherwise the backend's own unique id, which never matches
+        another backend's.
+        """
+        digest = self.content_hash(image)
+        if digest:
+            return digest[:CONTENT_KEY_LENGTH]
+        return f"{self.name}:{image['id']}"
+
+    def content_hash(self, image):
+        """Hex SHA-256 (or a prefix of it) of the image's content, or None"""
+        return image.get('sha256')
+
+    def record_latency(self, seconds):
+        with self._latency_lock:
+            self._latencies.append(seconds)
+
+    def p95(self):
+        with self._latency_lock:
+            samples = sorted(self._latencies)
+        if not samples:
+            return None
+        return samples[min(len(samples) - 1, int(len(samples) * 0.95))]
+
+
+class CloudinaryBackend(StorageBackend):
+    name = 'cloudinary'
+
+    def __init__(self, manager, chunk_size):
+        super().__init__()
+        self.manager = manager
+        self.chunk_size = chunk_size
+
+    @property
+    def available(self):
+        return self.manager.breaker.available
+
+    def list_images(self):
+        # iter_images raises, unlike get_all_images which hides errors as []
+        return list(self.manager.iter_images())
+
+    def upload(self, stream, filename, title, digest=None):
+        return self.manager.upload_stream(stream, filename, title, chunk_size=self.chunk_size, digest=digest)
+
+    def content_hash(self, image):
+        # Older assets are named after their file and don't carry a hash
+        name = image['id'].rsplit('/', 1)[-1]
+        return name if HASHED_PUBLIC_ID.fullmatch(name) else None
+
+
+class DriveBackend(StorageBackend):
+    name = 'drive'
+    fallback = True
+
+    def __init__(self, manager):
+        super().__init__()
+        self.manager = manager
+
+    def list_images(self):
+        return self.manager.get_all_images()
+
+    def upload(self, stream, filename, title, digest=None):
+        return self.manager.upload_image_from_memory(stream.read(), filename, title)
+
+
+class LocalBackend(StorageBackend):
+    name = 'local'
+    fallback = True
+
+    def __init__(self, index):
+        super().__init__()
+        self.index = index
+
+    def list_images(self):
+        return self.index.images()
+
+    def upload(self, stream, filename, title, digest=None):
+        filename = secure_filename(filename)
+        if digest and os.path.exists(os.path.join(self.index.images_dir, filename)):
+            # Don't overwrite a different image that has the same name
+            stem, ext = os.path.splitext(filename)
+            filename = f"{stem}-{digest[:8]}{ext}"
+        with open(os.path.join(self.index.images_dir, filename), 'wb') as f:
+            while True:
+                chunk = stream.read(1024 * 1024)
+                if not chunk:
+                    break
+                f.write(chunk)
+        self.index.add(filename)
+        return {
+            'id': filename,
+            'url': f"{self.index.url_prefix}/{quote(filename)}",
+            'title': title,
+            'source': 'local'
+        }
+
+    def exists(self, result):
+        filename = result.get('id') or unquote(result['url'].rsplit('/', 1)[-1])
+        return os.path.exists(os.path.join(self.index.images_dir, filename))
+
+    def key(self, image):
+        # Listed images have no id; the filename is unique in the directory
+        digest = self.content_hash(image)
+        if digest:
+            return digest[:CONTENT_KEY_LENGTH]
+        return f"{self.name}:{unquote(image['original'].rsplit('/', 1)[-1])}"
+
+
+class ListingResult:
+    def __init__(self):
+        # backend name -> de-duplicated images, for backends that answered
+        self.listings = {}
+        # backend name -> ok / empty / error / timeout / skipped
+        self.status = {}
+
+
+class StorageRouter:
+    """Queries storage backends concurrently within a latency budget.
+
+    Primary backends are all queried at once. Fallback backends are added
+    as a hedge when a primary runs past its own p95 latency, fails, or
+    comes back empty. Whatever has answered when the budget runs out is
+    merged in backend order, dropping images whose key an earlier backend
+    listed; a backend's own listing is never de-duplicated.
+    """
+
+    def __init__(self, backends, budget=10.0, max_workers=8):
+        self.backends = list(backends)
+        self.budget = budget
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='storage')
+
+    def get(self, name):
+        for backend in self.backends:
+            if backend.name == name:
+                return backend
+        return None
+
+    def list_images(self, budget=None):
+        started = time.monotonic()
+        deadline = started + (budget or self.budget)
+        primaries = [b for b in self.backends if not b.fallback]
+        fallbacks = [b for b in self.backends if b.fallback]
+        hedge_delays = [b.p95() for b in primaries]
+        hedge_at = started + min((d for d in hedge_delays if d is not None), default=DEFAULT_HEDGE_DELAY)
+
+        result = ListingResult()
+        answers = {}
+        pending = {self._submit(backend): backend for backend in primaries}
+        hedged = not fallbacks
+        if not primaries:
+            pending.update({self._submit(backend): backend for backend in fallbacks})
+            hedged = True
+
+        while pending:
+            now = time.monotonic()
+            if now >= deadline:
+                break
+            timeout = deadline - now if hedged else max(0.0, min(hedge_at, deadline) - now)
+            done, _ = wait(list(pending), timeout=timeout, return_when=FIRST_COMPLETED)
+            for future in done:
+                backend = pending.pop(future)
+                try:
+                    answers[backend.name] = future.result()
+                except Exception as e:
+                    logger.warning("Listing %s failed: %s", backend.name, e)
+                    result.status[backend.name] = 'error'
+
+            primary_ok = any(answers.get(b.name) for b in primaries)
+            primary_pending = any(b in primaries for b in pending.values())
+            if primary_ok and not primary_pending:
+                # Primaries answered with images; fallbacks aren't needed
+                break
+            if not hedged and (time.monotonic() >= hedge_at or not primary_pending
+                               or any(result.status.get(b.name) == 'error' for b in primaries)):
+                logger.info("Hedging listing with %s", ', '.join(b.name for b in fallbacks))
+                pending.update({self._submit(backend): backend for backend in fallbacks})
+                hedged = True
+
+        if any(answers.get(b.name) for b in primaries):
+            # The primaries delivered, so hedges that answered or still run aren't used
+            for backend in fallbacks:
+                answers.pop(backend.name, None)
+                result.status[backend.name] = 'skipped'
+            pending = {}
+        for backend in pending.values():
+            result.status[backend.name] = 'timeout'
+
+        seen = set()
+        for backend in self.backends:
+            if backend.name in answers:
+                images = []
+                keys = set()
+                for image in answers[backend.name]:
+                    key = backend.key(image)
+                    keys.add(key)
+                    if key not in seen:
+                        images.append(image)
+                seen |= keys
+                result.listings[backend.name] = images
+                result.status[backend.name] = 'ok' if images else 'empty'
+            result.status.setdefault(backend.name, 'skipped')
+        return result
+
+    def upload(self, stream, filename, title, digest=None):
+        """Store in the first writable, available backend that accepts the upload.
+
+        A backend whose upload fails (returns None or raises, e.g. rejected
+        by its circuit breaker) is skipped and the stream rewound for the
+        next one. Returns (backend name, result); the result is None when
+        every backend failed.
+        """
+        start = stream.tell()
+        name = None
+        for backend in self.backends:
+            if not (backend.writable and backend.available):
+                continue
+            if name is not None:
+                logger.warning("Upload to %s failed; trying %s", name, backend.name)
+                stream.seek(start)
+            name = backend.name
+            try:
+                result = backend.upload(stream, filename, title, digest=digest)
+            except Exception as e:
+                logger.error("Upload to %s failed: %s", backend.name, e)
+                result = None
+            if result:
+                return name, result
+        return name, None
+
+    def asset_exists(self, name, result):
+        """Whether an upload stored in backend ``name`` is still there"""
+        backend = self.get(name)
+        return backend is not None and backend.exists(result)
+
+    def _submit(self, backend):
+        started = time.monotonic()
+        future = self._executor.submit(backend.list_images)
+        # Record latency even for calls the router stopped waiting for
+        future.add_done_callback(lambda f: backend.record_latency(time.monotonic() - started))
+        return future
@@ -0,0 +1,267 @@
+import heapq
+import itertools
+import json
+import logging
+import sqlite3
+import threading
+import time
+from collections import deque
+
+from telebot.apihelper import ApiTelegramException
+
+from metrics import telegram_latency, telegram_errors
+
+logger = logging.getLogger(__name__)
+
+PRIORITY_HIGH = 0
+PRIORITY_NORMAL = 1
+PRIORITY_LOW = 2
+
+# The sending process moves spooled messages into its queue this often (seconds)
+SPOOL_INTERVAL = 0.5
+SPOOL_BATCH = 100
+
+SPOOL_SCHEMA = """
+CREATE TABLE IF NOT EXISTS outbox (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    chat_id TEXT NOT NULL,
+    text TEXT NOT NULL,
+    priority INTEGER NOT NULL,
+    kwargs TEXT NOT NULL,
+    created_at REAL NOT NULL
+);
+"""
+
+
+class OutboundMessage:
+    def __init__(self, chat_id, text, priority, kwargs):
+        self.chat_id = chat_id
+        self.text = text
+        self.priority = priority
+        self.kwargs = kwargs
+        self.attempts = 0
+
+
+class OutboxSpool:
+    """SQLite file of messages queued by processes that don't run the sender.
+
+    Every process can ``put``; the one running the outbox ``take``s them in
+    insertion order, so the rate limits hold across all of them.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+
+    def _conn(self):
+        # sqlite3 connections can't be shared between threads
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(SPOOL_SCHEMA)
+            self._local.conn = conn
+        return conn
+
+    def put(self, chat_id, text, priority, kwargs):
+        conn = self._conn()
+        with conn:
+            conn.execute(
+                "INSERT INTO outbox (chat_id, text, priority, kwargs, created_at) VALUES (?, ?, ?, ?, ?)",
+                (json.dumps(chat_id), text, priority, json.dumps(kwargs), time.time())
+            )
+
+    def take(self, limit=SPOOL_BATCH):
+        """Remove and return up to ``limit`` of the oldest messages"""
+        conn = self._conn()
+        with conn:
+            rows = conn.execute(
+                "SELECT id, chat_id, text, priority, kwargs FROM outbox ORDER BY id LIMIT ?", (limit,)
+            ).fetchall()
+            if rows:
+                conn.execute("DELETE FROM outbox WHERE id <= ?", (rows[-1][0],))
+        return [
+            OutboundMessage(json.loads(chat_id), text, priority, json.loads(kwargs))
+            for _, chat_id, text, priority, kwargs in rows
+        ]
+
+    def depth(self):
+        return self._conn().execute("SELECT COUNT(*) FROM outbox").fetchone()[0]
+
+
+class TelegramOutbox:
+    """Queued, rate-limited sender for outgoing bot messages.
+
+    Callers only enqueue. Messages for one chat stay in order and are spaced
+    by the per-chat interval; all sends share a global rate limit. A 429
+    reply pauses the chat for ``retry_after`` seconds, other transient
+    failures are retried with exponential backoff.
+
+    Only one process should send. With a ``spool``, messages queued while
+    this outbox isn't started are written there, and ``start`` also moves
+    spooled messages (from any process) into the queue.
+    """
+
+    def __init__(self, bot, workers=4, global_rate=30, chat_interval=1.0,
+                 group_interval=3.0, max_retries=5, backoff=1.0, spool=None):
+        self.bot = bot
+        self.spool = spool
+        self.workers = workers
+        self.global_interval = 1.0 / global_rate
+        self.chat_interval = chat_interval
+        self.group_interval = group_interval
+        self.max_retries = max_retries
+        self.backoff = backoff
+
+        self._chats = {}         # chat_id -> deque of pending messages
+        self._scheduled = set()  # chats currently in the ready or delayed heap
+        self._ready = []         # (priority, seq, chat_id)
+        self._delayed = []       # (ready_at, seq, chat_id)
+        self._seq = itertools.count()
+        self._next_global = 0.0
+        self._global_lock = threading.Lock()
+        self._cond = threading.Condition()
+        self._threads = []
+        self._running = False
+
+    def start(self):
+        with self._cond:
+            if self._running:
+                return
+            self._running = True
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._worker, name=f"telegram-outbox-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        if self.spool:
+            thread = threading.Thread(target=self._drain_spool, name="telegram-outbox-spool", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self):
+        with self._cond:
+            self._running = False
+            self._cond.notify_all()
+
+    def send_message(self, chat_id, text, priority=PRIORITY_NORMAL, **kwargs):
+        """Queue a ``bot.send_message`` call; returns immediately"""
+        if self.spool and not self._running:
+            # Another process sends
+            self.spool.put(chat_id, text, priority, kwargs)
+            return
+        self._enqueue(OutboundMessage(chat_id, text, priority, kwargs))
+
+    def depth(self):
+        """Number of messages waiting to be sent"""
+        with self._cond:
+            queued = sum(len(pending) for pending in self._chats.values())
+        return queued + (self.spool.depth() if self.spool else 0)
+
+    def _enqueue(self, message):
+        with self._cond:
+            self._chats.setdefault(message.chat_id, deque()).append(message)
+            if message.chat_id not in self._scheduled:
+                self._schedule(message.chat_id, time.monotonic())
+            self._cond.notify()
+
+    def _drain_spool(self):
+        while self._running:
+            try:
+                messages = self.spool.take()
+            except Exception:
+                logger.exception("Reading the outbox spool failed")
+                messages = []
+            for message in messages:
+                self._enqueue(message)
+            if len(messages) < SPOOL_BATCH:
+                time.sleep(SPOOL_INTERVAL)
+
+    def _schedule(self, chat_id, ready_at):
+        # Caller holds self._cond
+        self._scheduled.add(chat_id)
+        if ready_at <= time.monotonic():
+            head = self._chats[chat_id][0]
+            heapq.heappush(self._ready, (head.priority, next(self._seq), chat_id))
+        else:
+            heapq.heappush(self._delayed, (ready_at, next(self._seq), chat_id))
+
+    def _next_chat(self):
+        with self._cond:
+            while self._running:
+                now = time.monotonic()
+                while self._delayed and self._delayed[0][0] <= now:
+                    _, _, chat_id = heapq.heappop(self._delayed)
+                    head = self._chats[chat_id][0]
+                    heapq.heappush(self._ready, (head.priority, next(self._seq), chat_id))
+                if self._ready:
+                    return heapq.heappop(self._ready)[2]
+                timeout = self._delayed[0][0] - now if self._delayed else None
+                self._cond.wait(timeout)
+            return None
+
+    def _worker(self):
+        while True:
+            chat_id = self._next_chat()
+            if chat_id is None:
+                return
+            with self._cond:
+                message = self._chats[chat_id][0]
+            delay = self._deliver(message)
+            with self._cond:
+                pending = self._chats[chat_id]
+                if delay is None:
+                    pending.popleft()
+                    delay = self._interval_for(chat_id)
+                if pending:
+                    self._schedule(chat_id, time.monotonic() + delay)
+                    self._cond.notify()
+                else:
+                    del self._chats[chat_id]
+                    self._scheduled.discard(chat_id)
+
+    def _deliver(self, message):
+        """Send one message. Returns None when done, or seconds to wait before a retry"""
+        self._acquire_global_slot()
+        message.attempts += 1
+        try:
+            with telegram_latency.time(method='sendMessage'):
+                self.bot.send_message(message.chat_id, message.text, **message.kwargs)
+            return None
+        except ApiTelegramException as e:
+            telegram_errors.inc(method='sendMessage', code=e.error_code)
+            if e.error_code == 429:
+                retry_after = (e.result_json or {}).get('parameters', {}).get('retry_after', 1)
+                logger.warning("Telegram rate limit for %s, retrying in %ss", message.chat_id, retry_after)
+                return retry_after
+            if e.error_code is not None and 400 <= e.error_code < 500:
+                # Bad request, bot blocked, chat not found... retrying won't help
+                logger.error("Dropping message to %s: %s", message.chat_id, e)
+                return None
+            error = e
+        except Exception as e:
+            telegram_errors.inc(method='sendMessage', code='network')
+            error = e
+
+        if message.attempts >= self.max_retries:
+            logger.error("Giving up on message to %s after %d attempts: %s",
+                         message.chat_id, message.attempts, error)
+            return None
+        delay = self.backoff * 2 ** (message.attempts - 1)
+        logger.warning("Telegram send failed (%s), retrying in %ss", error, delay)
+        return delay
+
+    def _acquire_global_slot(self):
+        with self._global_lock:
+            now = time.monotonic()
+            slot = max(now, self._next_global)
+            self._next_global = slot + self.global_interval
+        if slot > now:
+            time.sleep(slot - now)
+
+    def _interval_for(self, chat_id):
+        # Group and channel chats have negative ids and a stricter limit
+        try:
+            is_group = int(chat_id) < 0
+        except (TypeError, ValueError):
+            is_group = str(chat_id).startswith('@')
+        return self.group_interval if is_group else self.chat_interval
@@ -0,0 +1,57 @@
+import hmac
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from telebot.types import Update
+
+logger = logging.getLogger(__name__)
+
+SECRET_HEADER = 'X-Telegram-Bot-Api-Secret-Token'
+
+
+class WebhookDispatcher:
+    """Hands webhook updates to the bot on a bounded worker pool.
+
+    At most ``max_pending`` updates are queued or running at once. When the
+    pool is full ``submit`` returns False so the route can answer with an
+    error and let Telegram redeliver the update later.
+    """
+
+    def __init__(self, bot, secret_token, workers=4, max_pending=100):
+        self.bot = bot
+        self.secret_token = secret_token
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='telegram-update')
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self.pending = 0
+        self._pending_lock = threading.Lock()
+
+    def verify(self, header_value):
+        return hmac.compare_digest(header_value or '', self.secret_token)
+
+    def submit(self, body):
+        """Queue a raw update body; False when the pool is saturated"""
+        if not self._slots.acquire(blocking=False):
+            return False
+        self._track(1)
+        try:
+            self._executor.submit(self._process, body)
+        except Exception:
+            self._track(-1)
+            self._slots.release()
+            raise
+        return True
+
+    def _process(self, body):
+        try:
+            update = Update.de_json(body)
+            self.bot.process_new_updates([update])
+        except Exception:
+            logger.exception("Failed to process Telegram update")
+        finally:
+            self._track(-1)
+            self._slots.release()
+
+    def _track(self, delta):
+        with self._pending_lock:
+            self.pending += delta
@@ -1,10 +1,16 @@
 import os
-from flask import Flask, jsonify, url_for, request
+from flask import Flask, jsonify, request
 from flask_cors import CORS
+from local_images import LocalImageIndex
 
 app = Flask(__name__)
 CORS(app, origins=['http://localhost:5173'])
 
+local_index = LocalImageIndex(
+    os.path.join(app.static_folder, 'images'),
+    f"{app.static_url_path}/images"
+)
+
 @app.route('/api/images')
 def api_images():
     page = int(request.args.get('page', 1))
@@ -12,30 +18,7 @@ def api_images():
     
     print(f"API Images called: page={page}, per_page={per_page}")
     
-    all_images = []
-    
-    # Get local images
-    images_dir = os.path.join(app.static_folder, 'images')
-    print(f"Images directory: {images_dir}")
-    print(f"Directory exists: {os.path.isdir(images_dir)}")
-    
-    if os.path.isdir(images_dir):
-        supported_exts = {'.jpg', '.jpeg', '.png', '.gif', '.webp'}
-        files = os.listdir(images_dir)
-        print(f"Found {len(files)} files in directory")
-        
-        for name in files:
-            ext = os.path.splitext(name)[1].lower()
-            if ext in supported_exts:
-                file_url = url_for('static', filename=f'images/{name}')
-                base = os.path.splitext(name)[0]
-                title = base.replace('_', ' ').replace('-', ' ').title()
-                all_images.append({
-                    'src': file_url,
-                    'title': title,
-                })
-                print(f"Added image: {title} -> {file_url}")
-    
+    all_images = local_index.images()
     print(f"Total images found: {len(all_images)}")
     
     # Calculate pagination
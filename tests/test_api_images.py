@@ -0,0 +1,42 @@
+import importlib
+
+import pytest
+
+from http_cache import JsonResponseCache
+from image_catalog import ImageCatalog
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    # telebot validates the token format when the module is imported
+    monkeypatch.setenv('token', '123456:test')
+    main = importlib.import_module('main')
+    catalog = ImageCatalog(str(tmp_path / 'catalog.db'))
+    catalog.replace_source('local', [{'id': f"l{i}", 'src': f"/l/{i}.jpg", 'title': f"L {i}"} for i in range(5)])
+    monkeypatch.setattr(main, 'catalog', catalog)
+    monkeypatch.setattr(main, 'gallery_sources', lambda: ['local'])
+    monkeypatch.setattr(main, 'response_cache', JsonResponseCache())
+    monkeypatch.setattr(main, 'API_MAX_PER_PAGE', 3)
+    return main.app.test_client()
+
+
+def test_pages_are_served(client):
+    body = client.get('/api/images?page=2&per_page=2').get_json()
+
+    assert [image['id'] for image in body['images']] == ['l2', 'l3']
+    assert body['pagination']['pages'] == 3
+
+    body = client.get('/api/images?cursor=&per_page=3').get_json()
+    assert [image['id'] for image in body['images']] == ['l0', 'l1', 'l2']
+    assert body['pagination']['has_next']
+
+
+@pytest.mark.parametrize('query', [
+    'page=0', 'page=-1', 'per_page=0', 'per_page=-1', 'per_page=4', 'page=x', 'per_page=1.5',
+    'cursor=&per_page=0', 'cursor=&per_page=-1', 'cursor=&per_page=4',
+])
+def test_invalid_paging_is_rejected(client, query):
+    response = client.get(f'/api/images?{query}')
+
+    assert response.status_code == 400
+    assert 'error' in response.get_json()
@@ -0,0 +1,34 @@
+import pytest
+
+from circuit_breaker import CLOSED, OPEN, CircuitBreaker, CircuitOpenError
+
+
+def _trip(breaker):
+    with pytest.raises(RuntimeError):
+        with breaker.guard():
+            raise RuntimeError("down")
+
+
+def test_unavailable_while_the_half_open_probe_is_out():
+    breaker = CircuitBreaker('test', failure_threshold=1, reset_timeout=0)
+    _trip(breaker)
+    assert breaker.state == OPEN
+    assert breaker.available
+
+    with breaker.guard():
+        # The probe is in flight: another call would be rejected
+        assert not breaker.available
+        with pytest.raises(CircuitOpenError):
+            breaker.before_call()
+
+    assert breaker.state == CLOSED
+    assert breaker.available
+
+
+def test_unavailable_while_open():
+    breaker = CircuitBreaker('test', failure_threshold=1, reset_timeout=60)
+    _trip(breaker)
+
+    assert not breaker.available
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
@@ -0,0 +1,49 @@
+import cloudinary.api
+import pytest
+
+from cloudinary_manager import CloudinaryManager
+from metrics import backend_errors, backend_latency
+from storage_backends import CloudinaryBackend
+
+
+def _resource(name):
+    return {'public_id': f"portfolio/{name}", 'context': {'custom': {'title': name}}}
+
+
+def _listing_calls():
+    return {dict(key).get('operation'): series[-1] for key, series in backend_latency._series.items()}
+
+
+@pytest.fixture
+def manager():
+    return CloudinaryManager()
+
+
+def test_listing_is_recorded_per_page(manager, monkeypatch):
+    pages = {None: ([_resource('a'), _resource('b')], 'next'), 'next': ([_resource('c')], None)}
+
+    def resources(next_cursor=None, **options):
+        images, cursor = pages[next_cursor]
+        return {'resources': images, 'next_cursor': cursor}
+
+    monkeypatch.setattr(cloudinary.api, 'resources', resources)
+    before = _listing_calls().get('list_page', 0)
+
+    images = CloudinaryBackend(manager, chunk_size=1).list_images()
+
+    assert [image['id'] for image in images] == ['portfolio/a', 'portfolio/b', 'portfolio/c']
+    assert _listing_calls()['list_page'] == before + 2
+
+
+def test_listing_errors_are_counted(manager, monkeypatch):
+    def resources(**options):
+        raise OSError("connection reset")
+
+    monkeypatch.setattr(cloudinary.api, 'resources', resources)
+    key = (('backend', 'cloudinary'), ('operation', 'list_page'))
+    before = backend_errors._values.get(key, 0)
+
+    with pytest.raises(OSError):
+        CloudinaryBackend(manager, chunk_size=1).list_images()
+
+    assert backend_errors._values[key] == before + 1
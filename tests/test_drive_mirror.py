@@ -0,0 +1,97 @@
+import httplib2
+from googleapiclient.errors import HttpError
+
+from drive_mirror import DriveMirror
+
+FOLDER = 'folder-1'
+
+
+class _Call:
+    def __init__(self, result):
+        self._result = result
+
+    def execute(self):
+        if isinstance(self._result, Exception):
+            raise self._result
+        return self._result
+
+
+class FakeDrive:
+    """The parts of the Drive v3 client the mirror uses, backed by dicts"""
+
+    def __init__(self, files, token='t1'):
+        self.files_in_folder = files
+        self.token = token
+        self.feed = {}         # page token -> changes.list response
+        self.list_calls = 0
+
+    def changes(self):
+        return self
+
+    def files(self):
+        return self
+
+    def getStartPageToken(self):
+        return _Call({'startPageToken': self.token})
+
+    def list(self, pageToken=None, q=None, **kwargs):
+        if q is not None:
+            self.list_calls += 1
+            return _Call({'files': list(self.files_in_folder)})
+        return _Call(self.feed.get(pageToken, HttpError(httplib2.Response({'status': 410}), b'gone')))
+
+
+def _file(file_id, name, **fields):
+    return dict({'id': file_id, 'name': name, 'mimeType': 'image/jpeg', 'parents': [FOLDER],
+                 'createdTime': '2026-01-01T00:00:00Z'}, **fields)
+
+
+def test_first_sync_lists_the_folder_and_saves_the_token(tmp_path):
+    drive = FakeDrive([_file('b', 'Beta.jpg'), _file('a', 'alpha.jpg')])
+    mirror = DriveMirror(str(tmp_path / 'mirror.json'))
+
+    assert mirror.sync(drive, FOLDER)
+
+    assert [image['id'] for image in mirror.images()] == ['a', 'b']
+    reloaded = DriveMirror(str(tmp_path / 'mirror.json'))
+    assert reloaded.start_page_token == 't1'
+    assert [image['title'] for image in reloaded.images()] == ['alpha', 'Beta']
+
+
+def test_changes_are_applied_from_the_feed(tmp_path):
+    drive = FakeDrive([_file('a', 'alpha.jpg'), _file('b', 'beta.jpg'), _file('c', 'gamma.jpg')])
+    mirror = DriveMirror(str(tmp_path / 'mirror.json'))
+    mirror.sync(drive, FOLDER)
+    drive.feed = {
+        't1': {'nextPageToken': 't2', 'changes': [
+            {'fileId': 'a', 'removed': True},
+            {'fileId': 'b', 'file': _file('b', 'beta.jpg', trashed=True)},
+        ]},
+        't2': {'newStartPageToken': 't3', 'changes': [
+            {'fileId': 'c', 'file': _file('c', 'renamed.jpg')},
+            {'fileId': 'd', 'file': _file('d', 'delta.jpg')},
+            {'fileId': 'e', 'file': _file('e', 'elsewhere.jpg', parents=['other'])},
+            {'fileId': 'f', 'file': _file('f', 'notes.txt', mimeType='text/plain')},
+        ]},
+    }
+
+    assert mirror.sync(drive, FOLDER)
+
+    assert [(image['id'], image['title']) for image in mirror.images()] == [('d', 'delta'), ('c', 'renamed')]
+    assert mirror.start_page_token == 't3'
+    assert drive.list_calls == 1
+
+
+def test_rejected_page_token_triggers_a_full_resync(tmp_path):
+    drive = FakeDrive([_file('a', 'alpha.jpg')])
+    mirror = DriveMirror(str(tmp_path / 'mirror.json'))
+    mirror.sync(drive, FOLDER)
+    # The saved token is no longer valid; the folder changed meanwhile
+    drive.files_in_folder = [_file('b', 'beta.jpg')]
+    drive.token = 't9'
+
+    assert mirror.sync(drive, FOLDER)
+
+    assert [image['id'] for image in mirror.images()] == ['b']
+    assert mirror.start_page_token == 't9'
+    assert drive.list_calls == 2
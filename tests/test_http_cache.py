@@ -0,0 +1,91 @@
+import gzip
+import json
+
+import pytest
+from flask import Flask
+
+from http_cache import JsonResponseCache
+
+PAYLOAD = {'images': [{'id': f"image-{i}", 'title': 'Untitled'} for i in range(50)]}
+
+
+@pytest.fixture
+def app():
+    app = Flask(__name__)
+    cache = JsonResponseCache(max_age=30, stale_while_revalidate=300)
+    app.builds = 0
+    app.version = 1
+
+    def build():
+        app.builds += 1
+        return PAYLOAD
+
+    @app.route('/images')
+    def images():
+        return cache.json_response(('page', 1), app.version, build)
+
+    return app
+
+
+def test_matching_etag_gets_a_304_without_building(app):
+    client = app.test_client()
+    first = client.get('/images')
+    etag = first.headers['ETag']
+
+    again = client.get('/images', headers={'If-None-Match': etag})
+
+    assert first.status_code == 200 and etag.startswith('W/')
+    assert again.status_code == 304 and again.data == b''
+    assert again.headers['ETag'] == etag
+    assert again.headers['Cache-Control'] == 'public, max-age=30, stale-while-revalidate=300'
+    assert app.builds == 1
+
+
+def test_new_catalog_version_changes_the_etag(app):
+    client = app.test_client()
+    etag = client.get('/images').headers['ETag']
+    app.version = 2
+
+    response = client.get('/images', headers={'If-None-Match': etag})
+
+    assert response.status_code == 200
+    assert response.headers['ETag'] != etag
+    assert app.builds == 2
+
+
+def test_gzip_and_identity_are_negotiated_and_built_once(app):
+    client = app.test_client()
+
+    gzipped = client.get('/images', headers={'Accept-Encoding': 'gzip'})
+    plain = client.get('/images', headers={'Accept-Encoding': 'identity'})
+
+    assert gzipped.headers['Content-Encoding'] == 'gzip'
+    assert json.loads(gzip.decompress(gzipped.data)) == PAYLOAD
+    assert 'Content-Encoding' not in plain.headers
+    assert json.loads(plain.data) == PAYLOAD
+    assert 'Accept-Encoding' in gzipped.headers['Vary']
+    assert app.builds == 1
+
+
+def test_brotli_is_preferred_when_available(app):
+    brotli = pytest.importorskip('brotli')
+    client = app.test_client()
+
+    response = client.get('/images', headers={'Accept-Encoding': 'gzip, br'})
+
+    assert response.headers['Content-Encoding'] == 'br'
+    assert json.loads(brotli.decompress(response.data)) == PAYLOAD
+
+
+def test_small_bodies_are_not_compressed():
+    app = Flask(__name__)
+    cache = JsonResponseCache()
+
+    @app.route('/small')
+    def small():
+        return cache.json_response('small', 1, lambda: {'ok': True})
+
+    response = app.test_client().get('/small', headers={'Accept-Encoding': 'gzip'})
+
+    assert 'Content-Encoding' not in response.headers
+    assert json.loads(response.data) == {'ok': True}
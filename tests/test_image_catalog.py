@@ -0,0 +1,77 @@
+import pytest
+
+from image_catalog import ImageCatalog
+
+
+def _images(prefix, count):
+    return [{'id': f"{prefix}{i}", 'src': f"/{prefix}/{i}.jpg", 'title': f"{prefix} {i}"} for i in range(count)]
+
+
+def _walk(catalog, sources, limit):
+    ids, cursor = [], None
+    while True:
+        images, cursor = catalog.page_after(sources, cursor, limit)
+        ids.extend(image['id'] for image in images)
+        if cursor is None:
+            return ids
+
+
+def test_keyset_pages_cover_every_source_in_order(tmp_path):
+    catalog = ImageCatalog(str(tmp_path / 'catalog.db'))
+    catalog.replace_source('local', _images('l', 4))
+    catalog.replace_source('cloudinary', _images('c', 3))
+
+    ids = _walk(catalog, ['cloudinary', 'local'], 2)
+
+    assert ids == ['c0', 'c1', 'c2', 'l0', 'l1', 'l2', 'l3']
+    assert ids == [image['id'] for image in catalog.page(['cloudinary', 'local'], 0, 10)]
+
+
+def test_keyset_page_boundaries(tmp_path):
+    catalog = ImageCatalog(str(tmp_path / 'catalog.db'))
+    catalog.replace_source('cloudinary', _images('c', 4))
+
+    images, cursor = catalog.page_after(['cloudinary'], None, 4)
+    assert len(images) == 4 and cursor is None
+
+    images, cursor = catalog.page_after(['cloudinary'], None, 3)
+    assert [image['id'] for image in images] == ['c0', 'c1', 'c2']
+    assert catalog.page_after(['cloudinary'], cursor, 3) == ([_images('c', 4)[3]], None)
+
+    assert catalog.page_after(['drive'], None, 3) == ([], None)
+
+
+def test_only_requested_sources_are_paged(tmp_path):
+    catalog = ImageCatalog(str(tmp_path / 'catalog.db'))
+    catalog.replace_source('cloudinary', _images('c', 2))
+    catalog.replace_source('local', _images('l', 2))
+
+    assert _walk(catalog, ['local'], 1) == ['l0', 'l1']
+    assert catalog.count(['local']) == 2
+    assert catalog.count(['cloudinary', 'local']) == 4
+
+
+def test_version_and_count_follow_other_processes(tmp_path):
+    path = str(tmp_path / 'catalog.db')
+    reader = ImageCatalog(path)
+    writer = ImageCatalog(path)
+    before = reader.version(['cloudinary'])
+
+    assert writer.replace_source('cloudinary', _images('c', 3))
+
+    assert reader.version(['cloudinary']) != before
+    assert reader.count(['cloudinary']) == 3
+    assert not reader.replace_source('cloudinary', _images('c', 3))
+
+
+def test_empty_pages_are_rejected(tmp_path):
+    catalog = ImageCatalog(str(tmp_path / 'catalog.db'))
+    catalog.replace_source('cloudinary', _images('c', 4))
+
+    for limit in (0, -1):
+        with pytest.raises(ValueError):
+            catalog.page_after(['cloudinary'], None, limit)
+        with pytest.raises(ValueError):
+            catalog.page(['cloudinary'], 0, limit)
+    with pytest.raises(ValueError):
+        catalog.page(['cloudinary'], -2, 2)
@@ -0,0 +1,73 @@
+import os
+
+import pytest
+
+from image_derivatives import derivative_names, file_digest, generate_derivatives
+
+Image = pytest.importorskip('PIL.Image')
+
+
+def _save(path, img, **options):
+    img.save(path, **options)
+    return str(path)
+
+
+def test_renditions_are_resized_and_content_named(tmp_path):
+    source = _save(tmp_path / 'wide.jpg', Image.new('RGB', (2000, 1000), 'red'))
+    out = tmp_path / 'derived'
+    out.mkdir()
+
+    _, digest, names = generate_derivatives(source, str(out))
+
+    assert digest == file_digest(source)
+    assert names == derivative_names(digest)
+    with Image.open(out / names['thumb']['webp']) as thumb:
+        assert thumb.size == (480, 240)
+    with Image.open(out / names['display']['jpg']) as display:
+        assert display.size == (1280, 640)
+
+
+def test_small_images_are_not_upscaled(tmp_path):
+    source = _save(tmp_path / 'small.png', Image.new('RGB', (300, 200), 'blue'))
+    _, _, names = generate_derivatives(source, str(tmp_path))
+
+    with Image.open(tmp_path / names['display']['webp']) as display:
+        assert display.size == (300, 200)
+
+
+def test_webp_keeps_transparency_and_jpeg_is_flattened(tmp_path):
+    img = Image.new('RGBA', (600, 600), (0, 0, 0, 0))
+    img.paste((255, 0, 0, 255), (0, 0, 300, 600))
+    source = _save(tmp_path / 'logo.png', img)
+
+    _, _, names = generate_derivatives(source, str(tmp_path))
+
+    with Image.open(tmp_path / names['thumb']['webp']) as webp:
+        assert webp.mode == 'RGBA'
+        assert webp.getpixel((400, 200))[3] == 0
+    with Image.open(tmp_path / names['thumb']['jpg']) as jpg:
+        assert jpg.mode == 'RGB'
+        # Transparent areas become white, not black
+        assert min(jpg.getpixel((400, 200))) > 240
+
+
+def test_palette_transparency_is_kept(tmp_path):
+    img = Image.new('P', (100, 100), 0)
+    img.putpalette([0, 0, 0, 255, 0, 0] + [0] * 762)
+    source = _save(tmp_path / 'icon.png', img, transparency=0)
+
+    _, _, names = generate_derivatives(source, str(tmp_path))
+
+    with Image.open(tmp_path / names['thumb']['webp']) as webp:
+        assert webp.mode == 'RGBA'
+
+
+def test_existing_renditions_are_not_rewritten(tmp_path):
+    source = _save(tmp_path / 'photo.jpg', Image.new('RGB', (800, 600), 'green'))
+    _, _, names = generate_derivatives(source, str(tmp_path))
+    path = tmp_path / names['thumb']['jpg']
+    mtime = os.stat(path).st_mtime_ns
+
+    generate_derivatives(source, str(tmp_path))
+
+    assert os.stat(path).st_mtime_ns == mtime
@@ -0,0 +1,213 @@
+import io
+import struct
+
+import pytest
+
+from image_preprocess import (
+    InvalidImage, PNG_SIGNATURE, jpeg_orientation, jpeg_segments, preprocess_image, probe_image,
+    sniff_format, strip_gif_metadata, strip_jpeg_metadata, strip_png_metadata, strip_webp_metadata,
+)
+
+
+def _segment(marker, payload):
+    return bytes([0xFF, marker]) + struct.pack('>H', len(payload) + 2) + payload
+
+
+def _exif(orientation):
+    # Little-endian TIFF header, one IFD with a single Orientation entry
+    tiff = b'II*\x00' + struct.pack('<I', 8) + struct.pack('<H', 1)
+    tiff += struct.pack('<HHIHH', 0x0112, 3, 1, orientation, 0) + struct.pack('<I', 0)
+    return _segment(0xE1, b'Exif\x00\x00' + tiff)
+
+
+def _jpeg(width=640, height=480, orientation=None, comment=b'shot on a phone'):
+    data = b'\xff\xd8' + _segment(0xE0, b'JFIF\x00\x01\x01\x00\x00\x01\x00\x01\x00\x00')
+    if orientation:
+        data += _exif(orientation)
+    if comment:
+        data += _segment(0xFE, comment)
+    data += _segment(0xC0, b'\x08' + struct.pack('>HH', height, width) + b'\x01\x01\x11\x00')
+    return data + _segment(0xDA, b'\x01\x01\x00\x00\x3f\x00') + b'\x12\x34\x56' + b'\xff\xd9'
+
+
+def _png_chunk(chunk, payload):
+    return struct.pack('>I4s', len(payload), chunk) + payload + b'\x00\x00\x00\x00'
+
+
+def _png(width=32, height=16, text=True):
+    data = PNG_SIGNATURE + _png_chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 2, 0, 0, 0))
+    if text:
+        data += _png_chunk(b'tEXt', b'Author\x00someone') + _png_chunk(b'tIME', b'\x07\xea\x01\x01\x00\x00\x00')
+    return data + _png_chunk(b'IDAT', b'\x78\x9c') + _png_chunk(b'IEND', b'')
+
+
+def _riff_chunk(chunk, payload):
+    return chunk + struct.pack('<I', len(payload)) + payload + (b'\x00' if len(payload) & 1 else b'')
+
+
+def _webp(*chunks):
+    body = b''.join(chunks)
+    return b'RIFF' + struct.pack('<I', len(body) + 4) + b'WEBP' + body
+
+
+def _vp8x(flags, width=300, height=200):
+    return _riff_chunk(b'VP8X', bytes([flags, 0, 0, 0]) + (width - 1).to_bytes(3, 'little')
+                       + (height - 1).to_bytes(3, 'little'))
+
+
+def _vp8(width=300, height=200):
+    return _riff_chunk(b'VP8 ', b'\x00' * 3 + b'\x9d\x01\x2a' + struct.pack('<HH', width, height) + b'\x00' * 4)
+
+
+def _gif_extension(label, *sub_blocks):
+    data = bytes([0x21, label])
+    for block in sub_blocks:
+        data += bytes([len(block)]) + block
+    return data + b'\x00'
+
+
+def _gif(*extensions):
+    # 2x2 image with a 2-colour global table and one frame
+    header = b'GIF89a' + struct.pack('<HH', 2, 2) + b'\x80\x00\x00' + b'\x00\x00\x00\xff\xff\xff'
+    frame = b'\x2c' + struct.pack('<HHHH', 0, 0, 2, 2) + b'\x00' + b'\x02\x02\x44\x01\x00'
+    return header + b''.join(extensions) + frame + b'\x3b'
+
+
+NETSCAPE = _gif_extension(0xFF, b'NETSCAPE2.0', b'\x01\x00\x00')
+GRAPHIC_CONTROL = _gif_extension(0xF9, b'\x04\x0a\x00\x00')
+
+
+def test_sniff_format():
+    assert sniff_format(_jpeg()[:32]) == 'jpeg'
+    assert sniff_format(_png()[:32]) == 'png'
+    assert sniff_format(_gif()[:32]) == 'gif'
+    assert sniff_format(_webp(_vp8())[:32]) == 'webp'
+    assert sniff_format(b'<svg xmlns="http://www.w3.org/2000/svg">') is None
+
+
+@pytest.mark.parametrize('data, expected', [
+    (_jpeg(640, 480), ('jpeg', 640, 480)),
+    (_png(32, 16), ('png', 32, 16)),
+    (_gif(), ('gif', 2, 2)),
+    (_webp(_vp8(300, 200)), ('webp', 300, 200)),
+    (_webp(_vp8x(0, 4000, 3000), _vp8()), ('webp', 4000, 3000)),
+    (_webp(_riff_chunk(b'VP8L', b'\x2f' + struct.pack('<I', 99 | (49 << 14)))), ('webp', 100, 50)),
+])
+def test_probe_reads_dimensions_and_restores_position(data, expected):
+    f = io.BytesIO(b'xx' + data)
+    f.seek(2)
+
+    assert probe_image(f) == expected
+    assert f.tell() == 2
+
+
+def test_probe_rejects_non_images_and_truncated_headers():
+    assert probe_image(io.BytesIO(b'GIF89a')) is None
+    assert probe_image(io.BytesIO(b'\xff\xd8\xff\xe0\x00')) is None
+    assert probe_image(io.BytesIO(b'not an image at all')) is None
+    # Start of scan before any frame header
+    assert probe_image(io.BytesIO(b'\xff\xd8' + _segment(0xDA, b'\x00'))) is None
+
+
+def test_jpeg_segments_stop_at_the_scan():
+    data = _jpeg(comment=b'hi')
+
+    markers = [marker for marker, _, _ in jpeg_segments(data)]
+
+    assert markers == [0xE0, 0xFE, 0xC0, 0xDA]
+
+
+def test_jpeg_orientation():
+    assert jpeg_orientation(_jpeg(orientation=6)) == 6
+    assert jpeg_orientation(_jpeg()) is None
+
+
+def test_strip_jpeg_metadata_keeps_image_segments():
+    data = _jpeg(orientation=1, comment=b'secret')
+
+    stripped = strip_jpeg_metadata(data)
+
+    assert [marker for marker, _, _ in jpeg_segments(stripped)] == [0xE0, 0xC0, 0xDA]
+    assert stripped.endswith(b'\x12\x34\x56\xff\xd9')
+    assert probe_image(io.BytesIO(stripped)) == ('jpeg', 640, 480)
+
+
+def test_strip_png_metadata_drops_text_and_time():
+    stripped = strip_png_metadata(_png(text=True))
+
+    assert stripped == _png(text=False)
+    assert b'someone' not in stripped
+
+
+def test_strip_webp_metadata_drops_chunks_and_fixes_header():
+    exif = _riff_chunk(b'EXIF', b'Exif\x00\x00GPS data')
+    xmp = _riff_chunk(b'XMP ', b'<x:xmpmeta>creator</x:xmpmeta>')
+    icc = _riff_chunk(b'ICCP', b'profile')
+    data = _webp(_vp8x(0x20 | 0x08 | 0x04), icc, _vp8(), exif, xmp)
+
+    stripped = strip_webp_metadata(data)
+
+    assert stripped == _webp(_vp8x(0x20), icc, _vp8())
+    assert struct.unpack('<I', stripped[4:8])[0] == len(stripped) - 8
+    assert b'GPS' not in stripped and b'creator' not in stripped
+    assert probe_image(io.BytesIO(stripped)) == ('webp', 300, 200)
+
+
+def test_strip_webp_metadata_leaves_simple_files_alone():
+    data = _webp(_vp8())
+
+    assert strip_webp_metadata(data) == data
+
+
+def test_strip_gif_metadata_keeps_looping_and_frame_control():
+    comment = _gif_extension(0xFE, b'made by someone')
+    xmp = _gif_extension(0xFF, b'XMP DataXMP', b'<x:xmpmeta/>')
+    data = _gif(NETSCAPE, comment, xmp, GRAPHIC_CONTROL)
+
+    stripped = strip_gif_metadata(data)
+
+    assert stripped == _gif(NETSCAPE, GRAPHIC_CONTROL)
+    assert strip_gif_metadata(stripped) == stripped
+
+
+def test_strip_gif_metadata_skips_colour_tables():
+    # A colour table entry that looks like an extension introducer
+    data = _gif(_gif_extension(0xFE, b'note')).replace(b'\xff\xff\xff', b'\x21\xfe\x00', 1)
+
+    assert strip_gif_metadata(data) == _gif().replace(b'\xff\xff\xff', b'\x21\xfe\x00', 1)
+
+
+def test_stripped_gif_and_webp_still_decode():
+    Image = pytest.importorskip('PIL.Image')
+    webp = io.BytesIO()
+    Image.new('RGB', (8, 4), 'red').save(webp, format='WEBP', exif=_exif(1)[4:])
+    gif = io.BytesIO()
+    Image.new('P', (8, 4)).save(gif, format='GIF', comment=b'hello', loop=0)
+
+    for data in (strip_webp_metadata(webp.getvalue()), strip_gif_metadata(gif.getvalue())):
+        with Image.open(io.BytesIO(data)) as img:
+            img.load()
+            assert img.size == (8, 4)
+            assert 'exif' not in img.info and 'comment' not in img.info
+
+
+def test_preprocess_strips_in_place(tmp_path):
+    path = tmp_path / 'upload'
+    path.write_bytes(_gif(NETSCAPE, _gif_extension(0xFE, b'made by someone')))
+
+    result = preprocess_image(str(path), max_dimension=4096, quality=88)
+
+    assert result['action'] == 'stripped' and result['format'] == 'gif'
+    assert path.read_bytes() == _gif(NETSCAPE)
+    assert result['size'] == len(_gif(NETSCAPE))
+
+
+def test_preprocess_rejects_non_images_and_corrupt_files(tmp_path):
+    path = tmp_path / 'upload'
+    path.write_bytes(b'<html></html>')
+    with pytest.raises(InvalidImage):
+        preprocess_image(str(path), max_dimension=4096, quality=88)
+
+    path.write_bytes(_gif()[:-6])
+    with pytest.raises(InvalidImage):
+        preprocess_image(str(path), max_dimension=4096, quality=88)
@@ -0,0 +1,75 @@
+import os
+import subprocess
+import sys
+import threading
+import time
+
+import pytest
+
+import leader_election
+from leader_election import LeaderLock
+
+pytestmark = pytest.mark.skipif(leader_election.fcntl is None, reason="needs fcntl.flock")
+
+HOLD_LOCK = """
+import sys, time
+from leader_election import LeaderLock
+assert LeaderLock(sys.argv[1]).acquire()
+print('held', flush=True)
+time.sleep(60)
+"""
+
+
+def test_only_one_holder_gets_the_lock(tmp_path):
+    path = str(tmp_path / 'leader.lock')
+    first, second = LeaderLock(path), LeaderLock(path)
+
+    assert first.acquire()
+    assert first.acquire()  # re-entrant for the holder
+    assert not second.acquire() and not second.held
+    with open(path) as f:
+        assert f.read() == str(os.getpid())
+
+    first.release()
+    assert second.acquire()
+
+
+def test_lock_held_by_another_process_is_freed_when_it_dies(tmp_path):
+    path = str(tmp_path / 'leader.lock')
+    holder = subprocess.Popen(
+        [sys.executable, '-c', HOLD_LOCK, path], stdout=subprocess.PIPE, text=True,
+        cwd=os.path.dirname(os.path.abspath(leader_election.__file__))
+    )
+    try:
+        assert holder.stdout.readline().strip() == 'held'
+        assert not LeaderLock(path).acquire()
+    finally:
+        holder.kill()
+        holder.wait()
+
+    assert LeaderLock(path).acquire()
+
+
+def test_run_when_leader_runs_the_target_in_one_process_at_a_time(tmp_path):
+    path = str(tmp_path / 'leader.lock')
+    running = []
+    release = threading.Event()
+
+    def target(name):
+        running.append(name)
+        release.wait(10)
+        if len(running) > 1:
+            # Keep the lock from here on, so the loops stop taking turns
+            threading.Event().wait()
+
+    for name in ('a', 'b'):
+        LeaderLock(path).run_when_leader(lambda name=name: target(name), retry_interval=0.05)
+    time.sleep(0.3)
+    assert len(running) == 1
+
+    # Returning gives up leadership, so the other contender takes over
+    release.set()
+    deadline = time.monotonic() + 5
+    while set(running) != {'a', 'b'} and time.monotonic() < deadline:
+        time.sleep(0.02)
+    assert set(running) == {'a', 'b'}
@@ -0,0 +1,27 @@
+import json
+import logging
+import queue
+import sys
+
+from log_config import JsonFormatter, RecordQueueHandler
+
+
+def _error_record():
+    try:
+        raise ValueError("bad input")
+    except ValueError:
+        return logging.LogRecord('app', logging.ERROR, __file__, 1, 'failed %s', ('upload',), sys.exc_info())
+
+
+def test_queued_records_keep_their_traceback():
+    record = _error_record()
+
+    prepared = RecordQueueHandler(queue.SimpleQueue()).prepare(record)
+
+    assert prepared is not record
+    assert prepared.msg == 'failed %s' and prepared.args == ('upload',)
+    assert prepared.exc_info is not None and 'ValueError: bad input' in prepared.exc_text
+
+    entry = json.loads(JsonFormatter().format(prepared))
+    assert entry['msg'] == 'failed upload'
+    assert 'ValueError: bad input' in entry['exc']
@@ -0,0 +1,72 @@
+import json
+import os
+
+from menu_engine import MenuEngine
+
+
+def _content(welcome='Hello!', keyboard=True):
+    content = {
+        'parse_mode': 'Markdown',
+        'keyboards': {'main': [[{'text': 'Portfolio'}, {'text': 'Help'}]]},
+        'menu': {
+            'welcome': {'commands': ['start'], 'messages': [{'text': welcome}]},
+            'help': {'commands': ['help'], 'buttons': ['Help'], 'messages': [{'text': ['Line 1', 'Line 2']}]},
+            'unknown': {'messages': [{'text': 'Try /help'}]},
+        },
+        'fallback': 'unknown',
+    }
+    if keyboard:
+        content['menu']['welcome']['messages'][0]['keyboard'] = 'main'
+    return content
+
+
+def _write(path, content, mtime_ns=None):
+    path.write_text(json.dumps(content), encoding='utf-8')
+    if mtime_ns is not None:
+        os.utime(path, ns=(mtime_ns, mtime_ns))
+
+
+def test_commands_buttons_and_fallback(tmp_path):
+    path = tmp_path / 'bot_content.json'
+    _write(path, _content())
+    menu = MenuEngine(str(path), reload_interval=0)
+
+    (welcome,) = menu.reply_for('/start@PortfolioBot hi')
+    assert welcome['text'] == 'Hello!' and welcome['parse_mode'] == 'Markdown'
+    assert json.loads(welcome['reply_markup'])['keyboard'][0][0]['text'] == 'Portfolio'
+    assert menu.reply_for(' help ')[0]['text'] == 'Line 1\nLine 2'
+    assert menu.reply_for('/nope')[0]['text'] == 'Try /help'
+
+
+def test_edited_content_is_reloaded(tmp_path):
+    path = tmp_path / 'bot_content.json'
+    _write(path, _content('Hello!'), mtime_ns=1_000_000_000)
+    menu = MenuEngine(str(path), reload_interval=0)
+
+    _write(path, _content('Welcome back!', keyboard=False), mtime_ns=2_000_000_000)
+
+    (welcome,) = menu.reply_for('/start')
+    assert welcome['text'] == 'Welcome back!'
+    assert 'reply_markup' not in welcome
+
+
+def test_reload_waits_for_the_interval(tmp_path):
+    path = tmp_path / 'bot_content.json'
+    _write(path, _content('Hello!'), mtime_ns=1_000_000_000)
+    menu = MenuEngine(str(path), reload_interval=3600)
+
+    _write(path, _content('Welcome back!'), mtime_ns=2_000_000_000)
+
+    assert menu.reply_for('/start')[0]['text'] == 'Hello!'
+
+
+def test_broken_edit_keeps_the_previous_menu(tmp_path):
+    path = tmp_path / 'bot_content.json'
+    _write(path, _content('Hello!'), mtime_ns=1_000_000_000)
+    menu = MenuEngine(str(path), reload_interval=0)
+
+    path.write_text('{"menu": ', encoding='utf-8')
+    os.utime(path, ns=(2_000_000_000, 2_000_000_000))
+
+    assert menu.reply_for('/start')[0]['text'] == 'Hello!'
+    assert not menu.reload()
@@ -0,0 +1,52 @@
+import hashlib
+import json
+
+from migrate_to_cloudinary import MigrationJob, file_sha256
+
+
+class FakeCloudinary:
+    """Lists the given resources and records uploads"""
+
+    def __init__(self, resources):
+        self.resources = resources
+        self.uploaded = []
+
+    def iter_resources(self):
+        return iter(self.resources)
+
+    def upload_stream(self, stream, filename, title, digest=None):
+        self.uploaded.append(filename)
+        return {'id': f"portfolio/{digest[:20]}", 'url': f"https://cdn/{digest[:20]}"}
+
+
+def _resource(public_id, **fields):
+    return dict({'public_id': public_id, 'secure_url': f"https://cdn/{public_id}"}, **fields)
+
+
+def test_files_uploaded_under_their_old_name_are_adopted(tmp_path):
+    images = tmp_path / 'images'
+    images.mkdir()
+    (images / 'sunset.jpg').write_bytes(b'sunset')
+    (images / 'poster.v2.png').write_bytes(b'poster')
+    (images / 'logo.png').write_bytes(b'logo')
+    (images / 'new.jpg').write_bytes(b'new')
+    cloudinary = FakeCloudinary([
+        _resource('portfolio/sunset', etag=hashlib.md5(b'sunset').hexdigest(), bytes=99),
+        _resource('portfolio/poster', etag='0' * 32, bytes=len(b'poster')),
+        _resource('portfolio/logo', etag='0' * 32, bytes=1),
+    ])
+    manifest_path = tmp_path / 'manifest.json'
+
+    status = MigrationJob(cloudinary, str(images), str(manifest_path)).run()
+
+    assert cloudinary.uploaded == ['new.jpg']
+    assert (status['adopted'], status['uploaded'], status['total']) == (3, 1, 4)
+    manifest = json.loads(manifest_path.read_text())
+    assert manifest[file_sha256(images / 'sunset.jpg')]['matched'] == 'etag'
+    assert manifest[file_sha256(images / 'poster.v2.png')]['matched'] == 'bytes'
+    assert manifest[file_sha256(images / 'logo.png')]['public_id'] == 'portfolio/logo'
+
+    # Everything is in the manifest now; nothing is listed or uploaded again
+    cloudinary.resources = None
+    status = MigrationJob(cloudinary, str(images), str(manifest_path)).run()
+    assert (status['skipped'], status['uploaded'], status['state']) == (4, 0, 'done')
@@ -0,0 +1,101 @@
+import io
+
+from storage_backends import CloudinaryBackend, DriveBackend, LocalBackend, StorageRouter
+
+
+class Listing:
+    """Stands in for a backend's manager or index"""
+
+    def __init__(self, images):
+        self._images = images
+
+    def iter_images(self):
+        return iter(self._images)
+
+    def get_all_images(self):
+        return self._images
+
+    def images(self):
+        return self._images
+
+
+def _local(name, sha256=None):
+    image = {'src': f"/static/images/{name}", 'original': f"/static/images/{name}", 'title': 'Untitled'}
+    if sha256:
+        image['sha256'] = sha256
+    return image
+
+
+def test_images_of_one_backend_are_never_merged():
+    drive = DriveBackend(Listing([
+        {'id': 'a', 'title': 'Untitled', 'src': 'https://drive/a'},
+        {'id': 'b', 'title': 'Untitled', 'src': 'https://drive/b'},
+    ]))
+    local = LocalBackend(Listing([_local('07.png'), _local('07.jpg')]))
+
+    result = StorageRouter([drive, local]).list_images()
+
+    assert [image['id'] for image in result.listings['drive']] == ['a', 'b']
+    assert [image['original'] for image in result.listings['local']] == ['/static/images/07.png',
+                                                                         '/static/images/07.jpg']
+
+
+def test_same_content_is_listed_by_the_first_backend_only():
+    digest = 'ab' * 32
+    cloudinary = CloudinaryBackend(Listing([
+        {'id': f"portfolio/{digest[:20]}", 'title': 'Sunset', 'src': 'https://cdn/sunset.jpg'},
+        {'id': 'portfolio/sunset', 'title': 'Sunset', 'src': 'https://cdn/old-sunset.jpg'},
+    ]), chunk_size=1)
+    local = LocalBackend(Listing([_local('sunset.jpg', digest[:16]), _local('other.jpg', 'cd' * 8)]))
+    local.fallback = False
+
+    result = StorageRouter([cloudinary, local]).list_images()
+
+    assert len(result.listings['cloudinary']) == 2
+    assert [image['original'] for image in result.listings['local']] == ['/static/images/other.jpg']
+
+
+class Writer(LocalBackend):
+    """Writable backend that records uploads and can be made to fail"""
+
+    fallback = False
+
+    def __init__(self, name, result=None, error=None, available=True):
+        super().__init__(Listing([]))
+        self.name = name
+        self._result = result
+        self._error = error
+        self._available = available
+        self.received = []
+
+    @property
+    def available(self):
+        return self._available
+
+    def upload(self, stream, filename, title, digest=None):
+        data = stream.read(2)
+        if self._error:
+            raise self._error
+        self.received.append(data + stream.read())
+        return self._result
+
+
+def test_upload_falls_through_to_the_next_backend():
+    failing = Writer('cloudinary', result=None)
+    raising = Writer('drive', error=OSError("quota"))
+    unavailable = Writer('other', result={'id': 'x'}, available=False)
+    local = Writer('local', result={'id': 'photo.jpg'})
+    router = StorageRouter([failing, raising, unavailable, local])
+
+    backend, result = router.upload(io.BytesIO(b'image bytes'), 'photo.jpg', 'Photo')
+
+    assert (backend, result) == ('local', {'id': 'photo.jpg'})
+    assert failing.received == [b'image bytes']
+    assert local.received == [b'image bytes']
+    assert unavailable.received == []
+
+
+def test_upload_reports_the_last_backend_when_all_fail():
+    router = StorageRouter([Writer('cloudinary'), Writer('local')])
+
+    assert router.upload(io.BytesIO(b'x'), 'x.jpg', 'X') == ('local', None)
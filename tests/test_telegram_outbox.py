@@ -0,0 +1,111 @@
+import threading
+import time
+
+from telebot.apihelper import ApiTelegramException
+
+from telegram_outbox import OutboxSpool, PRIORITY_HIGH, TelegramOutbox
+
+
+class FakeBot:
+    """Records sends with their time; ``rate_limited`` chats get one 429 first"""
+
+    def __init__(self, rate_limited=(), retry_after=0.2):
+        self.rate_limited = set(rate_limited)
+        self.retry_after = retry_after
+        self.sent = []
+        self.lock = threading.Lock()
+
+    def send_message(self, chat_id, text, **kwargs):
+        with self.lock:
+            if chat_id in self.rate_limited:
+                self.rate_limited.discard(chat_id)
+                raise ApiTelegramException('sendMessage', None, {
+                    'error_code': 429, 'description': 'Too Many Requests',
+                    'parameters': {'retry_after': self.retry_after},
+                })
+            self.sent.append((chat_id, text, time.monotonic()))
+
+
+def _wait_for(bot, count, timeout=10):
+    deadline = time.monotonic() + timeout
+    while len(bot.sent) < count and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert len(bot.sent) == count, bot.sent
+
+
+def _outbox(bot, **kwargs):
+    outbox = TelegramOutbox(bot, **dict({'workers': 4, 'global_rate': 1000, 'chat_interval': 0}, **kwargs))
+    outbox.start()
+    return outbox
+
+
+def test_messages_to_one_chat_keep_their_order_and_spacing():
+    bot = FakeBot()
+    outbox = _outbox(bot, chat_interval=0.05)
+
+    for i in range(5):
+        outbox.send_message(1, f"m{i}")
+    _wait_for(bot, 5)
+    outbox.stop()
+
+    assert [text for _, text, _ in bot.sent] == ['m0', 'm1', 'm2', 'm3', 'm4']
+    times = [sent_at for _, _, sent_at in bot.sent]
+    assert all(later - earlier >= 0.045 for earlier, later in zip(times, times[1:]))
+
+
+def test_all_chats_share_the_global_rate():
+    bot = FakeBot()
+    outbox = _outbox(bot, global_rate=20)
+
+    for chat_id in range(6):
+        outbox.send_message(chat_id, 'hi')
+    _wait_for(bot, 6)
+    outbox.stop()
+
+    times = sorted(sent_at for _, _, sent_at in bot.sent)
+    # Six sends at 20/s need at least five 50ms gaps
+    assert times[-1] - times[0] >= 0.24
+
+
+def test_rate_limited_chat_waits_retry_after_and_others_continue():
+    bot = FakeBot(rate_limited={1}, retry_after=0.3)
+    outbox = _outbox(bot)
+
+    started = time.monotonic()
+    outbox.send_message(1, 'first')
+    outbox.send_message(1, 'second')
+    outbox.send_message(2, 'other')
+    _wait_for(bot, 3)
+    outbox.stop()
+
+    by_text = {text: sent_at - started for _, text, sent_at in bot.sent}
+    assert by_text['other'] < 0.2
+    assert by_text['first'] >= 0.3
+    assert [text for chat_id, text, _ in bot.sent if chat_id == 1] == ['first', 'second']
+
+
+def test_higher_priority_chats_are_sent_first():
+    bot = FakeBot()
+    outbox = TelegramOutbox(bot, workers=1, global_rate=1000, chat_interval=0)
+    outbox.send_message(1, 'normal')
+    outbox.send_message(2, 'urgent', priority=PRIORITY_HIGH)
+    outbox.start()
+
+    _wait_for(bot, 2)
+    outbox.stop()
+
+    assert [text for _, text, _ in bot.sent] == ['urgent', 'normal']
+
+
+def test_processes_that_do_not_send_hand_messages_over_through_the_spool(tmp_path):
+    bot = FakeBot()
+    follower = TelegramOutbox(FakeBot(), spool=OutboxSpool(str(tmp_path / 'outbox.db')))
+    follower.send_message(1, 'from another worker', parse_mode='HTML')
+    assert follower.depth() == 1
+
+    leader = _outbox(bot, spool=OutboxSpool(str(tmp_path / 'outbox.db')))
+    _wait_for(bot, 1)
+    leader.stop()
+
+    assert bot.sent[0][:2] == (1, 'from another worker')
+    assert follower.depth() == 0
@@ -0,0 +1,229 @@
+import hashlib
+import io
+import threading
+import time
+
+import upload_jobs
+from upload_jobs import DONE, FAILED, UploadJobQueue
+
+
+class Recorder:
+    """Upload handler and batch callback that record their calls"""
+
+    def __init__(self, fail=()):
+        self.fail = set(fail)
+        self.uploads = []
+        self.batches = []
+        self.done = threading.Event()
+
+    def handler(self, stream, filename, title, batch_id=None, digest=None):
+        data = stream.read()
+        self.uploads.append(filename)
+        if filename in self.fail:
+            return 'local', None
+        return 'local', {'id': filename, 'url': f"/images/{filename}", 'size': len(data)}
+
+    def on_batch_done(self, batch_id):
+        self.batches.append(batch_id)
+        self.done.set()
+
+
+def _queue(tmp_path, recorder, workers=3):
+    return UploadJobQueue(
+        str(tmp_path / 'jobs'), recorder.handler, workers=workers, on_batch_done=recorder.on_batch_done
+    )
+
+
+def _files(count, prefix='image'):
+    return [(io.BytesIO(f"{prefix}-{i}".encode()), f"{prefix}{i}.jpg", f"Image {i}") for i in range(count)]
+
+
+def _wait_for_batch(queue, batch_id, timeout=10):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        batch = queue.get_batch(batch_id)
+        if batch['status'] == DONE:
+            return batch
+        time.sleep(0.02)
+    raise AssertionError(f"batch {batch_id} did not finish")
+
+
+def test_batch_done_fires_once(tmp_path):
+    recorder = Recorder()
+    queue = _queue(tmp_path, recorder)
+    queue.start()
+
+    batch_id, jobs = queue.submit_batch(_files(5))
+
+    assert len(jobs) == 5 and {job['batch_id'] for job in jobs} == {batch_id}
+    assert recorder.done.wait(10)
+    batch = _wait_for_batch(queue, batch_id)
+    time.sleep(0.2)
+    assert recorder.batches == [batch_id]
+    assert batch['counts'][DONE] == 5
+    assert sorted(recorder.uploads) == sorted(f"image{i}.jpg" for i in range(5))
+
+
+def test_batch_with_failures_still_completes_once(tmp_path):
+    recorder = Recorder(fail={'image1.jpg'})
+    queue = _queue(tmp_path, recorder)
+    queue.start()
+
+    batch_id, _ = queue.submit_batch(_files(3))
+
+    assert recorder.done.wait(10)
+    batch = _wait_for_batch(queue, batch_id)
+    assert recorder.batches == [batch_id]
+    assert batch['counts'][FAILED] == 1 and batch['counts'][DONE] == 2
+
+
+def test_batch_is_not_started_until_every_file_is_stored(tmp_path):
+    recorder = Recorder()
+    queue = _queue(tmp_path, recorder)
+    queue.start()
+    files = _files(3)
+
+    class Slow(io.BytesIO):
+        def read(self, size=-1):
+            time.sleep(0.05)
+            return super().read(size)
+
+    files[2] = (Slow(b'last'), 'image2.jpg', 'Image 2')
+    batch_id, _ = queue.submit_batch(files)
+
+    # The first files were stored before the last was read, yet none of
+    # them could have been picked up and finished the batch on its own
+    assert recorder.done.wait(10)
+    _wait_for_batch(queue, batch_id)
+    assert recorder.batches == [batch_id]
+    assert len(recorder.uploads) == 3
+
+
+def test_batch_of_duplicates_finishes_immediately(tmp_path):
+    recorder = Recorder()
+    queue = _queue(tmp_path, recorder)
+    queue.start()
+    first_id, _ = queue.submit_batch(_files(2))
+    assert recorder.done.wait(10)
+    _wait_for_batch(queue, first_id)
+
+    second_id, jobs = queue.submit_batch(_files(2))
+
+    assert all(job['status'] == DONE and job['duplicate'] for job in jobs)
+    assert recorder.batches == [first_id, second_id]
+    assert len(recorder.uploads) == 2
+
+
+def test_failed_batch_submission_leaves_nothing_queued(tmp_path):
+    recorder = Recorder()
+    queue = _queue(tmp_path, recorder)
+
+    class Broken:
+        def read(self, size=-1):
+            raise OSError("client went away")
+
+    files = _files(2) + [(Broken(), 'broken.jpg', 'Broken')]
+    try:
+        queue.submit_batch(files)
+    except OSError:
+        pass
+    else:
+        raise AssertionError("submit_batch should re-raise")
+
+    assert queue.pending() == 0
+    assert not [name for name in (tmp_path / 'jobs').iterdir() if name.suffix in ('.upload', '.tmp')]
+
+
+def test_idle_workers_purge_expired_jobs(tmp_path, monkeypatch):
+    monkeypatch.setattr(upload_jobs, 'PURGE_INTERVAL', 0.05)
+    monkeypatch.setattr(upload_jobs, 'POLL_INTERVAL', 0.05)
+    recorder = Recorder()
+    queue = UploadJobQueue(str(tmp_path / 'jobs'), recorder.handler, workers=1, retention=0.1)
+    queue.start()
+
+    job = queue.submit(io.BytesIO(b'old'), 'old.jpg', 'Old')
+
+    deadline = time.monotonic() + 10
+    while queue.get(job['job_id']) is not None:
+        assert time.monotonic() < deadline, "finished job was never purged"
+        time.sleep(0.05)
+
+
+def _wait_for_job(queue, job_id, timeout=10):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        job = queue.get(job_id)
+        if job['status'] in (DONE, FAILED):
+            return job
+        time.sleep(0.02)
+    raise AssertionError(f"job {job_id} did not finish")
+
+
+def test_forgotten_asset_is_uploaded_again(tmp_path):
+    recorder = Recorder()
+    queue = _queue(tmp_path, recorder, workers=1)
+    queue.start()
+    first = _wait_for_job(queue, queue.submit(io.BytesIO(b'same'), 'a.jpg', 'A')['job_id'])
+    assert queue.submit(io.BytesIO(b'same'), 'a.jpg', 'A')['duplicate']
+
+    assert queue.forget_asset('local', first['data']['id']) == 1
+
+    again = _wait_for_job(queue, queue.submit(io.BytesIO(b'same'), 'a.jpg', 'A')['job_id'])
+    assert not again['duplicate']
+    assert recorder.uploads == ['a.jpg', 'a.jpg']
+
+
+def test_asset_that_no_longer_exists_is_uploaded_again(tmp_path):
+    recorder = Recorder()
+    gone = set()
+    queue = UploadJobQueue(
+        str(tmp_path / 'jobs'), recorder.handler, workers=1,
+        asset_exists=lambda backend, result: result['id'] not in gone
+    )
+    queue.start()
+    first = _wait_for_job(queue, queue.submit(io.BytesIO(b'same'), 'a.jpg', 'A')['job_id'])
+    gone.add(first['data']['id'])
+
+    again = _wait_for_job(queue, queue.submit(io.BytesIO(b'same'), 'a.jpg', 'A')['job_id'])
+
+    assert not again['duplicate']
+    assert recorder.uploads == ['a.jpg', 'a.jpg']
+
+
+def test_backends_get_the_hash_of_the_preprocessed_payload(tmp_path):
+    digests = []
+
+    def handler(stream, filename, title, batch_id=None, digest=None):
+        digests.append((digest, hashlib.sha256(stream.read()).hexdigest()))
+        return 'local', {'id': filename}
+
+    def strip(path):
+        with open(path, 'ab') as f:
+            f.write(b'-stripped')
+
+    queue = UploadJobQueue(str(tmp_path / 'jobs'), handler, workers=1, preprocess=strip)
+    queue.start()
+    job = _wait_for_job(queue, queue.submit(io.BytesIO(b'raw'), 'a.jpg', 'A')['job_id'])
+
+    assert digests == [(hashlib.sha256(b'raw-stripped').hexdigest(),) * 2]
+    assert job['stored_sha256'] == hashlib.sha256(b'raw-stripped').hexdigest()
+    # Duplicates are still recognised by the bytes the client sent
+    assert job['sha256'] == hashlib.sha256(b'raw').hexdigest()
+    assert queue.submit(io.BytesIO(b'raw'), 'a.jpg', 'A')['duplicate']
+
+
+def test_store_reports_the_error_of_a_failed_open(tmp_path, monkeypatch):
+    queue = _queue(tmp_path, Recorder())
+
+    def refuse(path, mode='r'):
+        raise PermissionError(f"cannot write {path}")
+
+    monkeypatch.setattr(upload_jobs, 'open', refuse, raising=False)
+    try:
+        queue.submit(io.BytesIO(b'data'), 'photo.jpg', 'Photo')
+    except PermissionError:
+        pass
+    else:
+        raise AssertionError("submit should re-raise the open() error")
+
+    assert queue.pending() == 0
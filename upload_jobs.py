@@ -0,0 +1,519 @@
+import contextlib
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+logger = logging.getLogger(__name__)
+
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+
+# Idle workers look for jobs queued by other processes this often (seconds)
+POLL_INTERVAL = 5.0
+# Progress is written to the database at most this often per job (seconds)
+PROGRESS_INTERVAL = 0.5
+# Finished jobs past their retention are deleted this often (seconds)
+PURGE_INTERVAL = 3600.0
+# A job whose worker died this many times is failed instead of retried
+MAX_ATTEMPTS = 3
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS upload_jobs (
+    id TEXT PRIMARY KEY,
+    state TEXT NOT NULL,
+    filename TEXT NOT NULL,
+    title TEXT,
+    size INTEGER NOT NULL,
+    sent INTEGER NOT NULL DEFAULT 0,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    owner INTEGER,
+    batch_id TEXT,
+    sha256 TEXT,
+    stored_sha256 TEXT,
+    duplicate INTEGER NOT NULL DEFAULT 0,
+    backend TEXT,
+    result TEXT,
+    error TEXT,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS upload_jobs_state ON upload_jobs (state, created_at);
+CREATE TABLE IF NOT EXISTS upload_assets (
+    sha256 TEXT PRIMARY KEY,
+    backend TEXT NOT NULL,
+    result TEXT NOT NULL,
+    created_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS upload_batches (
+    id TEXT PRIMARY KEY,
+    total INTEGER NOT NULL,
+    done INTEGER NOT NULL DEFAULT 0,
+    created_at REAL NOT NULL
+);
+"""
+# Columns added after the jobs table was first created
+ADDED_COLUMNS = {
+    'batch_id': "TEXT",
+    'sha256': "TEXT",
+    'stored_sha256': "TEXT",
+    'duplicate': "INTEGER NOT NULL DEFAULT 0",
+}
+
+
+class _ProgressReader:
+    """File wrapper that reports how many bytes have been read"""
+
+    def __init__(self, f, on_progress):
+        self._f = f
+        self._on_progress = on_progress
+        self.sent = 0
+
+    def read(self, size=-1):
+        chunk = self._f.read(size)
+        self.sent += len(chunk)
+        self._on_progress(self.sent)
+        return chunk
+
+    def seek(self, offset, whence=os.SEEK_SET):
+        # Rewound for another backend (or to measure the size): count from there
+        self.sent = self._f.seek(offset, whence)
+        return self.sent
+
+    def __getattr__(self, name):
+        return getattr(self._f, name)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self._f.close()
+
+
+class UploadJobQueue:
+    """Uploads stored payloads to a backend on a bounded worker pool.
+
+    ``submit`` copies the upload into ``directory`` and records a queued job
+    in a SQLite table there, so the request can return straight away. Worker
+    threads claim queued jobs with a conditional UPDATE, which lets several
+    processes share one directory. A worker first runs ``preprocess(path)``
+    on the stored payload, if given, which may rewrite it in place or raise
+    to fail the job, then calls ``handler(stream, filename, title, batch_id,
+    digest)`` -> ``(backend, result)``; an empty result fails the job.
+
+    Payloads are hashed (SHA-256) as they are received, and every stored
+    asset is kept by that client hash (``sha256``), so uploading the same
+    bytes again finishes at once with the existing asset. The handler's
+    ``digest`` is the hash of what is actually sent (``stored_sha256``),
+    which differs from the client hash once ``preprocess`` rewrote the file. ``asset_exists(backend, result)``, if given, vets
+    each hit, and ``forget_asset`` drops an asset that was deleted. Jobs submitted with ``submit_batch`` share a batch
+    id and are recorded in one transaction, so workers never see part of a
+    batch; ``on_batch_done(batch_id)`` is called exactly once, by whoever
+    flips the batch's ``done`` flag after its last job finishes. Jobs left
+    running by a process that died are queued again by ``start``; finished
+    jobs are kept for ``retention`` seconds and purged by an idle worker
+    every PURGE_INTERVAL.
+    """
+
+    def __init__(self, directory, handler, workers=2, retention=24 * 3600, on_batch_done=None,
+                 preprocess=None, asset_exists=None):
+        self.directory = directory
+        self.handler = handler
+        self.preprocess = preprocess
+        self.asset_exists = asset_exists
+        self.on_batch_done = on_batch_done
+        self.workers = workers
+        self.retention = retention
+        os.makedirs(directory, exist_ok=True)
+        self._local = threading.local()
+        # Released once per queued job so an idle worker picks it up at once
+        self._wakeup = threading.Semaphore(0)
+        self._purge_lock = threading.Lock()
+        self._next_purge = 0.0
+        conn = self._conn()
+        conn.executescript(SCHEMA)
+        columns = {row['name'] for row in conn.execute("PRAGMA table_info(upload_jobs)")}
+        for column, definition in ADDED_COLUMNS.items():
+            if column not in columns:
+                conn.execute(f"ALTER TABLE upload_jobs ADD COLUMN {column} {definition}")
+        conn.execute("CREATE INDEX IF NOT EXISTS upload_jobs_batch ON upload_jobs (batch_id)")
+
+    def _conn(self):
+        # sqlite3 connections can't be shared between threads
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(os.path.join(self.directory, 'jobs.db'), timeout=10)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def start(self):
+        self._recover()
+        self._purge_due()
+        for i in range(self.workers):
+            threading.Thread(target=self._worker, name=f'upload-job-{i}', daemon=True).start()
+
+    def submit(self, stream, filename, title, chunk_size=1024 * 1024):
+        """Store the payload and queue its upload; returns the job.
+        
+        Content that was stored before isn't queued: the job is done
+        straight away with the existing asset.
+        """
+        job = self._store(stream, filename, title, chunk_size)
+        conn = self._conn()
+        with conn:
+            self._insert(conn, job)
+        if job['state'] == QUEUED:
+            self._wakeup.release()
+        return self.get(job['id'])
+
+    def submit_batch(self, files, chunk_size=1024 * 1024):
+        """Queue ``(stream, filename, title)`` uploads as one batch; returns the batch id and jobs
+        
+        Every payload is stored first and all rows are inserted together,
+        so no worker starts (or finishes) the batch before it is complete.
+        """
+        batch_id = uuid.uuid4().hex
+        stored = []
+        try:
+            for stream, filename, title in files:
+                stored.append(self._store(stream, filename, title, chunk_size, batch_id=batch_id))
+            conn = self._conn()
+            with conn:
+                conn.execute(
+                    "INSERT INTO upload_batches (id, total, created_at) VALUES (?, ?, ?)",
+                    (batch_id, len(stored), time.time())
+                )
+                for job in stored:
+                    self._insert(conn, job)
+                # A batch of duplicates only is finished already
+                finished = self._complete_batch(conn, batch_id)
+        except BaseException:
+            for job in stored:
+                self._remove_payload(job['id'])
+            raise
+        for job in stored:
+            if job['state'] == QUEUED:
+                self._wakeup.release()
+        if finished:
+            self._batch_done(batch_id)
+        return batch_id, [self.get(job['id']) for job in stored]
+
+    def _store(self, stream, filename, title, chunk_size, batch_id=None):
+        """Write the payload to disk while hashing it; returns the job row to insert"""
+        job_id = uuid.uuid4().hex
+        path = self._payload_path(job_id)
+        size = 0
+        sha = hashlib.sha256()
+        # Write under a temp name so a crash never leaves a truncated payload behind a job
+        try:
+            with open(f"{path}.tmp", 'wb') as f:
+                for chunk in iter(lambda: stream.read(chunk_size), b''):
+                    f.write(chunk)
+                    sha.update(chunk)
+                    size += len(chunk)
+        except BaseException:
+            # open() itself may have failed; the original error is the one to report
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(f"{path}.tmp")
+            raise
+        job = {
+            'id': job_id, 'state': QUEUED, 'filename': filename, 'title': title, 'size': size,
+            'sent': 0, 'batch_id': batch_id, 'sha256': sha.hexdigest(), 'stored_sha256': sha.hexdigest(),
+            'duplicate': 0,
+            'backend': None, 'result': None,
+        }
+        asset = self._asset(job['sha256'])
+        if asset is not None:
+            os.remove(f"{path}.tmp")
+            logger.info("Upload %s is a duplicate of an asset in %s", filename, asset['backend'])
+            job.update(state=DONE, sent=size, duplicate=1, backend=asset['backend'], result=asset['result'])
+        else:
+            os.replace(f"{path}.tmp", path)
+        return job
+
+    def _insert(self, conn, job):
+        now = time.time()
+        conn.execute(
+            "INSERT INTO upload_jobs (id, state, filename, title, size, sent, batch_id, sha256, stored_sha256,"
+            " duplicate, backend, result, created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (job['id'], job['state'], job['filename'], job['title'], job['size'], job['sent'], job['batch_id'],
+             job['sha256'], job['stored_sha256'], job['duplicate'], job['backend'], job['result'], now, now)
+        )
+
+    def get(self, job_id):
+        """Job status and progress, or None for an unknown (or purged) job"""
+        row = self._conn().execute("SELECT * FROM upload_jobs WHERE id = ?", (job_id,)).fetchone()
+        if row is None:
+            return None
+        return self._job(row)
+
+    def get_batch(self, batch_id):
+        """Per-file status of a batch with overall counts, or None if unknown"""
+        rows = self._conn().execute(
+            "SELECT * FROM upload_jobs WHERE batch_id = ? ORDER BY created_at", (batch_id,)
+        ).fetchall()
+        if not rows:
+            return None
+        jobs = [self._job(row) for row in rows]
+        counts = {state: sum(job['status'] == state for job in jobs) for state in (QUEUED, RUNNING, DONE, FAILED)}
+        return {
+            'batch_id': batch_id,
+            'status': RUNNING if counts[QUEUED] or counts[RUNNING] else DONE,
+            'total': len(jobs),
+            'counts': counts,
+            'progress': round(sum(job['bytes_sent'] for job in jobs) / (sum(job['size'] for job in jobs) or 1), 3),
+            'jobs': jobs,
+        }
+
+    def _job(self, row):
+        job = {
+            'job_id': row['id'],
+            'status': row['state'],
+            'filename': row['filename'],
+            'title': row['title'],
+            'batch_id': row['batch_id'],
+            'sha256': row['sha256'],
+            'stored_sha256': row['stored_sha256'],
+            'size': row['size'],
+            'bytes_sent': row['sent'],
+            'progress': round(row['sent'] / row['size'], 3) if row['size'] else 0.0,
+            'created_at': row['created_at'],
+            'updated_at': row['updated_at'],
+        }
+        if row['state'] == DONE:
+            job['progress'] = 1.0
+            job['backend'] = row['backend']
+            job['duplicate'] = bool(row['duplicate'])
+            job['data'] = json.loads(row['result'])
+        elif row['state'] == FAILED:
+            job['error'] = row['error']
+        return job
+
+    def pending(self):
+        """Jobs queued or uploading, in any process"""
+        return self._conn().execute(
+            "SELECT COUNT(*) FROM upload_jobs WHERE state IN (?, ?)", (QUEUED, RUNNING)
+        ).fetchone()[0]
+
+    def forget_asset(self, backend, asset_id):
+        """Drop stored assets with this id, e.g. after the image was deleted"""
+        conn = self._conn()
+        rows = conn.execute("SELECT sha256, result FROM upload_assets WHERE backend = ?", (backend,)).fetchall()
+        stale = [(row['sha256'],) for row in rows if json.loads(row['result']).get('id') == asset_id]
+        if stale:
+            with conn:
+                conn.executemany("DELETE FROM upload_assets WHERE sha256 = ?", stale)
+            logger.info("Forgot %d stored upload(s) of %s %s", len(stale), backend, asset_id)
+        return len(stale)
+
+    def _asset(self, digest):
+        """Backend and stored result of earlier content with this hash, or None"""
+        conn = self._conn()
+        row = conn.execute("SELECT backend, result FROM upload_assets WHERE sha256 = ?", (digest,)).fetchone()
+        if row is None or self.asset_exists is None:
+            return row
+        try:
+            exists = self.asset_exists(row['backend'], json.loads(row['result']))
+        except Exception as e:
+            # Can't tell: upload again rather than hand out a dead URL
+            logger.warning("Checking stored upload %s failed: %s", digest, e)
+            return None
+        if not exists:
+            logger.info("Stored upload %s is gone from %s", digest, row['backend'])
+            with conn:
+                conn.execute("DELETE FROM upload_assets WHERE sha256 = ? AND result = ?", (digest, row['result']))
+            return None
+        return row
+
+    def _payload_path(self, job_id):
+        return os.path.join(self.directory, f"{job_id}.upload")
+
+    def _recover(self):
+        """Queue again jobs whose process exited mid-upload"""
+        conn = self._conn()
+        rows = conn.execute(
+            "SELECT id, owner, attempts FROM upload_jobs WHERE state = ?", (RUNNING,)
+        ).fetchall()
+        for row in rows:
+            if _process_alive(row['owner']) and row['owner'] != os.getpid():
+                continue
+            if row['attempts'] >= MAX_ATTEMPTS:
+                self._finish(row['id'], FAILED, error='Upload interrupted too many times')
+                continue
+            with conn:
+                conn.execute(
+                    "UPDATE upload_jobs SET state = ?, owner = NULL, sent = 0, updated_at = ?"
+                    " WHERE id = ? AND state = ? AND owner IS ?",
+                    (QUEUED, time.time(), row['id'], RUNNING, row['owner'])
+                )
+            logger.info("Re-queued interrupted upload job %s", row['id'])
+
+    def _purge_due(self):
+        """Purge if PURGE_INTERVAL has passed; one thread does it while the others move on"""
+        if time.monotonic() < self._next_purge or not self._purge_lock.acquire(blocking=False):
+            return
+        try:
+            self._next_purge = time.monotonic() + PURGE_INTERVAL
+            self._purge()
+        except Exception:
+            logger.exception("Purging finished upload jobs failed")
+        finally:
+            self._purge_lock.release()
+
+    def _purge(self):
+        conn = self._conn()
+        cutoff = time.time() - self.retention
+        with conn:
+            conn.execute(
+                "DELETE FROM upload_jobs WHERE state IN (?, ?) AND updated_at < ?", (DONE, FAILED, cutoff)
+            )
+            conn.execute("DELETE FROM upload_batches WHERE done = 1 AND created_at < ?", (cutoff,))
+        # Payloads of requests that died while they were being stored
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            if name.endswith('.upload.tmp') and os.path.getmtime(path) < cutoff:
+                os.remove(path)
+
+    def _claim(self):
+        """Atomically take the oldest queued job, or None"""
+        conn = self._conn()
+        while True:
+            row = conn.execute(
+                "SELECT id FROM upload_jobs WHERE state = ? ORDER BY created_at LIMIT 1", (QUEUED,)
+            ).fetchone()
+            if row is None:
+                return None
+            with conn:
+                claimed = conn.execute(
+                    "UPDATE upload_jobs SET state = ?, owner = ?, attempts = attempts + 1, updated_at = ?"
+                    " WHERE id = ? AND state = ?",
+                    (RUNNING, os.getpid(), time.time(), row['id'], QUEUED)
+                ).rowcount
+            if claimed:
+                return conn.execute("SELECT * FROM upload_jobs WHERE id = ?", (row['id'],)).fetchone()
+            # Another worker got there first; try the next one
+
+    def _worker(self):
+        while True:
+            job = self._claim()
+            if job is None:
+                self._purge_due()
+                self._wakeup.acquire(timeout=POLL_INTERVAL)
+                continue
+            self._run(job)
+
+    def _run(self, job):
+        job_id = job['id']
+        logger.info("Upload job %s started: %s", job_id, job['filename'], extra={'title': job['title']})
+        last_write = 0.0
+        asset = self._asset(job['sha256']) if job['sha256'] else None
+        if asset is not None:
+            # The same content was stored while this job waited
+            logger.info("Upload job %s is a duplicate of an asset in %s", job_id, asset['backend'])
+            self._finish(job_id, DONE, backend=asset['backend'], result=json.loads(asset['result']), duplicate=True)
+            return
+
+        def on_progress(sent):
+            nonlocal last_write
+            now = time.monotonic()
+            if now - last_write >= PROGRESS_INTERVAL:
+                last_write = now
+                conn = self._conn()
+                with conn:
+                    conn.execute("UPDATE upload_jobs SET sent = ?, updated_at = ? WHERE id = ?",
+                                 (sent, time.time(), job_id))
+
+        try:
+            # Backends name and check assets by the bytes they receive
+            digest = self._preprocess(job_id) if self.preprocess else job['stored_sha256']
+            with _ProgressReader(open(self._payload_path(job_id), 'rb'), on_progress) as stream:
+                backend, result = self.handler(
+                    stream, job['filename'], job['title'], batch_id=job['batch_id'], digest=digest
+                )
+        except Exception as e:
+            logger.exception("Upload job %s failed", job_id)
+            self._finish(job_id, FAILED, error=str(e))
+            return
+        if not result:
+            logger.error("Upload job %s failed in %s", job_id, backend)
+            self._finish(job_id, FAILED, backend=backend, error=f'{backend} upload failed')
+        else:
+            logger.info("Upload job %s stored in %s", job_id, backend)
+            self._finish(job_id, DONE, backend=backend, result=result)
+
+    def _preprocess(self, job_id):
+        """Preprocess the payload in place; returns the SHA-256 of the result"""
+        path = self._payload_path(job_id)
+        self.preprocess(path)
+        sha = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                sha.update(chunk)
+        # Progress is measured against what is actually sent
+        conn = self._conn()
+        with conn:
+            conn.execute("UPDATE upload_jobs SET size = ?, stored_sha256 = ?, updated_at = ? WHERE id = ?",
+                         (os.path.getsize(path), sha.hexdigest(), time.time(), job_id))
+        return sha.hexdigest()
+
+    def _finish(self, job_id, state, backend=None, result=None, error=None, duplicate=False):
+        result = json.dumps(result) if result is not None else None
+        now = time.time()
+        conn = self._conn()
+        with conn:
+            conn.execute(
+                "UPDATE upload_jobs SET state = ?, sent = CASE WHEN ? = ? THEN size ELSE sent END,"
+                " backend = ?, result = ?, error = ?, duplicate = ?, updated_at = ? WHERE id = ?",
+                (state, state, DONE, backend, result, error, int(duplicate), now, job_id)
+            )
+            if state == DONE and not duplicate:
+                conn.execute(
+                    "INSERT OR REPLACE INTO upload_assets (sha256, backend, result, created_at)"
+                    " SELECT sha256, ?, ?, ? FROM upload_jobs WHERE id = ? AND sha256 IS NOT NULL",
+                    (backend, result, now, job_id)
+                )
+            batch_id = conn.execute("SELECT batch_id FROM upload_jobs WHERE id = ?", (job_id,)).fetchone()[0]
+            finished = batch_id is not None and self._complete_batch(conn, batch_id)
+        self._remove_payload(job_id)
+        if finished:
+            self._batch_done(batch_id)
+
+    def _complete_batch(self, conn, batch_id):
+        """Set the batch's done flag if none of its jobs are left; True only for the caller that set it"""
+        return conn.execute(
+            "UPDATE upload_batches SET done = 1 WHERE id = ? AND done = 0 AND NOT EXISTS"
+            " (SELECT 1 FROM upload_jobs WHERE batch_id = ? AND state IN (?, ?))",
+            (batch_id, batch_id, QUEUED, RUNNING)
+        ).rowcount == 1
+
+    def _batch_done(self, batch_id):
+        logger.info("Upload batch %s finished", batch_id)
+        if self.on_batch_done:
+            self.on_batch_done(batch_id)
+
+    def _remove_payload(self, job_id):
+        try:
+            os.remove(self._payload_path(job_id))
+        except FileNotFoundError:
+            pass
+
+
+def _process_alive(pid):
+    if pid is None:
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
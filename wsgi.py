@@ -0,0 +1,4 @@
+"""WSGI entry point, e.g. ``gunicorn -c gunicorn.conf.py wsgi:app``"""
+from main import create_app
+
+app = create_app()